@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# Exports every map below dcl.game/maps to GLB in a process pool.
+# Each map is compiled with q3map2 if needed (pluggable, can be skipped) and then
+# runs through bsp2glb.export_bsp. One failing map does not stop the others;
+# a summary table with timings and sizes is printed at the end.
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+import bsp2glb
+import chunking
+import compressglb
+import obj2glb
+import simplify
+import texcache
+
+DEFAULT_MAPS_DIR = os.path.join(os.path.dirname(script_dir), "dcl.game", "maps")
+
+# files written by the pipeline itself, never treated as inputs
+DERIVED_SUFFIXES = ("_scaled.obj", "_ac.map")
+
+
+# -------- q3map2 step --------
+class Q3Map2Compiler:
+    # same stages as the "Export to GLB" build menu entries; the -light stage is
+    # commented out there and only runs with light=True (--light)
+    def __init__(self, executable, basepath=None, game=None, lightmapsize=1024, subdivisions=4, convert=True,
+                 light=False):
+        self.executable = executable
+        self.convert = convert  # OBJ conversion is not needed with --from-bsp
+        self.light = light
+        self.basepath = basepath
+        self.game = game
+        self.lightmapsize = lightmapsize
+        self.subdivisions = subdivisions
+
+    def _base_args(self):
+        args = [self.executable, "-v", "-game", "quake3"]
+        if self.basepath:
+            args += ["-fs_basepath", self.basepath]
+        if self.game:
+            args += ["-fs_game", self.game]
+        return args
+
+    def __call__(self, map_file, log):
+        bsp_file = map_file[:-4] + ".bsp"
+        stages = [["-meta", "-patchmeta", "-keeplights", "-subdivisions", str(self.subdivisions), map_file]]
+        if self.light:
+            stages.append(["-light", "-fast", "-patchshadows", "-dirty", "-external",
+                           "-lightmapsize", str(self.lightmapsize), map_file])
+        if self.convert:
+            stages.append(["-convert", "-format", "obj", bsp_file])
+        for stage in stages:
+            result = subprocess.run(self._base_args() + stage, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, errors="replace")
+            log.write(result.stdout)
+            if result.returncode != 0:
+                raise RuntimeError(f"q3map2 {stage[0]} failed with exit code {result.returncode}")
+
+
+def _is_stale(target, source):
+    return not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source)
+
+
+# -------- input discovery --------
+# returns {stem: set of extensions} for every .map/.bsp/.obj below root
+def find_inputs(root, only=None):
+    stems = {}
+    for dirpath, _, files in os.walk(root):
+        for fn in files:
+            base, ext = os.path.splitext(fn)
+            ext = ext.lower()
+            if ext not in (".map", ".bsp", ".obj") or fn.lower().endswith(DERIVED_SUFFIXES):
+                continue
+            stem = os.path.join(dirpath, base)
+            if only and not any(o.lower() in stem.lower() for o in only):
+                continue
+            stems.setdefault(stem, set()).add(ext)
+    return dict(sorted(stems.items()))
+
+
+# -------- worker --------
+def _export_one(task):
+    stem, exts, compiler, compile_mode, options = task
+    map_file, obj_file = stem + ".map", stem + ".obj"
+    # the file export_bsp reads, and which q3map2 has to bring up to date
+    source_file = stem + ".bsp" if options["from_bsp"] else obj_file
+    result = {"name": stem, "status": "ok", "compile": 0.0, "export": 0.0,
+              "obj": 0, "glb": 0, "log": "", "hits": 0, "misses": 0}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            t0 = time.perf_counter()
+            if ".map" in exts and compile_mode != "never":
+                if compile_mode == "always" or _is_stale(source_file, map_file):
+                    if compiler is None:
+                        if not os.path.exists(source_file):
+                            raise RuntimeError(f"no {source_file[-3:].upper()} and no q3map2 configured (--q3map2)")
+                        print(f"- {source_file[-3:].upper()} is older than the .map, no q3map2 configured, using it anyway")
+                    else:
+                        compiler(map_file, log)
+            elif not os.path.exists(source_file):
+                raise RuntimeError(f"no {source_file[-3:].upper()} to export")
+            t1 = time.perf_counter()
+
+            cache = None
+            if options["cache_dir"]:
+                cache = texcache.TextureCache(options["cache_dir"], options["cache_size_mb"])
+            output = bsp2glb.export_bsp(stem + ".bsp", options["scale"], options["rotation"],
+                               options["maxsize"], options["quality"],
+                               write_uncompressed=options["write_uncompressed"],
+                               cache=cache, incremental=not options["full"],
+                               gltf_options=options["gltf"], geometry_options=options["geometry"],
+                               from_bsp=options["from_bsp"], lightmaps=options["lightmaps"],
+                               chunk_size=options["chunk_size"], clip_chunks=options["clip_chunks"],
+                               lods=options["lods"], instance_models=options["instance_models"],
+                               texture_atlas=options["atlas"])
+            t2 = time.perf_counter()
+            if cache is not None:
+                result["hits"], result["misses"] = cache.hits, cache.misses
+        result["compile"], result["export"] = t1 - t0, t2 - t1
+        result["obj"] = os.path.getsize(source_file)
+        result["glb"] = _output_size(output)
+    except Exception:
+        result["status"] = "FAILED"
+        log.write(traceback.format_exc())
+    result["log"] = log.getvalue()
+    return result
+
+
+# size of the GLB, or of all chunks listed in a chunk index
+def _output_size(path):
+    if not path.endswith(".json"):
+        return os.path.getsize(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(c["bytes"] for c in json.load(f)["chunks"])
+
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.2f} MB" if n else "-"
+
+
+def print_summary(results, root):
+    rows = [("Map", "Status", "q3map2", "Export", "Input", "GLB")]
+    for r in results:
+        rows.append((os.path.relpath(r["name"], root), r["status"], f"{r['compile']:.2f}s",
+                     f"{r['export']:.2f}s", _mb(r["obj"]), _mb(r["glb"])))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for n, row in enumerate(rows):
+        print("  ".join(cell.ljust(w) for cell, w in zip(row, widths)))
+        if n == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exports all maps below dcl.game/maps to GLB in parallel.")
+    ap.add_argument("root", type=str, nargs="?", default=DEFAULT_MAPS_DIR,
+                    help="Maps directory (default: dcl.game/maps)")
+    ap.add_argument("--only", type=str, nargs="*", help="Only maps whose path contains one of these names")
+    ap.add_argument("--jobs", type=int, default=0, help="Worker processes, 0 = one per CPU core (default: 0)")
+    ap.add_argument("--compile", choices=("auto", "always", "never"), default="auto",
+                    help="Run q3map2: when the OBJ is missing/older than the .map, always, or never (default: auto)")
+    ap.add_argument("--q3map2", type=str, default=None, help="Path to the q3map2 executable")
+    ap.add_argument("--fs-basepath", type=str, default=None, help="q3map2 -fs_basepath")
+    ap.add_argument("--fs-game", type=str, default=None, help="q3map2 -fs_game")
+    ap.add_argument("--light", action="store_true",
+                    help="Also run the q3map2 -light stage (off in the build menu, needed by --lightmaps)")
+    ap.add_argument("--scale", type=float, default=bsp2glb.DEFAULT_SCALE)
+    ap.add_argument("--rotation", type=float, default=bsp2glb.DEFAULT_ROTATION)
+    ap.add_argument("--maxsize", type=int, default=compressglb.DEFAULT_MAXSIZE)
+    ap.add_argument("--quality", type=int, default=compressglb.DEFAULT_JPEGQUALITY)
+    ap.add_argument("--write-uncompressed", action="store_true")
+    ap.add_argument("--full", action="store_true", help="Ignore the build manifests and rerun every stage")
+    ap.add_argument("--from-bsp", action="store_true", help="Export from the .bsp directly, skip q3map2 -convert")
+    ap.add_argument("--lightmaps", action="store_true",
+                    help="With --from-bsp (and --light when q3map2 compiles): bake the lightmaps in "
+                         "(TEXCOORD_1 + lightmap atlas)")
+    ap.add_argument("--chunks", action="store_true", help="One GLB per parcel cell into <map>_chunks/ (see bsp2glb.py)")
+    ap.add_argument("--chunk-size", type=float, default=chunking.PARCEL_SIZE)
+    ap.add_argument("--clip-chunks", action="store_true")
+    ap.add_argument("--lods", type=float, nargs="*", default=None, metavar="RATIO",
+                    help="Also write simplified <map>_lodN.glb files (see bsp2glb.py)")
+    ap.add_argument("--instance-models", action="store_true",
+                    help="Repeated misc_model glTFs once with EXT_mesh_gpu_instancing (see bsp2glb.py)")
+    ap.add_argument("--atlas", action="store_true",
+                    help="Merge non-tiling materials into texture atlas pages (see bsp2glb.py)")
+    ap.add_argument("--verbose", action="store_true", help="Print the log of every map, not only of failed ones")
+    texcache.add_cache_arguments(ap)
+    obj2glb.add_geometry_arguments(ap)
+    obj2glb.add_gltf_arguments(ap)
+    args = ap.parse_args()
+    bsp2glb.check_export_arguments(ap, args)
+    # without the lighting stage, the freshly compiled BSPs have no lightmaps
+    if args.lightmaps and args.q3map2 and args.compile != "never" and not args.light:
+        ap.error("--lightmaps needs --light when q3map2 compiles the maps")
+
+    inputs = find_inputs(args.root, args.only)
+    if not inputs:
+        print(f"- No .map/.bsp/.obj files found below {args.root}")
+        return 1
+
+    compiler = None
+    if args.q3map2:
+        compiler = Q3Map2Compiler(args.q3map2, args.fs_basepath, args.fs_game, convert=not args.from_bsp,
+                                  light=args.light)
+    options = {
+        "scale": args.scale, "rotation": args.rotation, "maxsize": args.maxsize, "quality": args.quality,
+        "write_uncompressed": args.write_uncompressed, "full": args.full, "from_bsp": args.from_bsp,
+        "lightmaps": args.lightmaps,
+        "chunk_size": args.chunk_size if args.chunks else None, "clip_chunks": args.clip_chunks,
+        "lods": (args.lods or list(simplify.DEFAULT_LODS)) if args.lods is not None else None,
+        "instance_models": args.instance_models, "atlas": args.atlas,
+        "gltf": obj2glb.gltf_options_from_args(args),
+        "geometry": obj2glb.geometry_options_from_args(args),
+        "cache_dir": None if args.no_cache else args.cache_dir, "cache_size_mb": args.cache_size_mb,
+    }
+    tasks = [(stem, exts, compiler, args.compile, options) for stem, exts in inputs.items()]
+    jobs = min(compressglb.resolve_jobs(args.jobs), len(tasks))
+    print(f"- Exporting {len(tasks)} maps with {jobs} workers")
+
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_export_one, task): task[0] for task in tasks}
+        for future in as_completed(futures):
+            try:
+                r = future.result()
+            except Exception as e:  # worker process died
+                r = {"name": futures[future], "status": "FAILED", "compile": 0.0, "export": 0.0,
+                     "obj": 0, "glb": 0, "log": f"{e}\n", "hits": 0, "misses": 0}
+            results.append(r)
+            print(f"- [{len(results)}/{len(tasks)}] {os.path.relpath(r['name'], args.root)}: {r['status']}")
+            if args.verbose or r["status"] != "ok":
+                print(r["log"].rstrip())
+
+    results.sort(key=lambda r: r["name"])
+    print()
+    print_summary(results, args.root)
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"\n- {len(results) - failed} exported, {failed} failed in {time.perf_counter() - t0:.1f}s")
+
+    if options["cache_dir"]:
+        cache = texcache.TextureCache(args.cache_dir, args.cache_size_mb)
+        cache.hits = sum(r["hits"] for r in results)
+        cache.misses = sum(r["misses"] for r in results)
+        cache.report()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
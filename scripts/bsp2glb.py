@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# Runs the whole GLB export for a compiled map in one interpreter:
+# MTL fixing, scale/rotate, unify, normals, GLB assembly and texture compression.
+# With --from-bsp the geometry is read from the .bsp directly instead of the OBJ,
+# --lightmaps then adds the lightmap uvs (TEXCOORD_1) and a lightmap atlas.
+# With --chunks the map is written as one GLB per 16 m parcel cell into
+# <map>_chunks/, listed with their bounds in <map>_chunks/index.json.
+# --lods writes simplified copies next to the GLB as <map>_lod1.glb, _lod2.glb ...
+# --instance-models reads the misc_model entities of the .map and writes every
+# repeated glTF model once, placed with EXT_mesh_gpu_instancing, instead of the
+# copies q3map2 baked into the map.
+# --atlas packs small non-tiling textures of the same material class into
+# atlas pages and merges their materials, to cut the draw calls.
+# Intermediate files are only written with --keep-intermediates.
+# Stage inputs are hashed into <map>.manifest.json; unchanged geometry is reused
+# from <map>.geometry.npz and an unchanged GLB is not rebuilt at all.
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+import bspreader
+import chunking
+import lightmapatlas
+import fixmtl
+import mapentities
+import scale
+import obj2glb
+import compressglb
+import texcache
+import buildmanifest
+import meshoptcodec
+import simplify
+import textureatlas
+
+DEFAULT_SCALE = 0.015625
+DEFAULT_ROTATION = 180.0
+
+
+def _texture_paths(mtl_props, obj_dir):
+    paths = set()
+    for p in mtl_props.values():
+        for key in ("map_Kd", "map_Ke"):
+            if p.get(key):
+                paths.add(os.path.join(obj_dir, p[key]))
+    return sorted(paths)
+
+
+# -------- chunked output --------
+def _chunks_intact(index_file):
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return False
+    chunk_dir = os.path.dirname(index_file)
+    return all(buildmanifest.file_digest(os.path.join(chunk_dir, c["file"])) == c["sha256"]
+               for c in index.get("chunks", []))
+
+
+# one compressed GLB per parcel cell; every distinct image is encoded once for all chunks
+def export_chunks(P, T, N, groups, mtl_props, obj_dir, chunk_dir, chunk_size, clip, maxsize, quality,
+                  jobs=1, cache=None, lightmap=None, gltf_options=None):
+    os.makedirs(chunk_dir, exist_ok=True)
+    shared = texcache.MemoryCache(cache)
+    entries = []
+    for (ix, iz), cP, cT, cN, cgroups in chunking.chunk_geometry(P, T, N, groups, chunk_size, clip):
+        name = f"chunk_{ix}_{iz}.glb"
+        path = os.path.join(chunk_dir, name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            gltf = obj2glb.build_gltf(cP, cT, cgroups, {m: mtl_props[m] for m in cgroups if m in mtl_props},
+                                      obj_dir, cN, lightmap=lightmap, **(gltf_options or {}))
+            compressglb.compress_gltf(gltf, maxsize, quality, jobs, cache=shared)
+        meshoptcodec.save_glb(gltf, path)
+        tris = sum(len(g) for g in cgroups.values()) // 3
+        size = os.path.getsize(path)
+        entries.append({"file": name, "cell": [ix, iz], "min": cP.min(axis=0).tolist(), "max": cP.max(axis=0).tolist(),
+                        "triangles": tris, "bytes": size, "sha256": buildmanifest.file_digest(path)})
+        print(f"- {name}: {tris} triangles, {len(cgroups)} materials, {size / 1024:.1f} KB")
+
+    # chunks of cells that are empty now
+    keep = {c["file"] for c in entries}
+    for fn in os.listdir(chunk_dir):
+        if fn.startswith("chunk_") and fn.endswith(".glb") and fn not in keep:
+            os.remove(os.path.join(chunk_dir, fn))
+
+    index = {"chunk_size": chunk_size, "clipped": clip, "chunks": entries}
+    if entries:
+        index["min"] = np.min([c["min"] for c in entries], axis=0).tolist()
+        index["max"] = np.max([c["max"] for c in entries], axis=0).tolist()
+    index_file = os.path.join(chunk_dir, "index.json")
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    print(f"- {len(entries)} chunks, texture encodes shared: {shared.hits} reused, {shared.misses} encoded")
+    return index_file
+
+
+def export_bsp(mappath, scale_factor=DEFAULT_SCALE, rotation=DEFAULT_ROTATION,
+               maxsize=compressglb.DEFAULT_MAXSIZE, quality=compressglb.DEFAULT_JPEGQUALITY,
+               keep_intermediates=False, write_uncompressed=False, jobs=1, cache=None,
+               incremental=True, gltf_options=None, geometry_options=None, from_bsp=False, lightmaps=False,
+               chunk_size=None, clip_chunks=False, lods=None, instance_models=False, texture_atlas=False):
+    if not mappath.endswith(".bsp"):
+        raise ValueError("ERROR: filename must end with '.bsp'")
+    if lightmaps and not from_bsp:
+        raise ValueError("ERROR: lightmaps need --from-bsp, the q3map2 OBJ has no lightmap uvs")
+    if lods and chunk_size:
+        raise ValueError("ERROR: LODs are not written for chunked exports")
+    if instance_models and chunk_size:
+        raise ValueError("ERROR: instanced models are not written for chunked exports")
+    lods = list(lods or [])
+    lod_files = [mappath.replace(".bsp", f"_lod{level}.glb") for level in range(1, len(lods) + 1)]
+
+    obj_file = mappath.replace(".bsp", ".obj")
+    mtl_file = mappath.replace(".bsp", ".mtl")
+    output_file = mappath.replace(".bsp", ".glb")
+    uncompressed_file = mappath.replace(".bsp", "_uncompressed.glb")
+    manifest_file = mappath.replace(".bsp", ".manifest.json")
+    geometry_file = mappath.replace(".bsp", ".geometry.npz")
+    chunk_dir = mappath.replace(".bsp", "_chunks")
+    target_file = os.path.join(chunk_dir, "index.json") if chunk_size else output_file
+    obj_dir = os.path.dirname(os.path.abspath(obj_file))
+
+    old = buildmanifest.load_manifest(manifest_file) if incremental else {}
+    manifest = {}
+
+    # --- Fixing MTL Texture paths ---
+    preloaded = {}
+    if not from_bsp:
+        print("- Fixing MTL Texture paths")
+        if os.path.exists(mtl_file):
+            preloaded[mtl_file] = fixmtl.fix_mtl(mtl_file, write=keep_intermediates, verbose=False)
+
+    # --- Lightmaps: pages packed into one atlas ---
+    atlas = None
+    if lightmaps:
+        print("- Packing lightmaps")
+        with bspreader.BSPFile(mappath) as bsp:
+            atlas = lightmapatlas.LightmapAtlas(bsp, mappath)
+        print(f"- Lightmap atlas: {atlas.num_pages} pages, {atlas.image.shape[1]}x{atlas.image.shape[0]}")
+
+    # --- misc_model placements ---
+    instances = None
+    map_file = mappath.replace(".bsp", ".map")
+    if instance_models:
+        if os.path.exists(map_file):
+            instances = mapentities.MapInstances(map_file, bspreader.game_dir_for_map(mappath))
+        else:
+            print(f"- No {os.path.basename(map_file)} next to the BSP, models stay baked")
+
+    # --- Geometry: OBJ, scale/rotate, unify, normals ---
+    geometry_options = dict(geometry_options or {})
+    geo_inputs = {
+        ("bsp" if from_bsp else "obj"): buildmanifest.file_digest(mappath if from_bsp else obj_file),
+        "params": buildmanifest.digest_values(scale_factor, rotation, geometry_options),
+        "code": obj2glb.GEOMETRY_VERSION,
+    }
+    if atlas is not None:
+        geo_inputs["lightmaps"] = atlas.digest
+    if instances is not None:
+        geo_inputs["instances"] = instances.digest
+    geo_old = old.get("geometry", {})
+    geometry = None
+    if geo_old.get("inputs") == geo_inputs:
+        geometry = buildmanifest.load_geometry(geometry_file, geo_old.get("groups", []))
+    if geometry is not None:
+        print("- Geometry unchanged, reusing " + os.path.basename(geometry_file))
+        P, T, N, groups = geometry
+        mtllibs = geo_old["mtllibs"]
+        instanced = geo_old.get("instances", {})
+    else:
+        if geo_old:
+            print("- Geometry inputs changed: " + ", ".join(buildmanifest.changed_inputs(geo_old.get("inputs", {}), geo_inputs)))
+        if from_bsp:
+            print("- Reading BSP")
+            with bspreader.BSPFile(mappath) as bsp:
+                V, VT, VN, faces, face_mtls, LM = bsp.obj_arrays()
+                if atlas is not None:
+                    VT = np.hstack([VT, atlas.remap(LM, bsp.vertex_surfaces())])
+            del LM
+            mtllibs = []
+        else:
+            V, VT, VN, faces, face_mtls, mtllibs = obj2glb.load_obj_with_uvs(obj_file)
+        print("- Scaling to DCL Dimensions")
+        V, VN = scale.transform_vertices(V, VN, scale_factor, rotation)
+        instanced = {}
+        if instances is not None:
+            keep, instanced = instances.strip(V, faces, face_mtls, scale_factor, rotation)
+            faces, face_mtls = faces[keep], list(itertools.compress(face_mtls, keep))
+        P, T, N, groups = obj2glb.obj_to_geometry(V, VT, VN, faces, face_mtls, **geometry_options)
+        del V, VT, VN, faces, face_mtls
+        if incremental:
+            buildmanifest.save_geometry(geometry_file, P, T, N, groups)
+    manifest["geometry"] = {"inputs": geo_inputs, "mtllibs": mtllibs, "groups": list(groups.keys())}
+    if instanced:
+        manifest["geometry"]["instances"] = instanced
+
+    if keep_intermediates and not from_bsp:
+        scale.scale_and_rotate_obj(obj_file, mappath.replace(".bsp", "_scaled.obj"), scale_factor, rotation)
+
+    # --- Materials: MTL, textures, material tables ---
+    if from_bsp:
+        # one material per BSP shader, like the MTL q3map2 writes
+        with bspreader.BSPFile(mappath) as bsp:
+            shader_names = bsp.shader_names()
+        mtl_props = bspreader.shader_materials(shader_names, bspreader.game_dir_for_map(mappath))
+        mtl_digest = buildmanifest.digest_values(mtl_props)
+    else:
+        mtl_props = obj2glb.load_mtl_props(mtllibs, obj_dir, preloaded)
+        mtl_digest = buildmanifest.digest_values(preloaded.get(mtl_file))
+    mat_inputs = {
+        "mtl": mtl_digest,
+        "textures": buildmanifest.digest_values(
+            [(path, buildmanifest.file_digest(path)) for path in _texture_paths(mtl_props, obj_dir)]),
+        "tables": buildmanifest.digest_values(
+            [buildmanifest.file_digest(m.__file__) for m in
+             (obj2glb.materials_alpha, obj2glb.materials_emission, obj2glb.materials_surface)]),
+    }
+    if atlas is not None:
+        mat_inputs["lightmaps"] = atlas.digest
+    gltf_options = dict(gltf_options or {})
+    out_inputs = {
+        "gltf": buildmanifest.digest_values(gltf_options),
+        "compress": buildmanifest.digest_values(maxsize, quality, texcache.ENCODER_VERSION),
+    }
+    if chunk_size:
+        out_inputs["chunks"] = buildmanifest.digest_values(chunk_size, clip_chunks)
+    if lods:
+        out_inputs["lods"] = buildmanifest.digest_values(lods)
+    if texture_atlas:
+        out_inputs["atlas"] = buildmanifest.digest_values(textureatlas.PADDING, textureatlas.UV_EPSILON)
+    manifest["materials"] = {"inputs": mat_inputs}
+
+    out_old = old.get("output", {})
+    up_to_date = (
+        geometry is not None
+        and old.get("materials", {}).get("inputs") == mat_inputs
+        and out_old.get("inputs") == out_inputs
+        and out_old.get("digest") == buildmanifest.file_digest(target_file)
+        and (not chunk_size or _chunks_intact(target_file))
+        and all(buildmanifest.file_digest(f) == out_old.get("lods", {}).get(os.path.basename(f)) for f in lod_files)
+        and (not write_uncompressed or os.path.exists(uncompressed_file))
+        and not keep_intermediates
+    )
+    if up_to_date:
+        print(f"- {os.path.basename(chunk_dir if chunk_size else output_file)} is up to date")
+        return target_file
+    if old.get("materials") and old["materials"].get("inputs") != mat_inputs:
+        print("- Material inputs changed: " + ", ".join(buildmanifest.changed_inputs(old["materials"]["inputs"], mat_inputs)))
+
+    if texture_atlas:
+        # --- Texture atlas: pages no larger than maxsize, so compression keeps them ---
+        print("- Packing texture atlas")
+        P, T, N, groups, mtl_props, gltf_options["images_in_memory"] = textureatlas.atlas_materials(
+            P, T, N, groups, mtl_props, obj_dir, page_size=maxsize)
+
+    lightmap = None if atlas is None else atlas.png_bytes()
+    models = []
+    if instanced:
+        models = instances.meshes(instanced, scale_factor, rotation)
+        if atlas is not None:
+            # no lightmap for the models: the white cell
+            models = [(name, iP, np.hstack([iT, atlas.unlit_uvs(len(iT))]), *rest)
+                      for name, iP, iT, *rest in models]
+    if chunk_size:
+        # --- Chunks: one GLB per parcel cell ---
+        print(f"- Splitting into {chunk_size:g} m chunks" + (" (clipped at the grid lines)" if clip_chunks else ""))
+        export_chunks(P, T, N, groups, mtl_props, obj_dir, chunk_dir, chunk_size, clip_chunks,
+                      maxsize, quality, jobs, cache, lightmap, gltf_options)
+        print(f"- Exported to {target_file}")
+    else:
+        # --- Building glTF ---
+        print("- Converting OBJ to GLB")
+        gltf = obj2glb.build_gltf(P, T, groups, mtl_props, obj_dir, N, lightmap=lightmap, instances=models,
+                                  **gltf_options)
+        if keep_intermediates or write_uncompressed:
+            meshoptcodec.save_glb(gltf, uncompressed_file)
+
+        # --- Compressing GLB ---
+        print("- Compressing GLB")
+        shared = texcache.MemoryCache(cache) if lods else cache
+        compressglb.compress_gltf(gltf, maxsize, quality, jobs, cache=shared)
+        meshoptcodec.save_glb(gltf, output_file)
+        print(f"- Exported to {output_file}")
+
+        # --- LODs: simplified copies, textures encoded once ---
+        for level, (ratio, lod_file) in enumerate(zip(lods, lod_files), 1):
+            lP, lT, lN, lgroups = simplify.simplify_geometry(P, T, N, groups, ratio)
+            lmodels = [(name, *simplify.simplify_geometry(iP, iT, iN, igroups, ratio), *placement)
+                       for name, iP, iT, iN, igroups, *placement in models]
+            with contextlib.redirect_stdout(io.StringIO()):
+                lod = obj2glb.build_gltf(lP, lT, lgroups, mtl_props, obj_dir, lN, lightmap=lightmap,
+                                         instances=lmodels, **gltf_options)
+                compressglb.compress_gltf(lod, maxsize, quality, jobs, cache=shared)
+            meshoptcodec.save_glb(lod, lod_file)
+            tris = (sum(len(g) for g in lgroups.values())
+                    + sum(len(g) * len(m[5]) for m in lmodels for g in m[4].values())) // 3
+            print(f"- LOD {level} ({ratio:g}): {tris} triangles, exported to {lod_file}")
+
+    # LOD files of an earlier build with more levels
+    for name in out_old.get("lods", {}):
+        path = os.path.join(os.path.dirname(output_file), name)
+        if path not in lod_files and os.path.exists(path):
+            os.remove(path)
+
+    if incremental:
+        manifest["output"] = {"inputs": out_inputs, "digest": buildmanifest.file_digest(target_file)}
+        if lods:
+            manifest["output"]["lods"] = {os.path.basename(f): buildmanifest.file_digest(f) for f in lod_files}
+        buildmanifest.save_manifest(manifest_file, manifest)
+    return target_file
+
+
+# option combinations export_bsp rejects, checked up front (also by batchexport.py)
+def check_export_arguments(ap, args):
+    if args.lightmaps and not args.from_bsp:
+        ap.error("--lightmaps needs --from-bsp")
+    if args.lods is not None and args.chunks:
+        ap.error("--lods can't be combined with --chunks")
+    if args.instance_models and args.chunks:
+        ap.error("--instance-models can't be combined with --chunks")
+    if args.lods is not None and not all(0.0 < r < 1.0 for r in args.lods):
+        ap.error("LOD ratios must be between 0 and 1")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exports a compiled map (BSP + q3map2 OBJ/MTL) to a compressed GLB in one pass.")
+    ap.add_argument("mappath", type=str, help="Path to the .bsp file")
+    ap.add_argument("--scale", type=float, default=DEFAULT_SCALE, help=f"Scale factor (default: {DEFAULT_SCALE})")
+    ap.add_argument("--rotation", type=float, default=DEFAULT_ROTATION, help=f"Rotation around Y in degrees (default: {DEFAULT_ROTATION})")
+    ap.add_argument("--smooth-angle", type=float, default=30.0, help="Smoothing angle in degrees (fallback)")
+    ap.add_argument("--maxsize", type=int, default=compressglb.DEFAULT_MAXSIZE,
+                    help=f"Maximum texture edge size in Pixels (default: {compressglb.DEFAULT_MAXSIZE})")
+    ap.add_argument("--quality", type=int, default=compressglb.DEFAULT_JPEGQUALITY,
+                    help=f"JPEG-Quality 1-100 (default: {compressglb.DEFAULT_JPEGQUALITY})")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Parallel texture encoder processes, 0 = one per CPU core (default: 1)")
+    texcache.add_cache_arguments(ap)
+    obj2glb.add_geometry_arguments(ap)
+    obj2glb.add_gltf_arguments(ap)
+    ap.add_argument("--keep-intermediates", action="store_true",
+                    help="Also write the fixed MTL, _scaled.obj and _uncompressed.glb")
+    ap.add_argument("--write-uncompressed", action="store_true",
+                    help="Also write _uncompressed.glb (needed by the 'Compress GLB' builds)")
+    ap.add_argument("--full", action="store_true",
+                    help="Ignore the build manifest and rerun every stage")
+    ap.add_argument("--from-bsp", action="store_true",
+                    help="Read geometry and shaders from the .bsp itself (no q3map2 -convert OBJ/MTL needed)")
+    ap.add_argument("--lightmaps", action="store_true",
+                    help="With --from-bsp: lightmap uvs as TEXCOORD_1 and the lightmaps as one atlas (occlusionTexture)")
+    ap.add_argument("--chunks", action="store_true",
+                    help="Write one GLB per parcel cell into <map>_chunks/ plus index.json (no single GLB)")
+    ap.add_argument("--chunk-size", type=float, default=chunking.PARCEL_SIZE,
+                    help=f"Chunk grid size in meters after scaling (default: {chunking.PARCEL_SIZE:g}, one parcel)")
+    ap.add_argument("--clip-chunks", action="store_true",
+                    help="Cut triangles at the chunk grid lines instead of assigning them whole by centroid")
+    ap.add_argument("--lods", type=float, nargs="*", default=None, metavar="RATIO",
+                    help="Also write simplified LOD GLBs (<map>_lod1.glb ...) with these triangle ratios "
+                         f"(default: {' '.join(f'{r:g}' for r in simplify.DEFAULT_LODS)})")
+    ap.add_argument("--instance-models", action="store_true",
+                    help="Write repeated misc_model glTFs once with EXT_mesh_gpu_instancing instead of baked copies")
+    ap.add_argument("--atlas", action="store_true",
+                    help="Pack non-tiling textures of the same material class into atlas pages and merge their materials")
+    args = ap.parse_args()
+    check_export_arguments(ap, args)
+
+    cache = texcache.cache_from_args(args)
+    export_bsp(args.mappath, args.scale, args.rotation, args.maxsize, args.quality,
+               args.keep_intermediates, args.write_uncompressed, args.jobs,
+               cache, not args.full, obj2glb.gltf_options_from_args(args),
+               obj2glb.geometry_options_from_args(args), args.from_bsp, args.lightmaps,
+               args.chunk_size if args.chunks else None, args.clip_chunks,
+               (args.lods or list(simplify.DEFAULT_LODS)) if args.lods is not None else None,
+               args.instance_models, args.atlas)
+    if cache is not None:
+        cache.report()
+
+
+if __name__ == "__main__":
+    main()
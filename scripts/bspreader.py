@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# Reads compiled Quake 3 maps (IBSP version 46) directly.
+# The .bsp is memory-mapped and the shaders, drawVerts, drawIndexes, surfaces
+# and models lumps are exposed as zero-copy numpy structured arrays. obj_arrays()
+# returns the same arrays as obj2glb.load_obj_with_uvs would for the OBJ that
+# "q3map2 -convert -format obj" writes, so the OBJ/MTL text round trip (and
+# fixmtl) can be skipped.
+import argparse
+import mmap
+import os
+import re
+
+import numpy as np
+
+BSP_IDENT = b"IBSP"
+BSP_VERSION = 46
+
+LUMP_ENTITIES = 0
+LUMP_SHADERS = 1
+LUMP_MODELS = 7
+LUMP_DRAWVERTS = 10
+LUMP_DRAWINDEXES = 11
+LUMP_SURFACES = 13
+LUMP_LIGHTMAPS = 14
+NUM_LUMPS = 17
+
+MST_PLANAR = 1
+MST_PATCH = 2
+MST_TRIANGLE_SOUP = 3
+MST_FLARE = 4
+
+LIGHTMAP_SIZE = 128  # internal lightmap pages
+
+SHADER_DTYPE = np.dtype([("name", "S64"), ("surface_flags", "<i4"), ("content_flags", "<i4")])
+MODEL_DTYPE = np.dtype([("mins", "<f4", 3), ("maxs", "<f4", 3), ("first_surface", "<i4"),
+                        ("num_surfaces", "<i4"), ("first_brush", "<i4"), ("num_brushes", "<i4")])
+DRAWVERT_DTYPE = np.dtype([("xyz", "<f4", 3), ("st", "<f4", 2), ("lightmap", "<f4", 2),
+                           ("normal", "<f4", 3), ("color", "u1", 4)])
+SURFACE_DTYPE = np.dtype([("shader", "<i4"), ("fog", "<i4"), ("type", "<i4"),
+                          ("first_vert", "<i4"), ("num_verts", "<i4"),
+                          ("first_index", "<i4"), ("num_indexes", "<i4"),
+                          ("lightmap", "<i4"), ("lightmap_xy", "<i4", 2), ("lightmap_size", "<i4", 2),
+                          ("lightmap_origin", "<f4", 3), ("lightmap_vecs", "<f4", (3, 3)),
+                          ("patch_size", "<i4", 2)])
+
+# q3map2 loads shader images with these extensions, in this order
+IMAGE_EXTENSIONS = (".tga", ".png", ".jpg", ".jpeg", ".dds", ".ktx")
+
+
+class BSPFile:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{path}: not a Quake 3 BSP")
+        ident, version = self._map[:4], int.from_bytes(self._map[4:8], "little")
+        if ident != BSP_IDENT or version != BSP_VERSION:
+            self.close()
+            raise ValueError(f"{path}: not an IBSP v{BSP_VERSION} file ({ident!r} v{version})")
+        self.lumps = np.frombuffer(self._map, dtype="<i4", count=2 * NUM_LUMPS, offset=8).reshape(-1, 2).copy()
+
+        self.shaders = self._lump(LUMP_SHADERS, SHADER_DTYPE)
+        self.models = self._lump(LUMP_MODELS, MODEL_DTYPE)
+        self.draw_verts = self._lump(LUMP_DRAWVERTS, DRAWVERT_DTYPE)
+        self.draw_indexes = self._lump(LUMP_DRAWINDEXES, np.dtype("<i4"))
+        self.surfaces = self._lump(LUMP_SURFACES, SURFACE_DTYPE)
+        self.lightmaps = self._lump(LUMP_LIGHTMAPS, np.dtype(("u1", (LIGHTMAP_SIZE, LIGHTMAP_SIZE, 3))))
+
+    def _lump(self, num, dtype):
+        offset, length = (int(v) for v in self.lumps[num])
+        if length % dtype.itemsize or offset + length > len(self._map):
+            raise ValueError(f"{self.path}: lump {num} is corrupt")
+        return np.frombuffer(self._map, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def close(self):
+        # the lump arrays reference the mapping and have to go first
+        self.shaders = self.models = self.draw_verts = self.draw_indexes = self.surfaces = self.lightmaps = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def shader_names(self):
+        return [n.split(b"\0", 1)[0].decode("latin-1") for n in self.shaders["name"].tolist()]
+
+    def entities(self):
+        offset, length = (int(v) for v in self.lumps[LUMP_ENTITIES])
+        text = self._map[offset:offset + length].split(b"\0", 1)[0].decode("latin-1")
+        return [dict(re.findall(r'"([^"]*)"\s+"([^"]*)"', block)) for block in re.findall(r"\{([^{}]*)\}", text)]
+
+    # (model number, origin) for worldspawn and every brush entity, like q3map2 -convert
+    def model_instances(self):
+        out = []
+        for i, ent in enumerate(self.entities()):
+            if i == 0:
+                num = 0
+            else:
+                model = ent.get("model", "")
+                if not model.startswith("*"):
+                    continue
+                num = int(model[1:])
+            if num >= len(self.models):
+                continue
+            try:
+                origin = [float(v) for v in ent.get("origin", "0 0 0").split()[:3]]
+            except ValueError:
+                origin = [0.0, 0.0, 0.0]
+            out.append((num, np.array((origin + [0.0] * 3)[:3], dtype=np.float32)))
+        if not out and len(self.models):
+            out.append((0, np.zeros(3, dtype=np.float32)))
+        return out
+
+    # surface indices per shader name, planar and triangle soup surfaces only
+    # (patches are triangulated by q3map2 -patchmeta, flares have no geometry)
+    def surface_groups(self):
+        names = self.shader_names()
+        groups = {}
+        for num, _ in self.model_instances():
+            m = self.models[num]
+            for s in range(int(m["first_surface"]), int(m["first_surface"] + m["num_surfaces"])):
+                if self.surfaces[s]["type"] in (MST_PLANAR, MST_TRIANGLE_SOUP):
+                    groups.setdefault(names[self.surfaces[s]["shader"]], []).append(s)
+        return groups
+
+    # surfaces written by obj_arrays, in order, and the origin of their entity
+    def exported_surfaces(self):
+        surf_ids, offsets = [], []
+        for num, origin in self.model_instances():
+            m = self.models[num]
+            ids = np.arange(int(m["first_surface"]), int(m["first_surface"] + m["num_surfaces"]))
+            ids = ids[np.isin(self.surfaces["type"][ids], (MST_PLANAR, MST_TRIANGLE_SOUP))]
+            surf_ids.append(ids)
+            offsets.append(np.repeat(origin[None, :], len(ids), axis=0))
+        surf_ids = np.concatenate(surf_ids) if surf_ids else np.zeros(0, dtype=np.int64)
+        origins = np.concatenate(offsets) if offsets else np.zeros((0, 3), dtype=np.float32)
+        return surf_ids, origins
+
+    # surface index of every vertex obj_arrays returns
+    def vertex_surfaces(self):
+        surf_ids, _ = self.exported_surfaces()
+        return np.repeat(surf_ids, self.surfaces["num_verts"][surf_ids].astype(np.int64))
+
+    # returns V, VT, VN, faces, face_mtls, lightmap uvs in q3map2's OBJ conventions:
+    # (x, z, -y) axes, triangles written as (a, c, b)
+    def obj_arrays(self):
+        names = self.shader_names()
+        surf_ids, origins = self.exported_surfaces()
+        surfs = self.surfaces[surf_ids]
+
+        # vertices of all exported surfaces, in surface order
+        nv = surfs["num_verts"].astype(np.int64)
+        vert_base = np.cumsum(nv) - nv
+        vsel = _ranges(surfs["first_vert"].astype(np.int64), nv)
+        dv = self.draw_verts[vsel]
+        xyz = dv["xyz"] + np.repeat(origins, nv, axis=0)
+        V = np.stack([xyz[:, 0], xyz[:, 2], -xyz[:, 1]], axis=1).astype(np.float32)
+        VN = np.stack([dv["normal"][:, 0], dv["normal"][:, 2], -dv["normal"][:, 1]], axis=1).astype(np.float32)
+        # q3map2 writes 1 - t and load_obj_with_uvs flips it back, so st is used as is
+        VT = dv["st"].astype(np.float32)
+        LM = dv["lightmap"].astype(np.float32)
+
+        # drawIndexes are relative to the surface's first vertex
+        ni = surfs["num_indexes"].astype(np.int64)
+        isel = _ranges(surfs["first_index"].astype(np.int64), ni)
+        idx = self.draw_indexes[isel].astype(np.int64) + np.repeat(vert_base, ni)
+        tris = idx.reshape(-1, 3)[:, [0, 2, 1]]
+        faces = np.repeat(tris[:, :, None], 3, axis=2).astype(np.int32)
+
+        tri_surf = np.repeat(np.arange(len(surfs)), ni // 3)
+        surf_names = [names[s] for s in surfs["shader"].tolist()]
+        face_mtls = [surf_names[s] for s in tri_surf.tolist()]
+        return V, VT, VN, faces, face_mtls, LM
+
+
+def _ranges(starts, counts):
+    # concatenated aranges [start, start + count)
+    total = int(counts.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    base = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return base + np.arange(total)
+
+
+# -------- shader images --------
+# the game directory holding textures/ and scripts/, as fixmtl derives it
+def game_dir_for_map(mappath):
+    return os.path.abspath(mappath).replace("\\", "/").split("/maps/")[0]
+
+
+def shader_blocks(text):
+    text = re.sub(r"//[^\n]*", "", text)
+    tokens = re.findall(r'"[^"]*"|\{|\}|[^\s{}"]+', text)
+    i = 0
+    while i < len(tokens):
+        name = tokens[i]
+        if i + 1 < len(tokens) and tokens[i + 1] == "{":
+            depth, j, body = 1, i + 2, []
+            while j < len(tokens) and depth:
+                if tokens[j] == "{":
+                    depth += 1
+                elif tokens[j] == "}":
+                    depth -= 1
+                body.append((depth, tokens[j]))
+                j += 1
+            yield name.strip('"').lower(), body
+            i = j
+        else:
+            i += 1
+
+
+# external lightmap pages of q3map2 -external: maps/<map>/lm_0000.tga
+LIGHTMAP_PAGE_RE = re.compile(r"(^|/)maps/[^/]+/lm_\d+(\.\w+)?$", re.IGNORECASE)
+
+_IMAGE_KEYS = {"qer_editorimage": "editor", "implicitmap": "implicit", "implicitmask": "implicit",
+               "implicitblend": "implicit", "q3map_lightimage": "light"}
+
+
+# shader name -> image candidates in q3map2's order: editor image, the shader
+# name itself, implicitMap/Mask/Blend, q3map_lightImage; last the first stage
+# image, which is all the surface shaders q3map2 writes for lightmaps carry
+def load_shader_images(game_dir):
+    images = {}
+    scripts = os.path.join(game_dir, "scripts")
+    if not os.path.isdir(scripts):
+        return images
+    for fn in sorted(os.listdir(scripts)):
+        if not fn.lower().endswith(".shader"):
+            continue
+        with open(os.path.join(scripts, fn), "r", encoding="latin-1") as f:
+            text = f.read()
+        for name, body in shader_blocks(text):
+            if name in images:
+                continue  # first definition wins
+            toks = [t.strip('"') for depth, t in body if depth == 1]
+            props = {}
+            for k, t in enumerate(toks[:-1]):
+                key = _IMAGE_KEYS.get(t.lower())
+                if key:
+                    props.setdefault(key, toks[k + 1])
+            implicit = props.get("implicit")
+            if implicit == "-":
+                implicit = name
+            stage = None
+            stoks = [t.strip('"') for depth, t in body if depth == 2]
+            for k, t in enumerate(stoks[:-1]):
+                if t.lower() in ("map", "clampmap") and not stoks[k + 1].startswith("$") \
+                        and not LIGHTMAP_PAGE_RE.search(stoks[k + 1]):
+                    stage = stoks[k + 1]
+                    break
+            images[name] = [c for c in (props.get("editor"), name, implicit, props.get("light"), stage) if c]
+    return images
+
+
+def find_image(game_dir, name):
+    base = os.path.splitext(name)[0] if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS else name
+    for ext in IMAGE_EXTENSIONS:
+        path = os.path.join(game_dir, base + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# mtl_props like obj2glb.load_mtl_props gives for the fixed q3map2 MTL
+def shader_materials(shader_names, game_dir, shader_images=None):
+    if shader_images is None:
+        shader_images = load_shader_images(game_dir)
+    props = {}
+    for name in shader_names:
+        path = None
+        for candidate in shader_images.get(name.lower(), [name]):
+            path = find_image(game_dir, candidate)
+            if path:
+                break
+        props[name] = {"map_Kd": path.replace("\\", "/") if path else "", "Kd": None, "map_Ke": "", "Ke": None}
+    return props
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prints the lumps and shader groups of a Quake 3 BSP.")
+    ap.add_argument("mappath", type=str)
+    args = ap.parse_args()
+
+    with BSPFile(args.mappath) as bsp:
+        print(f"- {len(bsp.shaders)} shaders, {len(bsp.surfaces)} surfaces, {len(bsp.models)} models, "
+              f"{len(bsp.draw_verts)} drawVerts, {len(bsp.draw_indexes)} drawIndexes")
+        mtl_props = shader_materials(bsp.shader_names(), game_dir_for_map(args.mappath))
+        for name, surfs in bsp.surface_groups().items():
+            tris = int(bsp.surfaces["num_indexes"][surfs].sum()) // 3
+            print(f"- {name}: {len(surfs)} surfaces, {tris} triangles, {mtl_props[name]['map_Kd'] or 'no image'}")
+
+
+if __name__ == "__main__":
+    main()
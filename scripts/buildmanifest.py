@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Build manifest for incremental exports.
+# <map>.manifest.json records the content hashes of every stage input, and
+# <map>.geometry.npz holds the unified/normal-weighted vertex arrays so
+# unchanged stages can be skipped on the next export.
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+# stable hash over JSON-serializable values
+def digest_values(*values):
+    text = json.dumps(values, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(path, manifest):
+    manifest = dict(manifest, version=MANIFEST_VERSION)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# lists input names whose hashes differ between two input records
+def changed_inputs(old, new):
+    return sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+
+# -------- geometry stage cache --------
+# groups are stored as one index array plus offsets, the material names
+# (may be None) go into the manifest since npz cannot hold None without pickle
+def save_geometry(path, P, T, N, groups):
+    lengths = np.array([len(g) for g in groups.values()], dtype=np.int64)
+    indices = np.concatenate(list(groups.values())) if groups else np.zeros(0, dtype=np.uint32)
+    arrays = {"P": P, "indices": indices.astype(np.uint32, copy=False), "lengths": lengths}
+    if T is not None:
+        arrays["T"] = T
+    if N is not None:
+        arrays["N"] = N
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return list(groups.keys())
+
+
+def load_geometry(path, group_names):
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            P = data["P"]
+            T = data["T"] if "T" in data else None
+            N = data["N"] if "N" in data else None
+            indices = data["indices"]
+            lengths = data["lengths"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(lengths) != len(group_names) or int(lengths.sum()) != len(indices):
+        return None
+    parts = np.split(indices, np.cumsum(lengths)[:-1]) if len(lengths) else []
+    return P, T, N, dict(zip(group_names, parts))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Splits the unified, scaled geometry into chunks on the Decentraland parcel
+# grid (16 m cells in X/Z), so scenes can stream the parcels around the player
+# first. Triangles go to the cell of their centroid; with clipping, triangles
+# crossing a grid line are cut along it first, so every chunk stays inside its
+# cell. Both steps work on whole triangle arrays at once.
+import numpy as np
+
+PARCEL_SIZE = 16.0
+CLIP_EPSILON = 1e-6
+
+
+# -------- flat triangle list --------
+# attribute rows (P | T | N), triangles and their group number
+def _flatten(P, T, N, groups):
+    cols = [P.astype(np.float64)]
+    if T is not None:
+        cols.append(T.astype(np.float64))
+    if N is not None:
+        cols.append(N.astype(np.float64))
+    A = np.hstack(cols)
+    names = list(groups.keys())
+    tris = [np.asarray(groups[m], dtype=np.int64).reshape(-1, 3) for m in names]
+    gid = np.repeat(np.arange(len(names)), [len(t) for t in tris])
+    tris = np.concatenate(tris) if tris else np.zeros((0, 3), dtype=np.int64)
+    return A, tris, gid, names
+
+
+def _unflatten(A, T, N):
+    P = A[:, :3].astype(np.float32)
+    k = 3
+    T_out = N_out = None
+    if T is not None:
+        T_out = A[:, k:k + T.shape[1]].astype(np.float32)
+        k += T.shape[1]
+    if N is not None:
+        N_out = A[:, k:k + 3]
+        N_out = (N_out / np.maximum(np.linalg.norm(N_out, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+    return P, T_out, N_out
+
+
+# -------- clipping --------
+# cuts every triangle crossing the plane A[:, axis] == c, keeping the winding;
+# new vertices are made once per split edge, so neighbours stay welded
+def _split(A, tris, gid, axis, c, eps=CLIP_EPSILON):
+    d = A[tris, axis] - c
+    s = np.where(d > eps, 1, np.where(d < -eps, -1, 0))
+    cross = (s.max(axis=1) > 0) & (s.min(axis=1) < 0)
+    if not cross.any():
+        return A, tris, gid
+    t, sc, dc, g = tris[cross], s[cross], d[cross], gid[cross]
+
+    # rotate the lone vertex to the front: the one on the line, or the one
+    # on its own side
+    on_line = (sc == 0).any(axis=1)
+    lone = np.where(on_line, np.argmin(np.abs(sc), axis=1),
+                    np.argmax(sc != np.sign(sc.sum(axis=1))[:, None], axis=1))
+    rot = (lone[:, None] + np.arange(3)) % 3
+    t = np.take_along_axis(t, rot, axis=1)
+    dc = np.take_along_axis(dc, rot, axis=1)
+    a, b, e = t[:, 0], t[:, 1], t[:, 2]
+
+    # split edges: b-e for a on the line, a-b and a-e otherwise
+    z, nz = on_line, ~on_line
+    edges = np.concatenate([np.stack([b[z], e[z]], axis=1),
+                            np.stack([a[nz], b[nz]], axis=1),
+                            np.stack([a[nz], e[nz]], axis=1)])
+    edges.sort(axis=1)
+    uniq, inverse = np.unique(edges, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    da, db = A[uniq[:, 0], axis] - c, A[uniq[:, 1], axis] - c
+    w = (da / (da - db))[:, None]
+    new = len(A) + inverse
+    A = np.vstack([A, A[uniq[:, 0]] + (A[uniq[:, 1]] - A[uniq[:, 0]]) * w])
+
+    nzc = int(z.sum())
+    nnz = int(nz.sum())
+    p = new[:nzc]
+    p1, p2 = new[nzc:nzc + nnz], new[nzc + nnz:]
+    an, bn, en = a[nz], b[nz], e[nz]
+    pieces = [
+        np.stack([a[z], b[z], p], axis=1), np.stack([a[z], p, e[z]], axis=1),
+        np.stack([an, p1, p2], axis=1), np.stack([p1, bn, en], axis=1), np.stack([p1, en, p2], axis=1),
+    ]
+    piece_gid = [g[z], g[z], g[nz], g[nz], g[nz]]
+    tris = np.concatenate([tris[~cross]] + pieces)
+    gid = np.concatenate([gid[~cross]] + piece_gid)
+    return A, tris, gid
+
+
+def clip_to_grid(A, tris, gid, size=PARCEL_SIZE):
+    for axis in (0, 2):
+        if not len(tris):
+            break
+        lo, hi = A[tris, axis].min(), A[tris, axis].max()
+        for k in range(int(np.floor(lo / size)) + 1, int(np.ceil(hi / size))):
+            A, tris, gid = _split(A, tris, gid, axis, k * size)
+    return A, tris, gid
+
+
+# -------- binning --------
+# returns [((ix, iz), P, T, N, groups)] ordered by cell; T may have any number
+# of columns, vertices are compacted per chunk
+def chunk_geometry(P, T, N, groups, size=PARCEL_SIZE, clip=False):
+    A, tris, gid, names = _flatten(P, T, N, groups)
+    if clip:
+        A, tris, gid = clip_to_grid(A, tris, gid, size)
+
+    centroid = A[tris][:, :, [0, 2]].mean(axis=1)
+    cell = np.floor(centroid / size).astype(np.int64)
+    order = np.lexsort((gid, cell[:, 1], cell[:, 0]))  # stable: keeps the triangle order in a group
+    tris, gid, cell = tris[order], gid[order], cell[order]
+    starts = np.flatnonzero(np.r_[True, (cell[1:] != cell[:-1]).any(axis=1)]) if len(cell) else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(cell)]
+
+    chunks = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        used, local = np.unique(tris[s:e], return_inverse=True)
+        local = local.reshape(-1, 3).astype(np.uint32)
+        g = gid[s:e]
+        bounds = np.flatnonzero(np.r_[True, g[1:] != g[:-1], True])
+        chunk_groups = {names[g[b0]]: local[b0:b1].ravel() for b0, b1 in zip(bounds[:-1], bounds[1:])}
+        cP, cT, cN = _unflatten(A[used], T, N)
+        chunks.append((tuple(cell[s].tolist()), cP, cT, cN, chunk_groups))
+    return chunks
@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import argparse
+import copy
+import heapq
 import io
 import os
 import mimetypes
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from pygltflib import GLTF2, BufferView, Buffer
 from PIL import Image
 
+import texcache
+from meshoptcodec import EXTENSION as MESHOPT_EXTENSION, save_glb
+
 DEFAULT_MAXSIZE = 1024
 DEFAULT_JPEGQUALITY = 90
+# alpha values this close to 0/255 count as fully transparent/opaque
+ALPHA_EPSILON = 2
 
 # set a clean image name
 def clean_image_name(name: str, mime: str) -> str:
@@ -49,75 +59,517 @@ def get_image_bytes(gltf, img_idx):
     return None, None
 
 
-# scales to maxsize px and converts to PNG (if Alpha) or JPEG (no Alpha, with Quality)
+# scales to maxsize px (same image if it already fits)
+def fit_image(img, maxsize: int):
+    w, h = img.size
+    if max(w, h) > maxsize:
+        scale = maxsize / max(w, h)
+        new_size = (int(w * scale), int(h * scale))
+        return img.resize(new_size, Image.LANCZOS), new_size
+    return img, img.size
+
+
+# glTF alphaMode the image needs: OPAQUE if the alpha channel is missing or
+# opaque everywhere, MASK if it is only on/off (cutout), BLEND for real
+# gradients; returns the image as RGB (OPAQUE) or RGBA with the mode
+def analyze_alpha(img):
+    if "transparency" in img.info:
+        img = img.convert("RGBA")
+    if "A" not in img.getbands():
+        return img.convert("RGB"), "OPAQUE"
+    a = np.asarray(img.getchannel("A"))
+    if a.min() >= 255 - ALPHA_EPSILON:
+        return img.convert("RGB"), "OPAQUE"
+    if not ((a > ALPHA_EPSILON) & (a < 255 - ALPHA_EPSILON)).any():
+        return img.convert("RGBA"), "MASK"
+    return img.convert("RGBA"), "BLEND"
+
+
+# JPEG (opaque, with Quality) or PNG; cutouts get a 1-bit alpha again after
+# resizing and are also tried as palette PNG if they have at most 256 colors
+def encode_image(img, jpegquality: int, alpha_mode: str = "OPAQUE"):
+    buf = io.BytesIO()
+    if alpha_mode == "OPAQUE":
+        img.convert("RGB").save(buf, format="JPEG", quality=jpegquality)
+        return buf.getvalue(), "image/jpeg"
+
+    if alpha_mode == "MASK":
+        rgba = np.array(img.convert("RGBA"))
+        rgba[..., 3] = np.where(rgba[..., 3] >= 128, 255, 0)
+        img = Image.fromarray(rgba, "RGBA")
+    img.save(buf, format="PNG", optimize=True)
+    data = buf.getvalue()
+
+    if alpha_mode == "MASK":
+        colors, index = np.unique(rgba.reshape(-1, 4).view(np.uint32).ravel(), return_inverse=True)
+        if len(colors) <= 256:
+            palette = colors.view(np.uint8).reshape(-1, 4)
+            pal = Image.fromarray(index.reshape(rgba.shape[:2]).astype(np.uint8), "P")
+            pal.putpalette(palette[:, :3].tobytes())
+            buf = io.BytesIO()
+            pal.save(buf, format="PNG", optimize=True, transparency=palette[:, 3].tobytes())
+            if len(buf.getvalue()) < len(data):
+                data = buf.getvalue()
+    return data, "image/png"
+
+
+# scales to maxsize px and converts to JPEG (opaque, with Quality) or PNG (with
+# alpha); alpha_mode is the glTF alphaMode the encoded image supports
 def resize_and_compress(data: bytes, name: str, maxsize: int, jpegquality: int):
     with Image.open(io.BytesIO(data)) as img:
         orig_size = img.size
-        w, h = img.size
+        img, alpha_mode = analyze_alpha(img)
+        img, new_size = fit_image(img, maxsize)
+        new_bytes, mime = encode_image(img, jpegquality, alpha_mode)
+        final_name = clean_image_name(name, mime)
+        return new_bytes, final_name, mime, orig_size, new_size, alpha_mode
+
+
+# materials get BLEND from the materials_alpha.py keywords; where the base
+# color texture has no alpha gradient (and the factor is opaque), MASK or
+# OPAQUE renders the same without sorted transparency
+def apply_alpha_modes(gltf: GLTF2, alpha_modes: dict, log=print):
+    changed = Counter()
+    for mat in gltf.materials or []:
+        mr = mat.pbrMetallicRoughness
+        tex = getattr(mr, "baseColorTexture", None) if mr is not None else None
+        if mat.alphaMode != "BLEND" or tex is None or tex.index >= len(gltf.textures or []):
+            continue
+        mode = alpha_modes.get(gltf.textures[tex.index].source)
+        factor = mr.baseColorFactor or [1.0, 1.0, 1.0, 1.0]
+        if mode is None or mode == "BLEND" or (len(factor) > 3 and factor[3] < 1.0):
+            continue
+        mat.alphaMode = mode
+        changed[mode] += 1
+    if changed:
+        log("- Alpha: " + ", ".join(f"{n} materials BLEND → {mode}" for mode, n in sorted(changed.items())))
+
+
+# lists every place that references a bufferView as (object, attribute) pairs
+def _buffer_view_refs(gltf: GLTF2):
+    refs = []
+    for acc in gltf.accessors or []:
+        if acc.bufferView is not None:
+            refs.append((acc, "bufferView"))
+        sparse = acc.sparse
+        if sparse is not None:
+            for part in (sparse.indices, sparse.values):
+                if part is not None and part.bufferView is not None:
+                    refs.append((part, "bufferView"))
+    for img in gltf.images or []:
+        if img.bufferView is not None:
+            refs.append((img, "bufferView"))
+    return refs
 
-        # scale if greater than maxsize
-        if max(w, h) > maxsize:
-            scale = maxsize / max(w, h)
-            new_size = (int(w * scale), int(h * scale))
-            img = img.resize(new_size, Image.LANCZOS)
-        else:
-            new_size = orig_size
 
-        buf = io.BytesIO()
+# rebuilds the GLB blob in one pass: replacements maps image index -> (bytes, mime).
+# Replaced images get their data at the place of their old view (or a new view if
+# the old one was shared), unreferenced views are dropped, every view starts
+# 4-byte aligned and all bufferView indices are remapped.
+def repack_gltf(gltf: GLTF2, replacements: dict):
+    blob = gltf.binary_blob() or b""
+    views = list(gltf.bufferViews or [])
+    refs = _buffer_view_refs(gltf)
 
-        if "A" in img.getbands():
-            mime = "image/png"
-            img.save(buf, format="PNG", optimize=True)
+    users = [0] * len(views)
+    for obj, attr in refs:
+        idx = getattr(obj, attr)
+        if idx < len(views):
+            users[idx] += 1
+
+    # payload per view: None = copy the old byte range
+    payload = [None] * len(views)
+    appended = []  # (image, data)
+    for img_idx, (data, mime) in sorted(replacements.items()):
+        img = gltf.images[img_idx]
+        old = img.bufferView
+        if old is not None and old < len(views) and users[old] == 1 and (views[old].buffer or 0) == 0:
+            payload[old] = data
         else:
-            mime = "image/jpeg"
-            img.convert("RGB").save(buf, format="JPEG", quality=jpegquality)
+            if old is not None and old < len(views):
+                users[old] -= 1
+            appended.append((img, data))
+            img.bufferView = None
+        img.uri = None
+        img.mimeType = mime
 
-        final_name = clean_image_name(name, mime)
-        return buf.getvalue(), final_name, mime, orig_size, new_size
+    chunks = []
+    offset = 0
+    new_views = []
+    remap = {}
+
+    def append(data):
+        nonlocal offset
+        pad = (-offset) % 4
+        if pad:
+            chunks.append(b"\x00" * pad)
+            offset += pad
+        start = offset
+        chunks.append(data)
+        offset += len(data)
+        return start
+
+    def place(bv, data):
+        bv.byteOffset = append(data)
+        bv.byteLength = len(data)
+        new_views.append(bv)
+
+    for idx, bv in enumerate(views):
+        if users[idx] == 0:
+            continue
+        remap[idx] = len(new_views)
+        if (bv.buffer or 0) != 0:
+            # external buffers stay untouched, except for meshopt compressed
+            # views whose payload lives in the BIN chunk
+            ext = (bv.extensions or {}).get(MESHOPT_EXTENSION)
+            if ext is not None and ext.get("buffer", 0) == 0:
+                start = ext.get("byteOffset", 0)
+                ext["byteOffset"] = append(blob[start:start + ext["byteLength"]])
+            new_views.append(bv)
+            continue
+        data = payload[idx]
+        if data is None:
+            start = bv.byteOffset or 0
+            data = blob[start:start + bv.byteLength]
+        place(bv, data)
+
+    for obj, attr in refs:
+        idx = getattr(obj, attr)
+        if idx is not None:
+            setattr(obj, attr, remap.get(idx))
+
+    for img, data in appended:
+        img.bufferView = len(new_views)
+        place(BufferView(buffer=0, byteLength=len(data)), data)
+
+    pad = (-offset) % 4
+    if pad:
+        chunks.append(b"\x00" * pad)
+        offset += pad
+
+    gltf.bufferViews = new_views
+    if not gltf.buffers:
+        gltf.buffers = [Buffer(byteLength=offset)]
+    else:
+        gltf.buffers[0].byteLength = offset
+    gltf.set_binary_blob(b"".join(chunks))
+    return gltf
 
 
 # replaces embedded image data in GLB buffer
 def replace_image_bytes(gltf: GLTF2, img_idx: int, data: bytes, mime: str):
-    img = gltf.images[img_idx]
-    blob = bytearray(gltf.binary_blob() or b"")
+    repack_gltf(gltf, {img_idx: (data, mime)})
 
-    if img.bufferView is not None and img.bufferView < len(gltf.bufferViews):
-        bv = gltf.bufferViews[img.bufferView]
-        start = bv.byteOffset or 0
-        end = start + bv.byteLength
 
-        if len(data) <= bv.byteLength:
-            blob[start:start + len(data)] = data
-            if len(data) < bv.byteLength:
-                blob[start + len(data):end] = b"\x00" * (bv.byteLength - len(data))
-            bv.byteLength = len(data)
-        else:
-            offset = len(blob)
-            blob.extend(data)
-            bv = BufferView(buffer=0, byteOffset=offset, byteLength=len(data))
-            gltf.bufferViews.append(bv)
-            img.bufferView = len(gltf.bufferViews) - 1
+# worker entry point: raw image bytes in, encoded bytes out (must stay picklable)
+def _compress_job(job):
+    data, name, maxsize, jpegquality = job
+    try:
+        return resize_and_compress(data, name, maxsize, jpegquality), None
+    except Exception as e:
+        return None, str(e)
+
+
+def resolve_jobs(jobs: int) -> int:
+    return max(1, jobs if jobs > 0 else (os.cpu_count() or 1))
+
+
+# compresses all embedded images of a loaded GLB in place
+# cache is an optional texcache.TextureCache
+# jobs > 1 encodes the images in a process pool; the blob is repacked once
+# here afterwards, so the output is the same as with jobs=1
+def compress_gltf(gltf: GLTF2, maxsize: int, quality: int, jobs: int = 1, log=print, cache=None):
+    pending = []
+    for idx, img in enumerate(gltf.images or []):
+        data, mime = get_image_bytes(gltf, idx)
+        if not data:
+            log(f"Skip {img.name or f'image_{idx}'} (no data found)")
+            continue
+        pending.append((idx, bytes(data), img.name or f"image_{idx}"))
+
+    # cache hits skip Pillow entirely
+    results = [None] * len(pending)
+    keys = [None] * len(pending)
+    todo = []
+    for i, (_, data, name) in enumerate(pending):
+        if cache is not None:
+            keys[i] = cache.make_key(data, maxsize, quality)
+            hit = cache.get(keys[i])
+            if hit is not None:
+                new_bytes, new_mime, old_size, new_size, alpha_mode = hit
+                results[i] = ((new_bytes, clean_image_name(name, new_mime), new_mime, old_size, new_size,
+                               alpha_mode), None)
+                continue
+        todo.append(i)
+
+    work = [(pending[i][1], pending[i][2], maxsize, quality) for i in todo]
+    jobs = min(resolve_jobs(jobs), len(work))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            encoded = list(pool.map(_compress_job, work))
     else:
-        offset = len(blob)
-        blob.extend(data)
-        bv = BufferView(buffer=0, byteOffset=offset, byteLength=len(data))
-        gltf.bufferViews.append(bv)
-        img.bufferView = len(gltf.bufferViews) - 1
+        encoded = [_compress_job(job) for job in work]
 
-    img.uri = None
-    img.mimeType = mime
+    for i, (result, error) in zip(todo, encoded):
+        results[i] = (result, error)
+        if cache is not None and error is None:
+            new_bytes, _, new_mime, old_size, new_size, alpha_mode = result
+            cache.put(keys[i], new_bytes, new_mime, old_size, new_size, alpha_mode)
 
-    if not gltf.buffers:
-        gltf.buffers = [Buffer(byteLength=len(blob))]
+    replacements = {}
+    alpha_modes = {}
+    for (idx, _, name), (result, error) in zip(pending, results):
+        img = gltf.images[idx]
+        if error is not None:
+            log(f"Error at {name}: {error}")
+            continue
+        new_bytes, new_name, new_mime, old_size, new_size, alpha_modes[idx] = result
+        replacements[idx] = (new_bytes, new_mime)
+        img.name = new_name
+        left = f"- {new_name}:"
+        log(f"{left:<{40}}{old_size[0]}x{old_size[1]} → {new_size[0]}x{new_size[1]}")
+
+    repack_gltf(gltf, replacements)
+    apply_alpha_modes(gltf, alpha_modes, log)
+    return gltf
+
+
+# -------- target size --------
+# --target-bytes: per texture, a ladder of edge sizes (--maxsize and halvings)
+# and JPEG qualities (--quality and below) is encoded and scored against the
+# texture at --maxsize; then the combination with the lowest weighted loss
+# that keeps the GLB under the budget is picked. Each worker decodes its
+# texture once and runs all trial encodes of it.
+TARGET_QUALITIES = (95, 90, 85, 80, 75, 70, 60, 50, 40, 30)
+TARGET_MIN_SIZE = 32
+SSIM_WINDOW = 8
+METRICS = ("ssim", "psnr")
+
+
+def _blocks(x, k):
+    h, w = x.shape[0] // k * k, x.shape[1] // k * k
+    return x[:h, :w].reshape(h // k, k, w // k, k, x.shape[2])
+
+
+# 1 - mean SSIM over k x k blocks, channels averaged
+def ssim_loss(a, b):
+    k = min(SSIM_WINDOW, a.shape[0], a.shape[1])
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    x, y = _blocks(a, k), _blocks(b, k)
+    mx, my = x.mean(axis=(1, 3)), y.mean(axis=(1, 3))
+    vx = (x * x).mean(axis=(1, 3)) - mx * mx
+    vy = (y * y).mean(axis=(1, 3)) - my * my
+    cov = (x * y).mean(axis=(1, 3)) - mx * my
+    s = ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return 1.0 - float(s.mean())
+
+
+# mean squared error, normalized to 0..1
+def mse_loss(a, b):
+    return float(np.mean((a - b) ** 2)) / (255.0 * 255.0)
+
+
+# luminance (and alpha) as float64, the channels the loss is computed on
+def _loss_channels(img):
+    if "A" in img.getbands():
+        a = np.asarray(img.convert("RGBA"), dtype=np.float64)
+        y = a[..., :3] @ np.array([0.299, 0.587, 0.114])
+        return np.stack([y, a[..., 3]], axis=2)
+    a = np.asarray(img.convert("RGB"), dtype=np.float64)
+    return (a @ np.array([0.299, 0.587, 0.114]))[..., None]
+
+
+def target_ladder(maxsize: int, quality: int):
+    sizes = []
+    while maxsize >= TARGET_MIN_SIZE or not sizes:
+        sizes.append(maxsize)
+        maxsize //= 2
+    qualities = [quality] + [q for q in TARGET_QUALITIES if q < quality]
+    return sizes, qualities
+
+
+# worker entry point: returns (orig_size, alpha_mode, [(maxsize, quality, bytes,
+# mime, new_size, loss)]) or an error; candidates that give the same pixels
+# (texture smaller than maxsize, quality of a PNG) are encoded once
+def _search_job(job):
+    data, sizes, qualities, metric = job
+    loss_fn = ssim_loss if metric == "ssim" else mse_loss
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            orig_size = img.size
+            img, alpha_mode = analyze_alpha(img)
+            ref_img, ref_size = fit_image(img, sizes[0])
+            ref = _loss_channels(ref_img)
+            candidates = []
+            seen = set()
+            for maxsize in sizes:
+                small, new_size = fit_image(img, maxsize)
+                if new_size in seen:
+                    continue
+                seen.add(new_size)
+                for quality in qualities:
+                    new_bytes, mime = encode_image(small, quality, alpha_mode)
+                    with Image.open(io.BytesIO(new_bytes)) as dec:
+                        dec = dec.convert(ref_img.mode)
+                        if dec.size != ref_size:
+                            dec = dec.resize(ref_size, Image.BILINEAR)
+                        loss = loss_fn(ref, _loss_channels(dec))
+                    candidates.append((maxsize, quality, new_bytes, mime, new_size, loss))
+                    if mime == "image/png":
+                        break
+        return (orig_size, alpha_mode, candidates), None
+    except Exception as e:
+        return None, str(e)
+
+
+# cheapest-first lower convex hull of (bytes, loss), as candidate indices
+def _hull(candidates):
+    order = sorted(range(len(candidates)), key=lambda i: (len(candidates[i][2]), candidates[i][5]))
+    front = []
+    for i in order:
+        if not front or candidates[i][5] < candidates[front[-1]][5]:
+            front.append(i)
+    hull = []
+    for i in front:
+        x, y = len(candidates[i][2]), candidates[i][5]
+        while len(hull) >= 2:
+            x0, y0 = len(candidates[hull[-2]][2]), candidates[hull[-2]][5]
+            x1, y1 = len(candidates[hull[-1]][2]), candidates[hull[-1]][5]
+            if (y1 - y0) * (x - x0) >= (y - y0) * (x1 - x0):
+                hull.pop()
+            else:
+                break
+        hull.append(i)
+    return hull
+
+
+# starts with the best candidate everywhere and steps down the texture that
+# loses the least weighted quality per saved byte until the images fit
+def _pick(hulls, candidates, weights, budget):
+    pos = [len(h) - 1 for h in hulls]
+    size = sum(len(candidates[t][h[-1]][2]) for t, h in enumerate(hulls))
+    heap = []
+
+    def push(t):
+        if pos[t] > 0:
+            a, b = candidates[t][hulls[t][pos[t]]], candidates[t][hulls[t][pos[t] - 1]]
+            saved = len(a[2]) - len(b[2])
+            heapq.heappush(heap, (weights[t] * (b[5] - a[5]) / saved, t))
+
+    for t in range(len(hulls)):
+        push(t)
+    while size > budget and heap:
+        _, t = heapq.heappop(heap)
+        size -= len(candidates[t][hulls[t][pos[t]]][2]) - len(candidates[t][hulls[t][pos[t] - 1]][2])
+        pos[t] -= 1
+        push(t)
+    picks = [h[p] for h, p in zip(hulls, pos)]
+
+    # the hull skips candidates, so what is left of the budget goes to the
+    # upgrades (hull or not) that win the most weighted quality
+    while size <= budget:
+        best = None
+        for t, c in enumerate(candidates):
+            now = c[picks[t]]
+            for i, cand in enumerate(c):
+                extra = len(cand[2]) - len(now[2])
+                gain = weights[t] * (now[5] - cand[5])
+                if gain > 0 and size + extra <= budget and (best is None or gain > best[0]):
+                    best = (gain, t, i, extra)
+        if best is None:
+            break
+        _, t, picks[t], extra = best
+        size += extra
+    return picks
+
+
+def glb_size(gltf: GLTF2) -> int:
+    js = gltf.gltf_to_json(separators=(",", ":"), indent=None).encode("utf-8")
+    blob = gltf.binary_blob() or b""
+    return 12 + 8 + len(js) + (-len(js) % 4) + 8 + len(blob) + (-len(blob) % 4)
+
+
+# compresses all embedded images so the GLB fits target_bytes; maxsize and
+# quality are the upper limits of the search. Picked encodes are stored in the
+# cache under their settings, so a later run with them hits.
+def compress_gltf_to_target(gltf: GLTF2, target_bytes: int, maxsize: int, quality: int,
+                            metric: str = "ssim", jobs: int = 1, log=print, cache=None):
+    pending = []
+    for idx, img in enumerate(gltf.images or []):
+        data, mime = get_image_bytes(gltf, idx)
+        if not data:
+            log(f"Skip {img.name or f'image_{idx}'} (no data found)")
+            continue
+        pending.append((idx, bytes(data), img.name or f"image_{idx}"))
+
+    sizes, qualities = target_ladder(maxsize, quality)
+    work = [(data, sizes, qualities, metric) for _, data, _ in pending]
+    jobs = min(resolve_jobs(jobs), len(work))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            searched = list(pool.map(_search_job, work))
     else:
-        gltf.buffers[0].byteLength = len(blob)
+        searched = [_search_job(job) for job in work]
+
+    found = []
+    for (idx, data, name), (result, error) in zip(pending, searched):
+        if error is not None:
+            log(f"Error at {name}: {error}")
+            continue
+        found.append((idx, data, name) + result)
+    if not found:
+        repack_gltf(gltf, {})
+        return gltf
+
+    # loss weighted by the pixels a texture has at the top of the ladder
+    area = np.array([min(1.0, sizes[0] / max(orig)) ** 2 * orig[0] * orig[1] for *_, orig, _, _ in found])
+    weights = area / area.sum()
+    candidates = [c for *_, c in found]
+    hulls = [_hull(c) for c in candidates]
+
+    # the rest of the GLB is measured with the chosen images in place; the
+    # budget shrinks by the overshoot of the JSON/padding estimate until it fits
+    fixed = glb_size(gltf) - sum(len(data) for _, data, _ in pending)
+    budget = target_bytes - fixed
+    for _ in range(4):
+        picks = _pick(hulls, candidates, weights, budget)
+        trial = copy.deepcopy(gltf)
+        repack_gltf(trial, {idx: (c[p][2], c[p][3]) for (idx, *_), c, p in zip(found, candidates, picks)})
+        total = glb_size(trial)
+        if total <= target_bytes or budget <= 0:
+            break
+        budget -= total - target_bytes
 
-    gltf.set_binary_blob(bytes(blob))
+    replacements = {}
+    loss = 0.0
+    alpha_modes = {}
+    for (idx, data, name, orig_size, alpha_mode, _), c, p, w in zip(found, candidates, picks, weights):
+        size_limit, q, new_bytes, new_mime, new_size, l = c[p]
+        loss += w * l
+        replacements[idx] = (new_bytes, new_mime)
+        alpha_modes[idx] = alpha_mode
+        gltf.images[idx].name = new_name = clean_image_name(name, new_mime)
+        if cache is not None:
+            cache.put(cache.make_key(data, size_limit, q), new_bytes, new_mime, orig_size, new_size, alpha_mode)
+        setting = f"q{q}" if new_mime == "image/jpeg" else "png"
+        left = f"- {new_name}:"
+        log(f"{left:<{40}}{orig_size[0]}x{orig_size[1]} → {new_size[0]}x{new_size[1]} {setting}")
+
+    repack_gltf(gltf, replacements)
+    apply_alpha_modes(gltf, alpha_modes, log)
+    total = glb_size(gltf)
+    score = f"SSIM {1.0 - loss:.4f}" if metric == "ssim" else \
+        f"PSNR {10 * np.log10(1.0 / max(loss, 1e-12)):.1f} dB"
+    log(f"- Target {target_bytes} bytes: GLB {total} bytes, weighted {score}")
+    if total > target_bytes:
+        log(f"- Target not reached, {total - target_bytes} bytes over")
+    return gltf
 
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Compress GLB textures: JPEG (no alpha), PNG (with alpha). "
+        description="Compress GLB textures: JPEG (no or opaque alpha), PNG (cutout or gradient alpha). "
                     "Input must be a *_uncompressed.glb file. Output will be saved without '_uncompressed'"
     )
     parser.add_argument("mappath", type=str, help="Input BSP file (must end with .bsp)")
@@ -125,6 +577,14 @@ def main():
                         help=f"Maximum edge size in Pixels (default: {DEFAULT_MAXSIZE})")
     parser.add_argument("--quality", type=int, default=DEFAULT_JPEGQUALITY,
                         help=f"JPEG-Quality 1-100 (default: {DEFAULT_JPEGQUALITY})")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Parallel image encoder processes, 0 = one per CPU core (default: 1)")
+    parser.add_argument("--target-bytes", type=int, default=0,
+                        help="Fit the GLB under this size: searches per-texture size and quality "
+                             "up to --maxsize/--quality (default: off)")
+    parser.add_argument("--metric", choices=METRICS, default="ssim",
+                        help="Quality loss minimized by --target-bytes (default: ssim)")
+    texcache.add_cache_arguments(parser)
     
     args = parser.parse_args()
 
@@ -137,33 +597,17 @@ def main():
     output_file = input_file.replace("_uncompressed.glb", ".glb")
         
     gltf = GLTF2().load(input_file)
+    cache = texcache.cache_from_args(args)
+    if args.target_bytes > 0:
+        compress_gltf_to_target(gltf, args.target_bytes, args.maxsize, args.quality, args.metric,
+                                args.jobs, cache=cache)
+    else:
+        compress_gltf(gltf, args.maxsize, args.quality, args.jobs, cache=cache)
 
-    if gltf.images:
-        for idx, img in enumerate(gltf.images):
-            data, mime = get_image_bytes(gltf, idx)
-            if not data:
-                print(f"Skip {img.name or f'image_{idx}'} (no data found)")
-                continue
-
-            try:
-                new_bytes, new_name, new_mime, old_size, new_size = resize_and_compress(
-                    data, img.name or f"image_{idx}", args.maxsize, args.quality
-                )
-                replace_image_bytes(gltf, idx, new_bytes, new_mime)
-                img.name = new_name
-                left = f"- {new_name}:"
-                new=f"{new_size[0]}x{new_size[1]}"
-                old=f"{old_size[0]}x{old_size[1]}"
-                old = old.strip("()").replace(", ", "x")
-                new = new.strip("()").replace(", ", "x")
-                
-                
-                print(f"{left:<{40}}{old} → {new}")
-            except Exception as e:
-                print(f"Error at {img.name or f'image_{idx}'}: {e}")
-
-    gltf.save_binary(output_file)
+    save_glb(gltf, output_file)
     print(f"- Compressed GLB saved as {output_file}")
+    if cache is not None:
+        cache.report()
 
 
 if __name__ == "__main__":
@@ -1,33 +1,53 @@
 import os
 import argparse
 
-parser = argparse.ArgumentParser(description="Rewrites texture paths in MTL file")
-parser.add_argument("mappath", type=str, help="Path to the .bsp file")
-args = parser.parse_args()
 
-if not args.mappath.endswith(".bsp"):
-    raise ValueError("ERROR: filename must end with '.bsp'")
+# rewrites relative "../" texture paths to absolute paths below base_path
+def fix_mtl_lines(lines, base_path, verbose=True):
+    new_lines = []
+    for line in lines:
+        if line.strip().startswith("map_Kd") and "../" in line:
+            parts = line.split("../", 1)
+            new_path = os.path.join(base_path, parts[1])#.replace("/", "\\"))
+            if verbose:
+                print(new_path)
 
-mtl_file = args.mappath.replace(".bsp", ".mtl")
+            new_line = f"map_Kd {new_path}\n"
+            new_lines.append(new_line)
+        else:
+            new_lines.append(line)
+    return new_lines
 
-base_path = mtl_file.split(r"/maps/")[0]
 
-with open(mtl_file, "r") as f:
-    lines = f.readlines()
+def mtl_base_path(mtl_file):
+    return mtl_file.split(r"/maps/")[0]
 
-new_lines = []
-for line in lines:
-    if line.strip().startswith("map_Kd") and "../" in line:
-        parts = line.split("../", 1)
-        new_path = os.path.join(base_path, parts[1])#.replace("/", "\\"))
-        print(new_path)
 
-        new_line = f"map_Kd {new_path}\n"
-        new_lines.append(new_line)
-    else:
-        new_lines.append(line)
+def fix_mtl(mtl_file, write=True, verbose=True):
+    with open(mtl_file, "r") as f:
+        lines = f.readlines()
 
-with open(mtl_file, "w") as f:
-    f.writelines(new_lines)
+    new_lines = fix_mtl_lines(lines, mtl_base_path(mtl_file), verbose)
 
-print("- MTL texture paths fixed.")
\ No newline at end of file
+    if write:
+        with open(mtl_file, "w") as f:
+            f.writelines(new_lines)
+    return new_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrites texture paths in MTL file")
+    parser.add_argument("mappath", type=str, help="Path to the .bsp file")
+    args = parser.parse_args()
+
+    if not args.mappath.endswith(".bsp"):
+        raise ValueError("ERROR: filename must end with '.bsp'")
+
+    mtl_file = args.mappath.replace(".bsp", ".mtl")
+    fix_mtl(mtl_file)
+
+    print("- MTL texture paths fixed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Lightmap atlas for the direct BSP export (bsp2glb --from-bsp --lightmaps).
+# Each lightmapped surface samples one lightmap page: a 128x128 page of the BSP
+# lightmaps lump, or with "q3map2 -light -external" a maps/<map>/lm_NNNN image,
+# referenced by the surface shaders q3map2 writes to scripts/q3map2_<map>.shader.
+# The used pages are shelf packed into one image (edge padded, so filtering and
+# downscaling don't bleed between pages) and the drawVert lightmap coordinates
+# are remapped into it. Surfaces without a lightmap point at a white cell.
+import argparse
+import hashlib
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+import bspreader
+
+PADDING = 2
+WHITE_CELL = 8
+
+
+def _external_pages(game_dir, mapname):
+    # shader name -> lightmap image of the shaders q3map2 generated for this map
+    pages = {}
+    path = os.path.join(game_dir, "scripts", f"q3map2_{mapname}.shader")
+    if not os.path.exists(path):
+        return pages
+    with open(path, "r", encoding="latin-1") as f:
+        text = f.read()
+    for name, body in bspreader.shader_blocks(text):
+        for _, t in body:
+            t = t.strip('"')
+            if bspreader.LIGHTMAP_PAGE_RE.search(t):
+                pages.setdefault(name, t)
+                break
+    return pages
+
+
+def _load_page(game_dir, name):
+    path = bspreader.find_image(game_dir, name)
+    if path is None:
+        print(f"- Lightmap {name} not found")
+        return None
+    with Image.open(path) as im:
+        return np.asarray(im.convert("RGB"))
+
+
+# returns the used pages as [(key, HxWx3 uint8)] and the page of every surface (-1 = none)
+def collect_pages(bsp, mappath):
+    game_dir = bspreader.game_dir_for_map(mappath)
+    mapname = os.path.splitext(os.path.basename(mappath))[0]
+    external = _external_pages(game_dir, mapname)
+    names = [n.lower() for n in bsp.shader_names()]
+
+    pages, page_of = [], {}
+    surface_pages = np.full(len(bsp.surfaces), -1, dtype=np.int64)
+    surf_ids, _ = bsp.exported_surfaces()
+    for s in surf_ids.tolist():
+        shader, num = int(bsp.surfaces["shader"][s]), int(bsp.surfaces["lightmap"][s])
+        ext = external.get(names[shader]) if 0 <= shader < len(names) else None
+        if ext is None and num >= len(bsp.lightmaps):
+            ext = f"maps/{mapname}/lm_{num:04d}"  # external page without a generated shader
+        if ext is not None:
+            key = ext.lower()
+        elif num >= 0:
+            key = num
+        else:
+            continue
+        if key not in page_of:
+            img = _load_page(game_dir, ext) if ext is not None else np.array(bsp.lightmaps[num])
+            page_of[key] = -1 if img is None else len(pages)
+            if img is not None:
+                pages.append((key, img))
+        surface_pages[s] = page_of[key]
+    return pages, surface_pages
+
+
+def _shelves(padded, width, padding):
+    rects = [None] * len(padded)
+    x = y = shelf = 0
+    for i in sorted(range(len(padded)), key=lambda i: (-padded[i][1], i)):
+        w, h = padded[i]
+        if x + w > width:
+            x, y, shelf = 0, y + shelf, 0
+        rects[i] = (x + padding, y + padding)
+        x += w
+        shelf = max(shelf, h)
+    return rects, (width, max(y + shelf, 1))
+
+
+# shelf packing of (w, h) sizes, tallest first, into the power of two width
+# giving the smallest image; returns the (x, y) of every size inside its
+# padding and the image (W, H)
+def pack(sizes, padding=PADDING):
+    padded = [(w + 2 * padding, h + 2 * padding) for w, h in sizes]
+    width = 1
+    while width < max([w for w, _ in padded] + [1]):
+        width *= 2
+    best = None
+    while True:
+        rects, (W, H) = _shelves(padded, width, padding)
+        if best is None or (W * H, abs(W - H)) < (best[1][0] * best[1][1], abs(best[1][0] - best[1][1])):
+            best = rects, (W, H)
+        if width >= sum(w for w, _ in padded):
+            return best
+        width *= 2
+
+
+class LightmapAtlas:
+    def __init__(self, bsp, mappath, padding=PADDING):
+        pages, self.surface_pages = collect_pages(bsp, mappath)
+        images = [img for _, img in pages] + [np.full((WHITE_CELL, WHITE_CELL, 3), 255, dtype=np.uint8)]
+        rects, (W, H) = pack([(img.shape[1], img.shape[0]) for img in images], padding)
+
+        self.image = np.zeros((H, W, 3), dtype=np.uint8)
+        offset, size = np.zeros((len(images), 2)), np.zeros((len(images), 2))
+        for i, (img, (x, y)) in enumerate(zip(images, rects)):
+            h, w = img.shape[:2]
+            self.image[y - padding:y + h + padding, x - padding:x + w + padding] = \
+                np.pad(img, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+            offset[i] = (x / W, y / H)
+            size[i] = (w / W, h / H)
+        self.offset, self.size = offset, size
+        self.num_pages = len(pages)
+        self.digest = hashlib.sha256(self.image.tobytes() + np.array([W, H]).tobytes()
+                                     + self.surface_pages.tobytes()).hexdigest()
+
+    # lightmap st (per vertex, with the surface of every vertex) -> atlas uv
+    def remap(self, LM, vertex_surfaces):
+        page = self.surface_pages[vertex_surfaces]
+        lm = np.clip(np.asarray(LM, dtype=np.float64), 0.0, 1.0)
+        unlit = page < 0
+        page[unlit] = self.num_pages
+        lm[unlit] = 0.5
+        return (self.offset[page] + lm * self.size[page]).astype(np.float32)
+
+    # atlas uv of the white cell, for geometry without lightmap
+    def unlit_uvs(self, n):
+        white = self.offset[self.num_pages] + 0.5 * self.size[self.num_pages]
+        return np.repeat(white[None, :], n, axis=0).astype(np.float32)
+
+    def png_bytes(self):
+        out = io.BytesIO()
+        Image.fromarray(self.image).save(out, format="PNG", compress_level=1)
+        return out.getvalue()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Packs the lightmap pages of a compiled map into one atlas image.")
+    ap.add_argument("mappath", type=str, help="Path to the .bsp file")
+    ap.add_argument("output", type=str, nargs="?", default=None, help="Atlas PNG (default: <map>_lightmap.png)")
+    args = ap.parse_args()
+
+    with bspreader.BSPFile(args.mappath) as bsp:
+        atlas = LightmapAtlas(bsp, args.mappath)
+    output = args.output or args.mappath.replace(".bsp", "_lightmap.png")
+    with open(output, "wb") as f:
+        f.write(atlas.png_bytes())
+    print(f"- {atlas.num_pages} lightmap pages -> {atlas.image.shape[1]}x{atlas.image.shape[0]} {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# GPU instancing of misc_model entities (bsp2glb --instance-models).
+# q3map2 bakes a full copy of the model into the map for every misc_model.
+# The placements (model, origin, angle/angles, modelscale/modelscale_vec) are
+# read from the .map, every distinct glTF model is loaded once and written as
+# one mesh with an EXT_mesh_gpu_instancing TRANSLATION/ROTATION/SCALE set.
+# The baked copies are dropped from the compiled geometry by material, but only
+# after their triangle count and bounds match the placements; models sharing
+# a material are handled together and stay baked if anything doesn't add up.
+import argparse
+import base64
+import json
+import os
+import posixpath
+import re
+import struct
+
+import numpy as np
+
+import buildmanifest
+import scale
+
+MIN_PLACEMENTS = 2  # models placed once stay baked, unless they share a material
+TRIANGLE_TOLERANCE = 0.1  # q3map2 drops degenerate and splits t-junction triangles
+BOUNDS_TOLERANCE = 0.01
+
+# entity keys that change the baked copy in ways the instances can't follow
+BAKED_ONLY_KEYS = ("_remap", "_skin", "skin", "_frame", "frame")
+MODEL_EXTENSIONS = (".gltf", ".glb")
+EXTENSION = "EXT_mesh_gpu_instancing"
+
+# q3map2 world axes -> the (x, z, -y) axes of its OBJ export
+_QUAKE_TO_OBJ = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, -1.0, 0.0]])
+
+
+# -------- .map entities --------
+_KEYVALUE = re.compile(r'^"([^"]*)"\s+"([^"]*)"$')
+
+
+def load_entities(map_file):
+    # key/values of every top level block, brushes and patches are skipped
+    entities, depth = [], 0
+    with open(map_file, "r", encoding="latin-1") as f:
+        for line in f:
+            s = line.strip()
+            if s == "{":
+                depth += 1
+                if depth == 1:
+                    entities.append({})
+            elif s == "}":
+                depth -= 1
+            elif depth == 1:
+                m = _KEYVALUE.match(s)
+                if m:
+                    entities[-1].setdefault(m.group(1), m.group(2))
+    return entities
+
+
+def _floats(value, n, default):
+    try:
+        v = [float(x) for x in (value or "").split()]
+    except ValueError:
+        return default
+    return v[:n] if len(v) >= n else default
+
+
+# (model, origin, (pitch, yaw, roll), scale xyz, entity) of every misc_model, read like q3map2 does
+def misc_models(entities):
+    out = []
+    for ent in entities:
+        if ent.get("classname", "").lower() != "misc_model" or not ent.get("model"):
+            continue
+        origin = _floats(ent.get("origin"), 3, [0.0, 0.0, 0.0])
+        angles = [0.0, _floats(ent.get("angle"), 1, [0.0])[0], 0.0]
+        angles = _floats(ent.get("angles"), 3, angles)
+        s = _floats(ent.get("modelscale"), 1, [1.0])[0] or 1.0
+        size = _floats(ent.get("modelscale_vec"), 3, [s, s, s])
+        if not any(size):
+            size = [1.0, 1.0, 1.0]
+        out.append((ent["model"].replace("\\", "/"), origin, angles, size, ent))
+    return out
+
+
+# rotation matrices of (pitch, yaw, roll) rows: roll around X, pitch around Y,
+# yaw around Z, as q3map2 builds the misc_model transform
+def angle_matrices(angles):
+    a = np.radians(np.asarray(angles, dtype=np.float64).reshape(-1, 3))
+    n = len(a)
+
+    def axis(theta, i, j):
+        m = np.zeros((n, 3, 3))
+        m[:, 3 - i - j, 3 - i - j] = 1.0
+        m[:, i, i] = m[:, j, j] = np.cos(theta)
+        m[:, i, j] = -np.sin(theta)
+        m[:, j, i] = np.sin(theta)
+        return m
+
+    return axis(a[:, 1], 0, 1) @ axis(a[:, 0], 2, 0) @ axis(a[:, 2], 1, 2)
+
+
+# (n, 3, 3) rotation matrices -> (n, 4) xyzw quaternions
+def matrix_quaternions(R):
+    w = np.sqrt(np.maximum(0.0, 1.0 + R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2])) / 2
+    x = np.sqrt(np.maximum(0.0, 1.0 + R[:, 0, 0] - R[:, 1, 1] - R[:, 2, 2])) / 2
+    y = np.sqrt(np.maximum(0.0, 1.0 - R[:, 0, 0] + R[:, 1, 1] - R[:, 2, 2])) / 2
+    z = np.sqrt(np.maximum(0.0, 1.0 - R[:, 0, 0] - R[:, 1, 1] + R[:, 2, 2])) / 2
+    x = np.copysign(x, R[:, 2, 1] - R[:, 1, 2])
+    y = np.copysign(y, R[:, 0, 2] - R[:, 2, 0])
+    z = np.copysign(z, R[:, 1, 0] - R[:, 0, 1])
+    q = np.stack([x, y, z, w], axis=1)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+# -------- glTF models --------
+_COMPONENTS = {5120: "i1", 5121: "u1", 5122: "<i2", 5123: "<u2", 5125: "<u4", 5126: "<f4"}
+_WIDTHS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4}
+
+
+def _read_gltf(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    chunks = []
+    if raw[:4] == b"glTF":
+        off = 12
+        while off + 8 <= len(raw):
+            length, kind = struct.unpack_from("<I4s", raw, off)
+            chunks.append((kind, raw[off + 8:off + 8 + length]))
+            off += 8 + length + (-length % 4)
+        doc = json.loads(next(data for kind, data in chunks if kind == b"JSON"))
+    else:
+        doc = json.loads(raw)
+    files = [path]
+    buffers = []
+    for buf in doc.get("buffers", []):
+        uri = buf.get("uri")
+        if uri is None:
+            buffers.append(next((data for kind, data in chunks if kind == b"BIN\0"), b""))
+        elif uri.startswith("data:"):
+            buffers.append(base64.b64decode(uri.split(",", 1)[1]))
+        else:
+            bin_path = os.path.join(os.path.dirname(path), uri.replace("%20", " "))
+            files.append(bin_path)
+            with open(bin_path, "rb") as f:
+                buffers.append(f.read())
+    return doc, buffers, files
+
+
+def _accessor(doc, buffers, idx):
+    acc = doc["accessors"][idx]
+    if "sparse" in acc:
+        raise ValueError("sparse accessors are not supported")
+    dtype = np.dtype(_COMPONENTS[acc["componentType"]])
+    width, count = _WIDTHS[acc["type"]], acc["count"]
+    if "bufferView" not in acc:
+        return np.zeros((count, width))
+    bv = doc["bufferViews"][acc["bufferView"]]
+    stride = bv.get("byteStride") or dtype.itemsize * width
+    rows = np.ndarray((count, width), dtype=dtype, buffer=buffers[bv["buffer"]],
+                      offset=bv.get("byteOffset", 0) + acc.get("byteOffset", 0),
+                      strides=(stride, dtype.itemsize))
+    if acc.get("normalized") and dtype.kind in "iu":
+        return np.maximum(rows / np.iinfo(dtype).max, -1.0)
+    return rows.astype(np.float64 if dtype.kind == "f" else np.int64)
+
+
+def _node_matrix(node):
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    m = np.eye(4)
+    x, y, z, w = node.get("rotation", [0.0, 0.0, 0.0, 1.0])
+    m[:3, :3] = [[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                 [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                 [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]]
+    m[:3, :3] *= node.get("scale", [1.0, 1.0, 1.0])
+    m[:3, 3] = node.get("translation", [0.0, 0.0, 0.0])
+    return m
+
+
+def _vertex_normals(P, tris):
+    fn = np.cross(P[tris[:, 1]] - P[tris[:, 0]], P[tris[:, 2]] - P[tris[:, 0]])
+    N = np.zeros_like(P)
+    for c in range(3):
+        np.add.at(N, tris[:, c], fn)
+    return N
+
+
+class Model:
+    # triangle primitives of a glTF model with the node transforms applied,
+    # in the model's own (Y up) space; parts are (material names q3map2 may
+    # have used for it, P, T, N, triangles)
+    def __init__(self, path, model):
+        doc, buffers, self.files = _read_gltf(path)
+        model_dir = posixpath.dirname(model)
+        images = doc.get("images", [])
+        textures = doc.get("textures", [])
+
+        def names(mat_idx):
+            if mat_idx is None:
+                return []
+            mat = doc["materials"][mat_idx]
+            out = []
+            tex = mat.get("pbrMetallicRoughness", {}).get("baseColorTexture")
+            if tex is not None and textures[tex["index"]].get("source") is not None:
+                uri = images[textures[tex["index"]]["source"]].get("uri", "")
+                if uri and not uri.startswith("data:"):
+                    stem = posixpath.splitext(uri.replace("%20", " "))[0]
+                    out += [posixpath.normpath(posixpath.join(model_dir, stem)), posixpath.basename(stem)]
+            if mat.get("name"):
+                out.append(mat["name"])
+            return [n.lower() for n in out]
+
+        self.parts = []
+        nodes = doc.get("nodes", [])
+        if doc.get("scenes"):
+            roots = doc["scenes"][doc.get("scene", 0)].get("nodes", [])
+        else:
+            children = {c for node in nodes for c in node.get("children", [])}
+            roots = [i for i in range(len(nodes)) if i not in children]
+        stack = [(n, np.eye(4)) for n in roots]
+        while stack:
+            idx, parent = stack.pop()
+            node = nodes[idx]
+            world = parent @ _node_matrix(node)
+            stack += [(c, world) for c in node.get("children", [])]
+            if node.get("mesh") is None:
+                continue
+            normal_m = np.linalg.inv(world[:3, :3]).T
+            flip = np.linalg.det(world[:3, :3]) < 0
+            for prim in doc["meshes"][node["mesh"]]["primitives"]:
+                if prim.get("mode", 4) != 4 or "POSITION" not in prim["attributes"]:
+                    continue
+                attrs = prim["attributes"]
+                P = _accessor(doc, buffers, attrs["POSITION"]) @ world[:3, :3].T + world[:3, 3]
+                T = _accessor(doc, buffers, attrs["TEXCOORD_0"]) if "TEXCOORD_0" in attrs else np.zeros((len(P), 2))
+                if prim.get("indices") is not None:
+                    tris = _accessor(doc, buffers, prim["indices"]).reshape(-1, 3).astype(np.int64)
+                else:
+                    tris = np.arange(len(P) - len(P) % 3).reshape(-1, 3)
+                if flip:
+                    tris = tris[:, [0, 2, 1]]
+                if "NORMAL" in attrs:
+                    N = _accessor(doc, buffers, attrs["NORMAL"]) @ normal_m.T
+                else:
+                    N = _vertex_normals(P, tris)
+                N /= np.maximum(np.linalg.norm(N, axis=1, keepdims=True), 1e-12)
+                self.parts.append((names(prim.get("material")), P, T, N, tris))
+        self.triangles = sum(len(p[4]) for p in self.parts)
+
+
+# -------- instancing --------
+class MapInstances:
+    def __init__(self, map_file, game_dir):
+        self.placements = {}
+        baked = set()
+        for model, origin, angles, size, ent in misc_models(load_entities(map_file)):
+            if any(k in ent for k in BAKED_ONLY_KEYS):
+                baked.add(model)
+            self.placements.setdefault(model, []).append((origin, angles, size))
+
+        self.models = {}
+        files = []
+        for model in sorted(self.placements):
+            path = os.path.join(game_dir, model)
+            if model in baked or not model.lower().endswith(MODEL_EXTENSIONS) or not os.path.exists(path):
+                continue
+            try:
+                self.models[model] = Model(path, model)
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"- {model}: can't be read ({e}), stays baked")
+                continue
+            files += [(os.path.relpath(f, game_dir), buildmanifest.file_digest(f)) for f in self.models[model].files]
+        self.digest = buildmanifest.digest_values(sorted(self.placements.items()), files, MIN_PLACEMENTS)
+        print(f"- misc_model: {sum(len(p) for p in self.placements.values())} placements of "
+              f"{len(self.placements)} models, {len(self.models)} glTF models loaded")
+
+    # material of the compiled map for every part of the model, or None if a
+    # part has no baked material
+    def _part_materials(self, model, by_lower):
+        out = []
+        for names, *_ in self.models[model].parts:
+            name = next((by_lower[n] for n in names if n in by_lower), None)
+            if name is None:
+                return None
+            out.append(name)
+        return out
+
+    # instance transforms in the exported axes: (translation, rotation xyzw,
+    # scale, sign) per placement; sign mirrors the mesh for negative scales
+    def _transforms(self, model, scale_factor, rotation):
+        origin, angles, size = (np.array(v, dtype=np.float64) for v in zip(*self.placements[model]))
+        axes = scale.scale_rotate_matrix(1.0, rotation) @ _QUAKE_TO_OBJ
+        translation = origin @ axes.T * scale_factor
+        R = axes @ angle_matrices(angles) @ _QUAKE_TO_OBJ.T
+        size = size[:, [0, 2, 1]]  # quake xyz scale in the model's (Y up) axes
+        return translation, R, np.abs(size), np.where(size < 0, -1.0, 1.0)
+
+    # drops the baked copies from OBJ style arrays (positions already scaled);
+    # returns the face mask to keep and {model: part materials} of the instanced models
+    def strip(self, V, faces, face_mtls, scale_factor, rotation):
+        keep = np.ones(len(face_mtls), dtype=bool)
+        by_lower = {}
+        for m in dict.fromkeys(face_mtls):
+            if m:
+                by_lower.setdefault(m.lower(), m)
+        materials = {}
+        for model in self.models:
+            parts = self._part_materials(model, by_lower)
+            if parts is None:
+                print(f"- {posixpath.basename(model)}: no baked copy found, stays baked")
+            else:
+                materials[model] = parts
+
+        # models sharing a material go together
+        groups = []
+        for model, parts in materials.items():
+            names = set(parts)
+            merged = [g for g in groups if g[1] & names]
+            for g in merged:
+                groups.remove(g)
+            groups.append(([model] + [m for g in merged for m in g[0]], names.union(*[g[1] for g in merged])))
+
+        code = {m: i for i, m in enumerate(dict.fromkeys(face_mtls))}
+        face_codes = np.fromiter((code[m] for m in face_mtls), dtype=np.int64, count=len(face_mtls))
+        accepted = {}
+        for models, names in groups:
+            label = ", ".join(posixpath.basename(m) for m in sorted(models))
+            if max(len(self.placements[m]) for m in models) < MIN_PLACEMENTS:
+                continue
+            mask = np.isin(face_codes, [code[n] for n in names])
+            found = int(mask.sum())
+            expected = sum(len(self.placements[m]) * self.models[m].triangles for m in models)
+            if abs(found - expected) > TRIANGLE_TOLERANCE * expected:
+                print(f"- {label}: {found} baked triangles, {expected} expected, stays baked")
+                continue
+            baked = V[faces[mask][:, :, 0].ravel()]
+            placed = np.concatenate([self._world_positions(m, scale_factor, rotation) for m in models])
+            lo, hi = baked.min(axis=0), baked.max(axis=0)
+            tol = BOUNDS_TOLERANCE * np.linalg.norm(hi - lo) + 1e-4
+            if np.abs(placed.min(axis=0) - lo).max() > tol or np.abs(placed.max(axis=0) - hi).max() > tol:
+                print(f"- {label}: bounds don't match the baked copies, stays baked")
+                continue
+            keep &= ~mask
+            for m in models:
+                accepted[m] = materials[m]
+            print(f"- {label}: {sum(len(self.placements[m]) for m in models)} placements instanced, "
+                  f"{found} baked triangles dropped")
+        return keep, accepted
+
+    def _world_positions(self, model, scale_factor, rotation):
+        P = np.concatenate([p[1] for p in self.models[model].parts]) * scale_factor
+        t, R, s, sign = self._transforms(model, scale_factor, rotation)
+        return (np.einsum("nij,nkj->nki", R, P[None] * (s * sign)[:, None]) + t[:, None]).reshape(-1, 3)
+
+    # [(name, P, T, N, groups, translation, rotation, scale)] for obj2glb.build_gltf,
+    # one mesh per model and mirror variant
+    def meshes(self, materials, scale_factor, rotation):
+        out = []
+        for model, parts in sorted(materials.items()):
+            if model not in self.models:
+                continue
+            t, R, s, sign = self._transforms(model, scale_factor, rotation)
+            q = matrix_quaternions(R)
+            variants, inverse = np.unique(sign, axis=0, return_inverse=True)
+            for k, v in enumerate(variants):
+                sel = inverse.reshape(-1) == k
+                Ps, Ts, Ns, groups, base = [], [], [], {}, 0
+                for name, (_, P, T, N, tris) in zip(parts, self.models[model].parts):
+                    Ps.append(P * v * scale_factor)
+                    Ts.append(T)
+                    Ns.append(N * v)
+                    tris = tris + base
+                    if np.prod(v) < 0:
+                        tris = tris[:, [0, 2, 1]]
+                    groups[name] = np.concatenate([groups.get(name, np.zeros(0, dtype=np.uint32)),
+                                                   tris.ravel().astype(np.uint32)])
+                    base += len(P)
+                stem = posixpath.splitext(posixpath.basename(model))[0]
+                out.append((stem if k == 0 else f"{stem}_{k}",
+                            np.concatenate(Ps).astype(np.float32), np.concatenate(Ts).astype(np.float32),
+                            np.concatenate(Ns).astype(np.float32), groups,
+                            t[sel].astype(np.float32), q[sel].astype(np.float32), s[sel].astype(np.float32)))
+        return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lists the misc_model placements of a .map and their glTF models.")
+    ap.add_argument("mapfile", type=str, help="Path to the .map file")
+    args = ap.parse_args()
+
+    import bspreader
+    instances = MapInstances(args.mapfile, bspreader.game_dir_for_map(args.mapfile))
+    for model, placements in sorted(instances.placements.items(), key=lambda kv: -len(kv[1])):
+        loaded = instances.models.get(model)
+        tris = f"{loaded.triangles} triangles" if loaded else "not loaded"
+        print(f"- {len(placements):4d}x {model} ({tris})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Compiled keyword rules for the dcl.game/materials_*.py tables.
+# All alpha, emission and surface keywords go into one Aho-Corasick automaton,
+# so a material or texture name is resolved against every table in a single
+# pass over its characters. Per table the keyword listed first in the dict
+# wins, exactly like the former linear "for kw in table: if kw in name" scans.
+import argparse
+import os
+import sys
+from collections import deque
+
+ALPHA, EMISSION, SURFACE = range(3)
+
+
+class KeywordAutomaton:
+    # tables: lists of (keyword, value) in priority order
+    def __init__(self, tables):
+        self.ntables = len(tables)
+        goto = [{}]
+        best = [[None] * self.ntables]  # per state and table: (priority, keyword, value)
+        for t, entries in enumerate(tables):
+            for prio, (kw, value) in enumerate(entries):
+                s = 0
+                for ch in kw:
+                    nxt = goto[s].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[s][ch] = nxt
+                        goto.append({})
+                        best.append([None] * self.ntables)
+                    s = nxt
+                if best[s][t] is None:
+                    best[s][t] = (prio, kw, value)
+
+        # failure links in BFS order; every state inherits the outputs of its
+        # failure state, so a scan only looks at the state it is in
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            if s:
+                for t, hit in enumerate(best[fail[s]]):
+                    if hit is not None and (best[s][t] is None or hit[0] < best[s][t][0]):
+                        best[s][t] = hit
+            for ch, nxt in goto[s].items():
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f][ch] if s and ch in goto[f] else 0
+                queue.append(nxt)
+
+        self.goto = goto
+        self.fail = fail
+        self.best = [tuple(b) for b in best]
+
+    # returns per table (keyword, value) of the first-listed keyword contained in text, or None
+    def match(self, text):
+        goto, fail, best = self.goto, self.fail, self.best
+        found = list(best[0])
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            for t, hit in enumerate(best[s]):
+                if hit is not None and (found[t] is None or hit[0] < found[t][0]):
+                    found[t] = hit
+        return [None if hit is None else hit[1:] for hit in found]
+
+
+class MaterialRules:
+    def __init__(self, alpha_module, emission_module, surface_module):
+        self.default_metallic = float(getattr(surface_module, "default_metallic", 0.0))
+        self.default_roughness = float(getattr(surface_module, "default_roughness", 1.0))
+
+        # entries the old loops skipped (no float / no pair) are left out here
+        alpha = []
+        for kw, val in getattr(alpha_module, "alphakeywords", {}).items():
+            try:
+                alpha.append((kw, float(val)))
+            except Exception:
+                alpha.append((kw, 1.0))
+        emission = []
+        for kw, val in getattr(emission_module, "emissionkeywords", {}).items():
+            try:
+                emission.append((kw, float(val)))
+            except Exception:
+                continue
+        surface = []
+        for kw, pair in getattr(surface_module, "surfacekeywords", {}).items():
+            try:
+                m_val, r_val = pair
+            except Exception:
+                continue
+            surface.append((kw, (float(m_val), float(r_val))))
+
+        tables = [None] * 3
+        tables[ALPHA], tables[EMISSION], tables[SURFACE] = alpha, emission, surface
+        self.automaton = KeywordAutomaton(tables)
+
+    # returns [alpha, emission, surface] hits for a (lowercased) name
+    def match(self, text):
+        return self.automaton.match((text or "").lower())
+
+
+def load_rules():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../dcl.game")))
+    import materials_alpha
+    import materials_emission
+    import materials_surface
+    return MaterialRules(materials_alpha, materials_emission, materials_surface)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Shows which alpha/emission/surface rules match a material or texture name.")
+    ap.add_argument("names", type=str, nargs="+")
+    args = ap.parse_args()
+
+    rules = load_rules()
+    for name in args.names:
+        hits = rules.match(name)
+        print(f"- {name}")
+        for label, t in (("alpha", ALPHA), ("emission", EMISSION), ("surface", SURFACE)):
+            if hits[t] is not None:
+                print(f"    {label}: {hits[t][0]} -> {hits[t][1]}")
+
+
+if __name__ == "__main__":
+    main()
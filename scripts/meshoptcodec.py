@@ -0,0 +1,692 @@
+#!/usr/bin/env python3
+# EXT_meshopt_compression codecs in numpy / plain Python.
+# Vertex codec (bitstream version 0, ATTRIBUTES mode) and index codec
+# (version 1, TRIANGLES mode) as specified by the extension, plus decoders
+# used to verify the round trip (attributes bit-exact, triangles up to rotation).
+import argparse
+import struct
+
+import numpy as np
+
+EXTENSION = "EXT_meshopt_compression"
+
+# -------- vertex codec --------
+VERTEX_HEADER = 0xA0
+VERTEX_BLOCK_SIZE_BYTES = 8192
+VERTEX_BLOCK_MAX_SIZE = 256
+BYTE_GROUP_SIZE = 16
+TAIL_MAX_SIZE = 32
+
+
+def vertex_block_size(stride):
+    size = (VERTEX_BLOCK_SIZE_BYTES // stride) & ~(BYTE_GROUP_SIZE - 1)
+    return min(size, VERTEX_BLOCK_MAX_SIZE)
+
+
+def _zigzag8(d):
+    return (d << 1) ^ (d.view(np.int8) >> 7).view(np.uint8)
+
+
+def _unzigzag8(v):
+    return (v >> 1) ^ (0 - (v & 1)).astype(np.uint8)
+
+
+# splits the zigzagged deltas into (blocks, stride, groups, 16) byte groups;
+# the last (partial) block is returned separately since its group count differs
+def _block_groups(zz, count, stride):
+    block = vertex_block_size(stride)
+    full = count // block
+    parts = []
+    if full:
+        g = zz[:full * block].reshape(full, block // BYTE_GROUP_SIZE, BYTE_GROUP_SIZE, stride)
+        parts.append(g.transpose(0, 3, 1, 2))
+    rest = count - full * block
+    if rest:
+        aligned = -(-rest // BYTE_GROUP_SIZE) * BYTE_GROUP_SIZE
+        tail = np.zeros((aligned, stride), dtype=np.uint8)
+        tail[:rest] = zz[full * block:]
+        parts.append(tail.reshape(1, aligned // BYTE_GROUP_SIZE, BYTE_GROUP_SIZE, stride).transpose(0, 3, 1, 2))
+    return parts
+
+
+# encodes segments of byte groups, G has shape (segments, groups, 16)
+def _encode_segments(G):
+    nseg, gps = G.shape[:2]
+    flat = G.reshape(-1, BYTE_GROUP_SIZE)
+    ng = len(flat)
+
+    # same choice as meshoptimizer: 8 bits unless a smaller encoding is strictly shorter
+    best_size = np.full(ng, 16, dtype=np.int64)
+    mode = np.full(ng, 3, dtype=np.uint8)
+    for m, size in ((0, np.where(flat.any(axis=1), 1 << 30, 0)),
+                    (1, 4 + (flat >= 3).sum(axis=1)),
+                    (2, 8 + (flat >= 15).sum(axis=1))):
+        better = size < best_size
+        best_size[better] = size[better]
+        mode[better] = m
+
+    payload = np.zeros((ng, 24), dtype=np.uint8)
+    sel = mode == 3
+    payload[sel, :16] = flat[sel]
+    for m, bits, fixed in ((1, 2, 4), (2, 4, 8)):
+        sel = np.flatnonzero(mode == m)
+        if not len(sel):
+            continue
+        g = flat[sel]
+        sentinel = (1 << bits) - 1
+        enc = np.minimum(g, sentinel).reshape(len(sel), fixed, 8 // bits)
+        packed = np.zeros((len(sel), fixed), dtype=np.uint8)
+        for k in range(8 // bits):
+            packed = (packed << bits) | enc[:, :, k]
+        payload[sel, :fixed] = packed
+        esc = g >= sentinel
+        rows, cols = np.nonzero(esc)
+        dest = fixed + np.cumsum(esc, axis=1)[rows, cols] - 1
+        payload[sel[rows], dest] = g[rows, cols]
+
+    # header: 2 bits per group, (groups + 3) / 4 bytes per segment
+    hs = (gps + 3) // 4
+    modes = np.zeros((nseg, hs * 4), dtype=np.uint8)
+    modes[:, :gps] = mode.reshape(nseg, gps)
+    modes = modes.reshape(nseg, hs, 4)
+    header = modes[:, :, 0] | (modes[:, :, 1] << 2) | (modes[:, :, 2] << 4) | (modes[:, :, 3] << 6)
+
+    payload_flat = payload[np.arange(24) < best_size[:, None]]
+    plen = best_size.reshape(nseg, gps).sum(axis=1)
+    seg_len = hs + plen
+    seg_start = np.concatenate([[0], np.cumsum(seg_len)[:-1]])
+    pstart = np.concatenate([[0], np.cumsum(plen)[:-1]])
+
+    out = np.empty(int(seg_len.sum()), dtype=np.uint8)
+    out[(seg_start[:, None] + np.arange(hs)).ravel()] = header.ravel()
+    seg_of = np.repeat(np.arange(nseg), plen)
+    out[seg_start[seg_of] + hs + np.arange(len(payload_flat)) - pstart[seg_of]] = payload_flat
+    return out.tobytes()
+
+
+def encode_vertex_buffer(data, count, stride):
+    assert stride % 4 == 0 and 0 < stride <= 256
+    V = np.frombuffer(data, dtype=np.uint8, count=count * stride).reshape(count, stride)
+    out = [bytes([VERTEX_HEADER])]
+    if count:
+        prev = np.concatenate([V[:1], V[:-1]])
+        zz = _zigzag8(V - prev)
+        for G in _block_groups(zz, count, stride):
+            out.append(_encode_segments(G.reshape(-1, G.shape[2], BYTE_GROUP_SIZE)))
+    first = V[0].tobytes() if count else bytes(stride)
+    out.append(bytes(max(TAIL_MAX_SIZE - stride, 0)) + first)
+    return b"".join(out)
+
+
+# count of 2-bit / 4-bit fields equal to the sentinel per packed byte
+_ESC2 = np.array([sum(((b >> s) & 3) == 3 for s in (0, 2, 4, 6)) for b in range(256)], dtype=np.int64)
+_ESC4 = np.array([sum(((b >> s) & 15) == 15 for s in (0, 4)) for b in range(256)], dtype=np.int64)
+
+
+def decode_vertex_buffer(data, count, stride):
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) < 1 + stride or (buf[0] & 0xF0) != VERTEX_HEADER or (buf[0] & 0x0F) > 0:
+        raise ValueError("not a meshopt vertex buffer (version 0)")
+    esc2, esc4 = _ESC2.tolist(), _ESC4.tolist()
+    raw = buf.tolist()
+    block = vertex_block_size(stride)
+
+    # pass 1 (sequential): locate every byte group
+    offsets, modes = [], []
+    pos = 1
+    done = 0
+    while done < count:
+        n = min(block, count - done)
+        gps = -(-n // BYTE_GROUP_SIZE)
+        hs = (gps + 3) // 4
+        for _ in range(stride):
+            header = raw[pos:pos + hs]
+            pos += hs
+            for g in range(gps):
+                m = (header[g >> 2] >> ((g & 3) * 2)) & 3
+                offsets.append(pos)
+                modes.append(m)
+                if m == 1:
+                    pos += 4 + esc2[raw[pos]] + esc2[raw[pos + 1]] + esc2[raw[pos + 2]] + esc2[raw[pos + 3]]
+                elif m == 2:
+                    pos += 8 + sum(esc4[b] for b in raw[pos:pos + 8])
+                elif m == 3:
+                    pos += 16
+        done += n
+    tail = max(TAIL_MAX_SIZE, stride)
+    if len(raw) - pos != tail:
+        raise ValueError("meshopt vertex buffer has unexpected size")
+
+    # pass 2 (vectorized): expand the groups
+    offsets = np.asarray(offsets, dtype=np.int64)
+    modes = np.asarray(modes, dtype=np.uint8)
+    values = np.zeros((len(offsets), BYTE_GROUP_SIZE), dtype=np.uint8)
+    sel = np.flatnonzero(modes == 3)
+    values[sel] = buf[offsets[sel, None] + np.arange(16)]
+    for m, bits, fixed in ((1, 2, 4), (2, 4, 8)):
+        sel = np.flatnonzero(modes == m)
+        if not len(sel):
+            continue
+        packed = buf[offsets[sel, None] + np.arange(fixed)]
+        per = 8 // bits
+        shifts = np.arange(per - 1, -1, -1) * bits
+        vals = ((packed[:, :, None] >> shifts) & ((1 << bits) - 1)).reshape(len(sel), 16).astype(np.uint8)
+        esc = vals == (1 << bits) - 1
+        rows, cols = np.nonzero(esc)
+        src = offsets[sel[rows]] + fixed + np.cumsum(esc, axis=1)[rows, cols] - 1
+        vals[rows, cols] = buf[src]
+        values[sel] = vals
+
+    # regroup into (vertex, byte) order and undo the deltas
+    zz = np.empty((count, stride), dtype=np.uint8)
+    g0 = 0
+    done = 0
+    full = count // block
+    if full:
+        gps = block // BYTE_GROUP_SIZE
+        ng = full * stride * gps
+        zz[:full * block] = values[:ng].reshape(full, stride, gps * BYTE_GROUP_SIZE).transpose(0, 2, 1).reshape(-1, stride)
+        g0, done = ng, full * block
+    if done < count:
+        rest = count - done
+        gps = -(-rest // BYTE_GROUP_SIZE)
+        zz[done:] = values[g0:g0 + stride * gps].reshape(stride, gps * BYTE_GROUP_SIZE)[:, :rest].T
+
+    if not count:
+        return b""
+    first = buf[len(buf) - stride:]
+    deltas = _unzigzag8(zz)
+    deltas[0] = deltas[0] + first
+    return np.cumsum(deltas, axis=0, dtype=np.uint8).tobytes()
+
+
+# -------- index codec --------
+INDEX_HEADER = 0xE0
+INDEX_VERSION = 1
+CODE_AUX_TABLE = bytes([0x00, 0x76, 0x87, 0x56, 0x67, 0x78, 0xA9, 0x86,
+                        0x65, 0x89, 0x68, 0x98, 0x01, 0x69, 0x00, 0x00])
+_CODE_AUX_INDEX = {v: i for i, v in reversed(list(enumerate(CODE_AUX_TABLE[:14])))}
+_MASK32 = 0xFFFFFFFF
+
+
+# zigzag varints of the index deltas, with the raw codeaux bytes at their
+# place in the data stream (is_raw), packed in one go
+def _pack_data(values, is_raw):
+    d = np.asarray(values, dtype=np.int64) & _MASK32
+    raw = np.asarray(is_raw, dtype=bool)
+    v = ((d << 1) ^ np.where(d & 0x80000000, _MASK32, 0)) & _MASK32
+    v[raw] = d[raw]
+    n = np.ones(len(v), dtype=np.int64)
+    for limit in (1 << 7, 1 << 14, 1 << 21, 1 << 28):
+        n += ~raw & (v >= limit)
+    start = np.cumsum(n) - n
+    out = np.zeros(int(n.sum()), dtype=np.uint8)
+    for k in range(5):
+        sel = n > k
+        byte = (v[sel] >> (7 * k)) & 127
+        out[start[sel] + k] = byte | np.where(n[sel] > k + 1, 128, 0)
+    out[start[raw]] = v[raw]
+    return out.tobytes()
+
+
+# The fifo walk is the only sequential part and stays in Python: it emits one
+# code byte per triangle and the data items (index deltas and codeaux bytes),
+# which _pack_data turns into bytes. Edges are looked up as a << 32 | b keys
+# computed for all triangles up front. The fifos are "last push number" dicts,
+# position i in a fifo is pushes - number - 1; a ring of the last 16 pushes
+# removes older entries, so the dicts stay small and every hit is valid.
+# About 2-2.5 s per million triangles (decoding about 0.6 s).
+def encode_index_buffer(indices):
+    tri = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    i0, i1, i2 = tri[:, 0], tri[:, 1], tri[:, 2]
+    # flat int lists: nested ones cost more to build than the walk itself
+    columns = [x.tolist() for x in (i0, i1, i2, i0 << 32 | i1, i1 << 32 | i2, i2 << 32 | i0,
+                                     i1 << 32 | i0, i2 << 32 | i1, i0 << 32 | i2)]
+
+    codes = []
+    values = []
+    is_raw = []
+    edges = {}
+    edge_get = edges.get
+    edge_ring = [-1] * 16
+    edge_pushes = 0
+    verts = {}
+    vert_ring = [-1] * 16
+    vert_pushes = 0
+    nxt = 0
+    last = 0
+    fecmax = 13
+
+    for v0, v1, v2, f0, f1, f2, r0, r1, r2 in zip(*columns):
+        # edge fifo: first match scanning from the newest edge
+        fer = 64
+        n = edge_get(f0)
+        if n is not None:
+            fer = (edge_pushes - n - 1) << 2
+        n = edge_get(f1)
+        if n is not None and ((edge_pushes - n - 1) << 2 | 1) < fer:
+            fer = (edge_pushes - n - 1) << 2 | 1
+        n = edge_get(f2)
+        if n is not None and ((edge_pushes - n - 1) << 2 | 2) < fer:
+            fer = (edge_pushes - n - 1) << 2 | 2
+
+        if fer < 60:
+            rot = fer & 3
+            if rot == 0:
+                c, e_cb, e_ac = v2, r1, r2
+            elif rot == 1:
+                c, e_cb, e_ac = v0, r2, r0
+            else:
+                c, e_cb, e_ac = v1, r0, r1
+            n = verts.get(c)
+            fc = vert_pushes - n - 1 if n is not None else -1
+            if 1 <= fc < fecmax:
+                fec = fc
+            elif c == nxt:
+                fec = 0
+                nxt += 1
+            else:
+                fec = 15
+                if c + 1 == last:
+                    fec = 13
+                if c == last + 1:
+                    fec = 14
+                if fec == 15:
+                    values.append(c - last)
+                    is_raw.append(False)
+                last = c
+            codes.append((fer >> 2) << 4 | fec)
+            if fec == 0 or fec >= fecmax:
+                old = vert_ring[vert_pushes & 15]
+                if verts.get(old) == vert_pushes - 16:
+                    del verts[old]
+                vert_ring[vert_pushes & 15] = c
+                verts[c] = vert_pushes
+                vert_pushes += 1
+            for e in (e_cb, e_ac):
+                old = edge_ring[edge_pushes & 15]
+                if edges.get(old) == edge_pushes - 16:
+                    del edges[old]
+                edge_ring[edge_pushes & 15] = e
+                edges[e] = edge_pushes
+                edge_pushes += 1
+            continue
+
+        if v1 == nxt:
+            a, b, c, e_ba, e_cb, e_ac = v1, v2, v0, r1, r2, r0
+        elif v2 == nxt:
+            a, b, c, e_ba, e_cb, e_ac = v2, v0, v1, r2, r0, r1
+        else:
+            a, b, c, e_ba, e_cb, e_ac = v0, v1, v2, r0, r1, r2
+        reset = False
+        if a == 0 and b == 1 and c == 2 and nxt > 0:
+            reset = True
+            nxt = 0
+            verts = {}
+        n = verts.get(b)
+        fb = vert_pushes - n - 1 if n is not None else 16
+        n = verts.get(c)
+        fc = vert_pushes - n - 1 if n is not None else 16
+        if a == nxt:
+            fea = 0
+            nxt += 1
+        else:
+            fea = 15
+        if fb < 14:
+            feb = fb + 1
+        elif b == nxt:
+            feb = 0
+            nxt += 1
+        else:
+            feb = 15
+        if fc < 14:
+            fec = fc + 1
+        elif c == nxt:
+            fec = 0
+            nxt += 1
+        else:
+            fec = 15
+        codeaux = (feb << 4) | fec
+        aux = _CODE_AUX_INDEX.get(codeaux, -1)
+        if fea == 0 and 0 <= aux < 14 and not reset:
+            codes.append(0xF0 | aux)
+        else:
+            codes.append(0xF0 | 14 | fea)
+            values.append(codeaux)
+            is_raw.append(True)
+        if fea == 15:
+            values.append(a - last)
+            is_raw.append(False)
+            last = a
+        if feb == 15:
+            values.append(b - last)
+            is_raw.append(False)
+            last = b
+        if fec == 15:
+            values.append(c - last)
+            is_raw.append(False)
+            last = c
+        for v, fe in ((a, fea), (b, feb), (c, fec)):
+            if fe == 0 or fe == 15:
+                old = vert_ring[vert_pushes & 15]
+                if verts.get(old) == vert_pushes - 16:
+                    del verts[old]
+                vert_ring[vert_pushes & 15] = v
+                verts[v] = vert_pushes
+                vert_pushes += 1
+        for e in (e_ba, e_cb, e_ac):
+            old = edge_ring[edge_pushes & 15]
+            if edges.get(old) == edge_pushes - 16:
+                del edges[old]
+            edge_ring[edge_pushes & 15] = e
+            edges[e] = edge_pushes
+            edge_pushes += 1
+
+    return (bytes([INDEX_HEADER | INDEX_VERSION]) + bytes(codes) + _pack_data(values, is_raw)
+            + CODE_AUX_TABLE)
+
+
+def _decode_index(data, pos, last):
+    lead = data[pos]
+    pos += 1
+    if lead < 128:
+        v = lead
+    else:
+        v = lead & 127
+        shift = 7
+        for _ in range(4):
+            group = data[pos]
+            pos += 1
+            v |= (group & 127) << shift
+            shift += 7
+            if group < 128:
+                break
+    d = (v >> 1) ^ (_MASK32 if v & 1 else 0)
+    return (last + d) & _MASK32, pos
+
+
+def decode_index_buffer(data, index_count):
+    if len(data) < 1 + index_count // 3 + 16 or (data[0] & 0xF0) != INDEX_HEADER:
+        raise ValueError("not a meshopt index buffer")
+    version = data[0] & 0x0F
+    if version > 1:
+        raise ValueError(f"unsupported meshopt index version {version}")
+    fecmax = 13 if version >= 1 else 15
+    out = [0] * index_count
+    edge_a = [_MASK32] * 16
+    edge_b = [_MASK32] * 16
+    vfifo = [_MASK32] * 16
+    eo = vo = 0
+    nxt = last = 0
+    code = 1
+    pos = 1 + index_count // 3
+    end = len(data) - 16
+    table = data[end:]
+
+    for i in range(0, index_count, 3):
+        if pos > end:
+            raise ValueError("meshopt index buffer is truncated")
+        codetri = data[code]
+        code += 1
+        if codetri < 0xF0:
+            fe = codetri >> 4
+            a = edge_a[(eo - 1 - fe) & 15]
+            b = edge_b[(eo - 1 - fe) & 15]
+            fec = codetri & 15
+            if fec < fecmax:
+                if fec == 0:
+                    c = nxt
+                    nxt += 1
+                    vfifo[vo] = c
+                    vo = (vo + 1) & 15
+                else:
+                    c = vfifo[(vo - 1 - fec) & 15]
+            else:
+                if fec != 15:
+                    c = (last + (fec - (fec ^ 3))) & _MASK32
+                else:
+                    c, pos = _decode_index(data, pos, last)
+                last = c
+                vfifo[vo] = c
+                vo = (vo + 1) & 15
+            out[i], out[i + 1], out[i + 2] = a, b, c
+            edge_a[eo], edge_b[eo] = c, b
+            eo = (eo + 1) & 15
+            edge_a[eo], edge_b[eo] = a, c
+            eo = (eo + 1) & 15
+        else:
+            if codetri < 0xFE:
+                codeaux = table[codetri & 15]
+                feb, fec = codeaux >> 4, codeaux & 15
+                a = nxt
+                nxt += 1
+                b = nxt if feb == 0 else vfifo[(vo - feb) & 15]
+                nxt += feb == 0
+                c = nxt if fec == 0 else vfifo[(vo - fec) & 15]
+                nxt += fec == 0
+                push_b, push_c = feb == 0, fec == 0
+            else:
+                codeaux = data[pos]
+                pos += 1
+                fea = 0 if codetri == 0xFE else 15
+                feb, fec = codeaux >> 4, codeaux & 15
+                if codeaux == 0:
+                    nxt = 0
+                a = 0
+                if fea == 0:
+                    a = nxt
+                    nxt += 1
+                if feb == 0:
+                    b = nxt
+                    nxt += 1
+                else:
+                    b = vfifo[(vo - feb) & 15]
+                if fec == 0:
+                    c = nxt
+                    nxt += 1
+                else:
+                    c = vfifo[(vo - fec) & 15]
+                if fea == 15:
+                    a, pos = _decode_index(data, pos, last)
+                    last = a
+                if feb == 15:
+                    b, pos = _decode_index(data, pos, last)
+                    last = b
+                if fec == 15:
+                    c, pos = _decode_index(data, pos, last)
+                    last = c
+                push_b, push_c = feb in (0, 15), fec in (0, 15)
+            out[i], out[i + 1], out[i + 2] = a, b, c
+            vfifo[vo] = a
+            vo = (vo + 1) & 15
+            if push_b:
+                vfifo[vo] = b
+                vo = (vo + 1) & 15
+            if push_c:
+                vfifo[vo] = c
+                vo = (vo + 1) & 15
+            for e in ((b, a), (c, b), (a, c)):
+                edge_a[eo], edge_b[eo] = e
+                eo = (eo + 1) & 15
+
+    if pos != end:
+        raise ValueError("meshopt index buffer has unexpected size")
+    return out
+
+
+# -------- glTF integration --------
+def _component_size(component_type):
+    return {5120: 1, 5121: 1, 5122: 2, 5123: 2, 5125: 4, 5126: 4}[component_type]
+
+
+def _type_size(accessor):
+    return {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4}.get(accessor.type, 0) * _component_size(accessor.componentType)
+
+
+# picks the views of mesh attributes (ATTRIBUTES) and triangle indices (TRIANGLES)
+def _compressible_views(gltf):
+    views = {}
+    skip = set()
+    for mesh in gltf.meshes or []:
+        for prim in mesh.primitives:
+            attrs = prim.attributes if isinstance(prim.attributes, dict) else vars(prim.attributes)
+            for acc_idx in attrs.values():
+                if acc_idx is None:
+                    continue
+                acc = gltf.accessors[acc_idx]
+                if acc.bufferView is None or acc.sparse is not None:
+                    continue
+                bv = gltf.bufferViews[acc.bufferView]
+                stride = bv.byteStride or _type_size(acc)
+                if stride % 4 or stride > 256 or bv.byteLength % stride:
+                    skip.add(acc.bufferView)
+                    continue
+                views.setdefault(acc.bufferView, ("ATTRIBUTES", stride, bv.byteLength // stride))
+            if prim.indices is not None:
+                acc = gltf.accessors[prim.indices]
+                if acc.bufferView is None:
+                    continue
+                size = _component_size(acc.componentType)
+                length = gltf.bufferViews[acc.bufferView].byteLength
+                if prim.mode not in (None, 4) or size == 1 or length % (3 * size):
+                    skip.add(acc.bufferView)
+                    continue
+                views.setdefault(acc.bufferView, ("TRIANGLES", size, length // size))
+    for idx in skip:
+        views.pop(idx, None)
+    for idx, (mode, _, _) in list(views.items()):
+        if mode == "TRIANGLES" and any(
+                a.bufferView == idx and a.componentType not in (5123, 5125) for a in gltf.accessors):
+            views.pop(idx)
+    return views
+
+
+def encode_view(data, mode, stride, count):
+    if mode == "ATTRIBUTES":
+        return encode_vertex_buffer(data, count, stride)
+    dtype = np.uint16 if stride == 2 else np.uint32
+    return encode_index_buffer(np.frombuffer(data, dtype=dtype, count=count))
+
+
+def decode_view(encoded, mode, stride, count):
+    if mode == "ATTRIBUTES":
+        return decode_vertex_buffer(encoded, count, stride)
+    dtype = np.uint16 if stride == 2 else np.uint32
+    return np.asarray(decode_index_buffer(encoded, count), dtype=dtype).tobytes()
+
+
+# the index codec keeps the winding but may rotate each triangle, so TRIANGLES
+# views are compared per triangle up to rotation
+def same_view(decoded, data, mode, stride):
+    if mode == "ATTRIBUTES":
+        return decoded == bytes(data)
+    dtype = np.uint16 if stride == 2 else np.uint32
+    a = np.frombuffer(decoded, dtype=dtype).reshape(-1, 3)
+    b = np.frombuffer(data, dtype=dtype).reshape(-1, 3)
+    if a.shape != b.shape:
+        return False
+    return bool(((a == b).all(axis=1) | (a == b[:, [1, 2, 0]]).all(axis=1)
+                 | (a == b[:, [2, 0, 1]]).all(axis=1)).all())
+
+
+# compresses geometry bufferViews: compressed data goes to buffer 0 (the GLB
+# BIN chunk), the views themselves point into an uri-less fallback buffer 1
+def compress_gltf_views(gltf, verify=False):
+    from pygltflib import Buffer
+    blob = gltf.binary_blob() or b""
+    targets = _compressible_views(gltf)
+    chunks = []
+    off0 = off1 = 0
+    raw_total = packed_total = 0
+
+    for idx, bv in enumerate(gltf.bufferViews):
+        start = bv.byteOffset or 0
+        data = blob[start:start + bv.byteLength]
+        target = targets.get(idx)
+        if target is not None:
+            mode, stride, count = target
+            enc = encode_view(data, mode, stride, count)
+            if verify and not same_view(decode_view(enc, mode, stride, count), data, mode, stride):
+                raise RuntimeError(f"meshopt round trip failed for bufferView {idx} ({mode})")
+            raw_total += len(data)
+            packed_total += len(enc)
+            bv.extensions = dict(bv.extensions or {})
+            bv.extensions[EXTENSION] = {"buffer": 0, "byteOffset": off0, "byteLength": len(enc),
+                                        "byteStride": stride, "count": count, "mode": mode}
+            bv.buffer = 1
+            bv.byteOffset = off1
+            off1 += bv.byteLength + (-bv.byteLength % 4)
+            data = enc
+        else:
+            bv.byteOffset = off0
+        chunks.append(data)
+        chunks.append(b"\x00" * (-len(data) % 4))
+        off0 += len(data) + (-len(data) % 4)
+
+    if not targets:
+        return gltf
+    gltf.set_binary_blob(b"".join(chunks))
+    gltf.buffers = [Buffer(byteLength=off0),
+                    Buffer(byteLength=off1, extensions={EXTENSION: {"fallback": True}})]
+    for name in ("extensionsUsed", "extensionsRequired"):
+        used = list(getattr(gltf, name) or [])
+        if EXTENSION not in used:
+            used.append(EXTENSION)
+        setattr(gltf, name, used)
+    print(f"- Meshopt: {len(targets)} geometry views {raw_total} -> {packed_total} bytes"
+          + (" (verified)" if verify else ""))
+    return gltf
+
+
+# returns {bufferView index: decoded bytes} for every compressed view
+def decode_gltf_views(gltf):
+    blob = gltf.binary_blob() or b""
+    decoded = {}
+    for idx, bv in enumerate(gltf.bufferViews or []):
+        ext = (bv.extensions or {}).get(EXTENSION)
+        if ext is None:
+            start = bv.byteOffset or 0
+            decoded[idx] = blob[start:start + bv.byteLength]
+            continue
+        start = ext.get("byteOffset", 0)
+        enc = blob[start:start + ext["byteLength"]]
+        decoded[idx] = decode_view(enc, ext["mode"], ext["byteStride"], ext["count"])
+    return decoded
+
+
+# pygltflib's save_binary flattens every buffer into one, which would break the
+# fallback buffer layout; multi-buffer GLBs are written as they are
+def save_glb(gltf, path):
+    if len(gltf.buffers or []) <= 1:
+        return gltf.save_binary(path)
+    blob = gltf.binary_blob() or b""
+    blob += b"\x00" * (-len(blob) % 4)
+    gltf.buffers[0].byteLength = len(blob)
+    js = gltf.gltf_to_json(separators=(",", ":"), indent=None).encode("utf-8")
+    js += b" " * (-len(js) % 4)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(js) + 8 + len(blob)))
+        f.write(struct.pack("<I4s", len(js), b"JSON"))
+        f.write(js)
+        f.write(struct.pack("<I4s", len(blob), b"BIN\x00"))
+        f.write(blob)
+    return True
+
+
+def main():
+    from pygltflib import GLTF2
+    ap = argparse.ArgumentParser(description="Decodes all EXT_meshopt_compression views of a GLB to check them.")
+    ap.add_argument("glb", type=str)
+    args = ap.parse_args()
+
+    gltf = GLTF2().load(args.glb)
+    decoded = decode_gltf_views(gltf)
+    n = sum(1 for bv in gltf.bufferViews if EXTENSION in (bv.extensions or {}))
+    for idx, bv in enumerate(gltf.bufferViews):
+        if EXTENSION in (bv.extensions or {}) and len(decoded[idx]) != bv.byteLength:
+            raise SystemExit(f"- bufferView {idx}: decoded {len(decoded[idx])} bytes, expected {bv.byteLength}")
+    print(f"- {n} compressed bufferViews decoded")
+
+
+if __name__ == "__main__":
+    main()
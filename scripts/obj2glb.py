@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
-import argparse, os, mimetypes
+import argparse, hashlib, os, mimetypes, re
 import numpy as np
 import sys
-from collections import defaultdict
+from collections import Counter
 from pygltflib import (
     GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive,
-    PbrMetallicRoughness, Material, Image, Texture, TextureInfo
+    PbrMetallicRoughness, Material, Image, Texture, TextureInfo, OcclusionTextureInfo
 )
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,6 +16,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../dcl.
 import materials_alpha
 import materials_emission
 import materials_surface
+import materialrules
+import meshoptcodec
 
 
 # -------- helpers --------
@@ -49,130 +51,366 @@ def normalize_image_name(texpath: str, mime: str) -> str:
 
 
 # --- MTL Parser with Emission Support ---
-def parse_mtl(mtl_path):
+def parse_mtl_lines(lines):
     props = {}
     cur = None
+    for raw in lines:
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.lower().startswith("newmtl "):
+            cur = line.split(maxsplit=1)[1]
+            if cur not in props:
+                props[cur] = {
+                    "map_Kd": "", "Kd": None,
+                    "map_Ke": "", "Ke": None
+                }
+        elif cur:
+            ll = line.lower()
+            if ll.startswith("map_kd "):
+                props[cur]["map_Kd"] = line.split(maxsplit=1)[1]
+                #print("Found " + props[cur]["map_Kd"])
+            elif ll.startswith("kd "):
+                p = line.split()
+                try:
+                    props[cur]["Kd"] = [float(p[1]), float(p[2]), float(p[3])]
+                except:
+                    pass
+            elif ll.startswith("map_ke "):
+                props[cur]["map_Ke"] = line.split(maxsplit=1)[1]
+            elif ll.startswith("ke "):
+                p = line.split()
+                try:
+                    props[cur]["Ke"] = [float(p[1]), float(p[2]), float(p[3])]
+                except:
+                    pass
+    return props
+
+
+def parse_mtl(mtl_path):
     try:
         with open(mtl_path, "r", encoding="utf-8", errors="ignore") as f:
-            for raw in f:
-                line = raw.strip()
-                if not line or line.startswith("#"):
-                    continue
-                if line.lower().startswith("newmtl "):
-                    cur = line.split(maxsplit=1)[1]
-                    if cur not in props:
-                        props[cur] = {
-                            "map_Kd": "", "Kd": None,
-                            "map_Ke": "", "Ke": None
-                        }
-                elif cur:
-                    ll = line.lower()
-                    if ll.startswith("map_kd "):
-                        props[cur]["map_Kd"] = line.split(maxsplit=1)[1]
-                        #print("Found " + props[cur]["map_Kd"])
-                    elif ll.startswith("kd "):
-                        p = line.split()
-                        try:
-                            props[cur]["Kd"] = [float(p[1]), float(p[2]), float(p[3])]
-                        except:
-                            pass
-                    elif ll.startswith("map_ke "):
-                        props[cur]["map_Ke"] = line.split(maxsplit=1)[1]
-                    elif ll.startswith("ke "):
-                        p = line.split()
-                        try:
-                            props[cur]["Ke"] = [float(p[1]), float(p[2]), float(p[3])]
-                        except:
-                            pass
+            return parse_mtl_lines(f)
     except FileNotFoundError:
-        pass
-    return props
+        return {}
+
+
+# mtllib files are relative to the OBJ; preloaded maps path -> MTL lines
+def load_mtl_props(mtllibs, obj_dir, preloaded=None):
+    mtl_props = {}
+    preloaded = {os.path.normcase(os.path.abspath(k)): v for k, v in (preloaded or {}).items()}
+    for mtl in mtllibs:
+        mtl_path = os.path.join(obj_dir, mtl)
+        lines = preloaded.get(os.path.normcase(os.path.abspath(mtl_path)))
+        if lines is not None:
+            mtl_props.update(parse_mtl_lines(lines))
+        else:
+            mtl_props.update(parse_mtl(mtl_path))
+        #print(mtl_path)
+    return mtl_props
 
 
 # -------- OBJ loader with VN support --------
-def load_obj_with_uvs(path):
-    V, VT, VN = [], [], []
-    mtllibs, cur_mtl = [], None
-    faces_triples = []
-    face_mtls = []
-
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            s = line.lstrip()
-            if s.startswith("mtllib "):
-                mtllibs.extend(s.strip().split()[1:])
-            elif s.startswith("usemtl "):
-                cur_mtl = s.strip().split()[1]
-            elif s.startswith("v "):
-                p = s.strip().split()
-                V.append([float(p[1]), float(p[2]), float(p[3])])
-            elif s.startswith("vt "):
-                p = s.strip().split()
-                u = float(p[1])
-                v = 1.0 - float(p[2])   # glTF V inverted
-                VT.append([u, v])
-            elif s.startswith("vn "):
-                p = s.strip().split()
-                VN.append([float(p[1]), float(p[2]), float(p[3])])
-            elif s.startswith("f "):
-                parts = s.strip().split()[1:]
-                tri = []
-                for tok in parts:
-                    a = tok.split("/")
-                    v  = int(a[0]) - 1 if a[0] else -1
-                    vt = int(a[1]) - 1 if len(a) > 1 and a[1] else -1
-                    vn = int(a[2]) - 1 if len(a) > 2 and a[2] else -1
-                    tri.append((v, vt, vn))
-                if len(tri) == 3:
-                    faces_triples.append(tri); face_mtls.append(cur_mtl)
-                elif len(tri) == 4:
-                    faces_triples.append([tri[0], tri[1], tri[2]]); face_mtls.append(cur_mtl)
-                    faces_triples.append([tri[0], tri[2], tri[3]]); face_mtls.append(cur_mtl)
-
-    V  = np.array(V, dtype=np.float32) if V  else np.zeros((0,3), np.float32)
-    VT = np.array(VT, dtype=np.float32) if VT else np.zeros((0,2), np.float32)
-    VN = np.array(VN, dtype=np.float32) if VN else np.zeros((0,3), np.float32)
-    return V, VT, VN, faces_triples, face_mtls, mtllibs
+OBJ_CHUNK_SIZE = 2 * 1024 * 1024
+
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[list(b" \t\r\n\v\f")] = True
+_LEADING_WS = re.compile(rb"(?m)^[ \t\r\v\f]+")
+
+
+class GrowBuffer:
+    """Append-only NumPy row buffer which doubles its capacity when full."""
+
+    def __init__(self, row_shape, dtype, capacity=4096):
+        self.data = np.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self.size = 0
+
+    def extend(self, rows):
+        end = self.size + len(rows)
+        if end > len(self.data):
+            grown = np.empty((max(end, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = rows
+        self.size = end
+
+    def finish(self):
+        self.data.resize((self.size,) + self.data.shape[1:], refcheck=False)
+        return self.data
+
+
+def _ranges(starts, lengths):
+    # concatenated np.arange(s, s + n) for every (s, n) pair
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _parse_numbers(text, dtype):
+    # parses all numbers of the selected lines in one go, prefixes must be blanked
+    try:
+        return np.fromstring(text, dtype=dtype, sep=" ")
+    except ValueError:
+        return None
+
+
+def _parse_vertex_lines(lines, width):
+    # exact per line fallback, same rules as the fast path callers
+    rows = []
+    for s in lines:
+        p = s.strip().split()
+        if width == 2:
+            rows.append([float(p[1]), 1.0 - float(p[2])])   # glTF V inverted
+        else:
+            rows.append([float(p[1]), float(p[2]), float(p[3])])
+    return np.array(rows, dtype=np.float32).reshape(-1, width)
+
+
+def _parse_face_line(s):
+    tri = []
+    for tok in s.strip().split()[1:]:
+        a = tok.split("/")
+        v  = int(a[0]) - 1 if a[0] else -1
+        vt = int(a[1]) - 1 if len(a) > 1 and a[1] else -1
+        vn = int(a[2]) - 1 if len(a) > 2 and a[2] else -1
+        tri.append((v, vt, vn))
+    return tri
+
+
+def _parse_obj_chunk(chunk, state):
+    # chunk holds complete lines only, each one terminated by a newline
+    raw = np.frombuffer(chunk + b"\0\0\0", dtype=np.uint8)
+    ends = np.flatnonzero(raw == 10)
+    if not len(ends):
+        return
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    c0, c1, c2 = raw[starts], raw[starts + 1], raw[starts + 2]
+
+    # indented lines are rare, strip them once and start over
+    if np.any(_WHITESPACE[c0] & (c0 != 10)):
+        stripped = _LEADING_WS.sub(b"", chunk)
+        if stripped != chunk:
+            return _parse_obj_chunk(stripped, state)
+
+    # tokens per line (a token starts after whitespace)
+    n = len(chunk)
+    ws = _WHITESPACE[raw]
+    tok_start = ~ws
+    tok_start[1:] &= ws[:-1]
+    ntok = np.add.reduceat(tok_start[:n], starts, dtype=np.int64)
+
+    def text(i):
+        return chunk[starts[i]:ends[i]].decode("utf-8", errors="ignore")
+
+    def payload(lines):
+        # bytes of the selected lines (newlines included) as one buffer
+        sel = np.zeros(len(starts), dtype=bool)
+        sel[lines] = True
+        return work[:n][np.repeat(sel, ends - starts + 1)]
+
+    work = raw.copy()
+
+    # --- v / vt / vn ---
+    for prefix, width, ncols, buf in (
+        (b"v ", 3, 4, state["V"]), (b"vt ", 2, 3, state["VT"]), (b"vn ", 3, 4, state["VN"])
+    ):
+        sel = (c0 == prefix[0]) & (c1 == prefix[1])
+        if len(prefix) == 3:
+            sel &= (c2 == prefix[2])
+        lines = np.flatnonzero(sel)
+        if not len(lines):
+            continue
+        rows = None
+        if np.all(ntok[lines] == ncols):
+            work[starts[lines]] = 32
+            work[starts[lines] + 1] = 32
+            vals = _parse_numbers(payload(lines).tobytes(), np.float64)
+            if vals is not None and len(vals) == len(lines) * width:
+                rows = vals.reshape(-1, width)
+                if width == 2:
+                    rows[:, 1] = 1.0 - rows[:, 1]   # glTF V inverted
+        if rows is None:
+            rows = _parse_vertex_lines([text(i) for i in lines], width)
+        buf.extend(rows)
+
+    # --- faces ---
+    flines = np.flatnonzero((c0 == ord("f")) & (c1 == 32))
+    nfaces_before = state["faces"].size
+    if len(flines):
+        corners = ntok[flines] - 1
+        slash = raw[:n + 1] == ord("/")
+        slashes = np.add.reduceat(slash[:n], starts, dtype=np.int64)[flines]
+        doubles = np.add.reduceat(slash[:n] & slash[1:], starts, dtype=np.int64)[flines]
+
+        # one face per triangle, two per quad, other polygons are skipped
+        nout = np.where(corners == 3, 1, np.where(corners == 4, 2, 0))
+        corner_off = np.cumsum(corners) - corners
+        face_off = np.cumsum(nout) - nout
+        all_corners = np.full((int(corners.sum()), 3), -1, dtype=np.int64)
+
+        work[starts[flines]] = 32
+        parsed = np.zeros(len(flines), dtype=bool)
+        # (selector, ints per corner, columns) for the uniform corner layouts
+        layouts = (
+            ((slashes == 2 * corners) & (doubles == 0), 3, (0, 1, 2)),   # v/vt/vn
+            ((slashes == 2 * corners) & (doubles == corners), 2, (0, 2)),  # v//vn
+            ((slashes == corners) & (doubles == 0), 2, (0, 1)),          # v/vt
+            (slashes == 0, 1, (0,)),                                     # v
+        )
+        for sel, per_corner, cols in layouts:
+            idx = np.flatnonzero(sel & ~parsed)
+            if not len(idx):
+                continue
+            g = payload(flines[idx])
+            g[g == ord("/")] = 32
+            vals = _parse_numbers(g.tobytes(), np.int64)
+            if vals is None or len(vals) != corners[idx].sum() * per_corner:
+                continue
+            slots = _ranges(corner_off[idx], corners[idx])
+            all_corners[np.ix_(slots, cols)] = vals.reshape(-1, per_corner) - 1
+            parsed[idx] = True
+        for i in np.flatnonzero(~parsed):
+            tri = _parse_face_line(text(flines[i]))
+            if len(tri) in (3, 4):
+                all_corners[corner_off[i]:corner_off[i] + corners[i]] = tri
+
+        tri_idx = np.empty((int(nout.sum()), 3), dtype=np.int64)
+        first = face_off[nout > 0]
+        o = corner_off[nout > 0]
+        tri_idx[first] = o[:, None] + [0, 1, 2]
+        quads = nout == 2
+        tri_idx[face_off[quads] + 1] = corner_off[quads][:, None] + [0, 2, 3]
+        state["faces"].extend(all_corners[tri_idx].astype(np.int32))
+
+    # --- usemtl / mtllib, in line order so faces get the active material ---
+    face_mtls = state["face_mtls"]
+    cur = state["cur_mtl"]
+    pos = 0
+    face_ends = np.cumsum(nout) if len(flines) else flines
+    for i in np.flatnonzero((c0 == ord("u")) | (c0 == ord("m"))):
+        s = text(i)
+        if s.startswith("usemtl "):
+            k = int(np.searchsorted(flines, i))
+            upto = int(face_ends[k - 1]) if k else 0
+            face_mtls.extend([cur] * (upto - pos))
+            pos = upto
+            cur = s.strip().split()[1]
+        elif s.startswith("mtllib "):
+            state["mtllibs"].extend(s.strip().split()[1:])
+    face_mtls.extend([cur] * (state["faces"].size - nfaces_before - pos))
+    state["cur_mtl"] = cur
+
+
+def load_obj_with_uvs(path, chunk_size=OBJ_CHUNK_SIZE):
+    # reads the OBJ in large chunks and parses every line kind in bulk,
+    # faces come back as (n, 3, 3) int32 array of (v, vt, vn) corners
+    state = {
+        "V": GrowBuffer((3,), np.float32), "VT": GrowBuffer((2,), np.float32),
+        "VN": GrowBuffer((3,), np.float32), "faces": GrowBuffer((3, 3), np.int32),
+        "face_mtls": [], "mtllibs": [], "cur_mtl": None,
+    }
+
+    with open(path, "rb") as f:
+        rest = b""
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            rest = block[cut:]
+            if cut:
+                _parse_obj_chunk(block[:cut], state)
+        if rest:
+            _parse_obj_chunk(rest + b"\n", state)
+
+    V = state["V"].finish()
+    VT = state["VT"].finish()
+    VN = state["VN"].finish()
+    faces = state["faces"].finish()
+    return V, VT, VN, faces, state["face_mtls"], state["mtllibs"]
+
+
+# -------- BSP loader --------
+# same arrays as load_obj_with_uvs for the OBJ q3map2 would write, plus the
+# materials of the matching MTL (one per shader, image paths absolute)
+def load_bsp(path):
+    import bspreader
+    with bspreader.BSPFile(path) as bsp:
+        V, VT, VN, faces, face_mtls, _ = bsp.obj_arrays()
+        names = bsp.shader_names()
+    mtl_props = bspreader.shader_materials(names, bspreader.game_dir_for_map(path))
+    return V, VT, VN, faces, face_mtls, mtl_props
 
 
 # -------- unify vertices (position, uv, normal) --------
+def _first_seen_unique(keys):
+    # unique rows/keys numbered in order of first appearance
+    # returns (corner -> unified index, unified -> first corner)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], first[order]
+
+
+def group_faces_by_material(face_mtls):
+    # stable per-material face order, materials in order of first use
+    # returns {material: face indices}
+    mtls = np.empty(len(face_mtls), dtype=object)
+    mtls[:] = face_mtls
+    if not len(mtls):
+        return {}
+    run_start = np.flatnonzero(np.r_[True, mtls[1:] != mtls[:-1]])
+    ids = {}
+    run_ids = np.array([ids.setdefault(m, len(ids)) for m in mtls[run_start]], dtype=np.int64)
+    face_ids = np.repeat(run_ids, np.diff(np.r_[run_start, len(mtls)]))
+    order = np.argsort(face_ids, kind="stable")
+    bounds = np.cumsum(np.bincount(face_ids, minlength=len(ids)))
+    return {m: part for m, part in zip(ids, np.split(order, bounds[:-1]))}
+
+
 def build_unified_vertices(V, VT, VN, faces_triples, face_mtls):
     has_uv = VT.shape[0] > 0
     has_n  = VN.shape[0] > 0
-    remap = {}
-    positions = []
-    texcoords = []
-    normals = []
-    groups = defaultdict(list)
-
-    def key(v, vt, vn):
-        return (
-            v,
-            vt if has_uv and vt >= 0 else -1,
-            vn if has_n and vn >= 0 else -1
-        )
 
-    for tri, mtl in zip(faces_triples, face_mtls):
-        tri_idx = []
-        for (v, vt, vn) in tri:
-            k = key(v, vt, vn)
-            if k not in remap:
-                remap[k] = len(positions)
-                positions.append(V[v] if v >= 0 else [0, 0, 0])
-                if has_uv and vt >= 0:
-                    texcoords.append(VT[vt])
-                else:
-                    texcoords.append([0.0, 0.0])
-                if has_n and vn >= 0:
-                    normals.append(VN[vn])
-                else:
-                    normals.append([0.0, 1.0, 0.0])
-            tri_idx.append(remap[k])
-        groups[mtl].extend(tri_idx)
-
-    P = np.array(positions, dtype=np.float32)
-    T = np.array(texcoords, dtype=np.float32) if has_uv else None
-    N = np.array(normals, dtype=np.float32) if has_n else None
+    corners = np.asarray(faces_triples, dtype=np.int64).reshape(-1, 3).copy()
+    v, vt, vn = corners[:, 0], corners[:, 1], corners[:, 2]
+    if has_uv:
+        vt[vt < 0] = -1
+    else:
+        vt[:] = -1
+    if has_n:
+        vn[vn < 0] = -1
+    else:
+        vn[:] = -1
+
+    # pack (v, vt, vn) into one int64 key if the ranges allow it
+    lo = corners.min(axis=0) if len(corners) else np.zeros(3, dtype=np.int64)
+    span = (corners.max(axis=0) - lo + 1) if len(corners) else np.ones(3, dtype=np.int64)
+    if float(span[0]) * float(span[1]) * float(span[2]) < 2**62:
+        keys = ((v - lo[0]) * span[1] + (vt - lo[1])) * span[2] + (vn - lo[2])
+    else:
+        keys = corners.view([("", corners.dtype)] * 3).ravel()
+    remap, src = _first_seen_unique(keys)
+    v, vt, vn = v[src], vt[src], vn[src]
+
+    P = np.zeros((len(src), 3), dtype=np.float32)
+    P[v >= 0] = V[v[v >= 0]]
+    T = N = None
+    if has_uv:
+        T = np.zeros((len(src), VT.shape[1]), dtype=np.float32)
+        T[vt >= 0] = VT[vt[vt >= 0]]
+    if has_n:
+        N = np.zeros((len(src), 3), dtype=np.float32)
+        N[:] = [0.0, 1.0, 0.0]
+        N[vn >= 0] = VN[vn[vn >= 0]]
+
+    tris = remap.astype(np.uint32).reshape(-1, 3)
+    groups = {m: tris[f].ravel() for m, f in group_faces_by_material(face_mtls).items()}
     return P, T, N, groups
 
 
@@ -223,16 +461,17 @@ def compute_weighted_normals_face_area_keep_sharp(
     weld_tol=1e-2, strength=0.5,
     sharp_angle_deg=30.0
 ):
-    import numpy as np
-
     cos_sharp = np.cos(np.radians(sharp_angle_deg))
+    Vcount = len(P)
+    outN = np.zeros((Vcount, 3), dtype=np.float32)
 
     # --- Alle Faces sammeln ---
-    all_faces = []
-    for idxs in groups.values():
-        tris = np.asarray(idxs, dtype=np.int32).reshape(-1, 3)
-        all_faces.append(tris)
-    all_faces = np.vstack(all_faces)
+    all_faces = [np.asarray(idxs, dtype=np.int64).reshape(-1, 3) for idxs in groups.values()]
+    all_faces = np.vstack(all_faces) if all_faces else np.zeros((0, 3), dtype=np.int64)
+    Fcount = len(all_faces)
+    if Fcount == 0:
+        outN[:] = [0, 1, 0]
+        return outN
     v0, v1, v2 = P[all_faces[:, 0]], P[all_faces[:, 1]], P[all_faces[:, 2]]
 
     # --- Flächennormalen + Areagewicht ---
@@ -240,65 +479,61 @@ def compute_weighted_normals_face_area_keep_sharp(
     areas = np.linalg.norm(fn_raw, axis=1) * 0.5
     fn = fn_raw / (np.linalg.norm(fn_raw, axis=1, keepdims=True) + 1e-20)
 
-    # --- Vertex→Faces adjacency ---
-    Vcount = len(P)
-    vert_faces = [[] for _ in range(Vcount)]
-    for fi, tri in enumerate(all_faces):
-        for vi in tri:
-            vert_faces[vi].append(fi)
-
     # --- „Weld“-Gruppen nur nach Position ---
     key = np.round(P / weld_tol).astype(np.int64)
     key_flat = key.view([('', key.dtype)] * key.shape[1]).ravel()
     uniq, inv = np.unique(key_flat, return_inverse=True)
-
-    # --- Ergebnisnormalen ---
-    outN = np.zeros((Vcount, 3), dtype=np.float32)
-
-    # --- Für jede Position (mehrere Vertices möglich) ---
-    for g_idx in range(len(uniq)):
-        verts = np.where(inv == g_idx)[0]
-        if len(verts) == 0:
-            continue
-
-        # Alle Faces an dieser Position sammeln
-        face_set = set()
-        for vi in verts:
-            face_set.update(vert_faces[vi])
-        if not face_set:
-            outN[verts] = [0, 1, 0]
-            continue
-        face_idx = np.fromiter(face_set, dtype=np.int64)
-        fn_g = fn[face_idx]
-        w_g = areas[face_idx]
-
-        # --- Clustering nach Winkel (Keep Sharp) ---
-        clusters = []
-        for fi, n in zip(face_idx, fn_g):
-            assigned = False
-            for c in clusters:
-                if np.dot(n, c["dir"]) >= cos_sharp:
-                    # gehört in diese „weiche“ Gruppe
-                    c["faces"].append(fi)
-                    c["sum"] += n * w_g[np.where(face_idx == fi)][0]
-                    c["count"] += 1
-                    assigned = True
-                    break
-            if not assigned:
-                clusters.append({
-                    "faces": [fi],
-                    "dir": n.copy(),
-                    "sum": n * w_g[np.where(face_idx == fi)][0],
-                    "count": 1
-                })
-
-        # Jede Winkelgruppe einzeln mitteln
-        for c in clusters:
-            avg = c["sum"] / (np.linalg.norm(c["sum"]) + 1e-20)
-            for vi in verts:
-                # Falls dieser Vertex zu einer Face-Gruppe gehört
-                if any(fi in vert_faces[vi] for fi in c["faces"]):
-                    outN[vi] = avg
+    inv = inv.reshape(-1)
+
+    # --- Weld group -> faces (CSR, sorted by group, faces ascending) ---
+    # one entry per distinct (group, face) pair, same as the per-group face set
+    corner_v = all_faces.ravel()
+    corner_f = np.repeat(np.arange(Fcount, dtype=np.int64), 3)
+    pair_key, corner_pair = np.unique(inv[corner_v] * Fcount + corner_f, return_inverse=True)
+    corner_pair = corner_pair.reshape(-1)
+    pair_g = pair_key // Fcount
+    pair_f = pair_key % Fcount
+    group_start = np.searchsorted(pair_g, np.arange(len(uniq) + 1))
+
+    # --- Clustering nach Winkel (Keep Sharp) ---
+    # every round seeds one cluster per group with its first unassigned face and
+    # takes all remaining faces within the angle; this is the same first-match
+    # assignment as growing the clusters face by face
+    pair_cluster = np.full(len(pair_key), -1, dtype=np.int64)
+    open_pairs = np.arange(len(pair_key))
+    rounds = 0
+    while len(open_pairs):
+        g = pair_g[open_pairs]
+        is_seed = np.empty(len(g), dtype=bool)
+        is_seed[0] = True
+        np.not_equal(g[1:], g[:-1], out=is_seed[1:])
+        seed_pos = np.flatnonzero(is_seed)
+        seed = np.repeat(open_pairs[seed_pos], np.diff(np.append(seed_pos, len(g))))
+        dots = np.einsum("ij,ij->i", fn[pair_f[open_pairs]], fn[pair_f[seed]])
+        take = is_seed | (dots >= cos_sharp)
+        pair_cluster[open_pairs[take]] = rounds
+        open_pairs = open_pairs[~take]
+        rounds += 1
+
+    # --- Jede Winkelgruppe einzeln mitteln (area weighted) ---
+    cluster_key, pair_cl = np.unique(pair_g * rounds + pair_cluster, return_inverse=True)
+    pair_cl = pair_cl.reshape(-1)
+    weighted = fn[pair_f] * areas[pair_f, None]
+    sums = np.stack([np.bincount(pair_cl, weights=weighted[:, k], minlength=len(cluster_key))
+                     for k in range(3)], axis=1)
+    avg = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-20)
+
+    # a vertex takes the last cluster that contains one of its own faces
+    vert_cluster = np.full(Vcount, -1, dtype=np.int64)
+    np.maximum.at(vert_cluster, corner_v, pair_cluster[corner_pair])
+    has_cluster = vert_cluster >= 0
+    vidx = np.flatnonzero(has_cluster)
+    cl = np.searchsorted(cluster_key, inv[vidx] * rounds + vert_cluster[vidx])
+    outN[vidx] = avg[cl]
+
+    # positions without any faces keep the up vector
+    group_has_faces = np.diff(group_start) > 0
+    outN[~has_cluster & ~group_has_faces[inv]] = [0, 1, 0]
 
     # --- Optionale Mischung mit bestehenden Normalen ---
     if N_src is not None and len(N_src) == Vcount and 0.0 < strength < 1.0:
@@ -365,146 +600,251 @@ def merge_by_distance_uvsafe(P, T, N, groups, tol_pos=1e-5, tol_uv=1e-6):
 
 
 
-# -------- write GLB --------
-def write_glb(P, T, groups, mtl_props, obj_dir, outpath, N=None):
-    import numpy as np
-    from pygltflib import (GLTF2, Scene, Node, Mesh, Buffer, BufferView, Accessor, Asset, Primitive,
-                           PbrMetallicRoughness, Material, Image, Texture, TextureInfo)
-
+# -------- quantization (KHR_mesh_quantization) --------
+# positions: normalized int16 around the bbox center, dequantized by a uniform node scale
+def quantize_positions(P):
+    P = P.astype(np.float64)
+    lo, hi = P.min(axis=0), P.max(axis=0)
+    center = (lo + hi) * 0.5
+    extent = float((hi - lo).max()) * 0.5 or 1.0
+    q = np.clip(np.round((P - center) * (32767.0 / extent)), -32767, 32767).astype(np.int16)
+    err = float(np.abs(center + q * (extent / 32767.0) - P).max())
+    return q, center.tolist(), extent, err
+
+
+# normals: normalized int8, error as max angle in degrees
+def quantize_normals(N):
+    N = N.astype(np.float64)
+    q = np.clip(np.round(N * 127.0), -127, 127).astype(np.int8)
+    d = q / 127.0
+    d /= np.maximum(np.linalg.norm(d, axis=1, keepdims=True), 1e-12)
+    n = N / np.maximum(np.linalg.norm(N, axis=1, keepdims=True), 1e-12)
+    cos = np.clip(np.einsum("ij,ij->i", d, n), -1.0, 1.0)
+    return q, float(np.degrees(np.arccos(cos.min())))
+
+
+# uvs: normalized uint16 in [0,1], int16 in [-1,1], otherwise None (stays float)
+def quantize_uvs(T):
+    T = T.astype(np.float64)
+    lo, hi = T.min(), T.max()
+    if lo >= 0.0 and hi <= 1.0:
+        q = np.round(T * 65535.0).astype(np.uint16)
+        return q, 5123, "uint16", float(np.abs(q / 65535.0 - T).max())
+    if lo >= -1.0 and hi <= 1.0:
+        q = np.round(T * 32767.0).astype(np.int16)
+        return q, 5122, "int16", float(np.abs(q / 32767.0 - T).max())
+    return None
+
+
+NUM_COMPONENTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4}
+
+
+# vertex attribute rows must be 4-byte aligned
+def pad_rows(q, width):
+    out = np.zeros((len(q), width), dtype=q.dtype)
+    out[:, :q.shape[1]] = q
+    return out
+
+
+# -------- material classes --------
+# alpha factor, emissive intensity and metallic/roughness of an MTL material
+# from its Ke value and the dcl.game/materials_*.py keyword tables
+def material_class(name, p, rules, kd_users):
+    lname = (name or "").lower()
+    texpath = p.get("map_Kd")
+    name_hits = rules.match(lname)
+    tex_hits = rules.match(os.path.basename(texpath)) if texpath else [None, None, None]
+
+    # Surface-Defaults, a texture keyword wins over a material name keyword
+    metallic_value, roughness_value = rules.default_metallic, rules.default_roughness
+    surface_hit = tex_hits[materialrules.SURFACE] or name_hits[materialrules.SURFACE]
+    if surface_hit is not None:
+        metallic_value, roughness_value = surface_hit[1]
+
+    # Emissive-Intensity by Keywords
+    emissive_intensity = None
+    if p.get("Ke"):
+        try:
+            emissive_intensity = float(max(p["Ke"]))
+        except Exception:
+            pass
+    if emissive_intensity is None and name and name_hits[materialrules.EMISSION] is not None:
+        emissive_intensity = name_hits[materialrules.EMISSION][1]
+    # texture keywords only count for textures used by a single material
+    if emissive_intensity is None and texpath and kd_users[texpath] <= 1 \
+            and tex_hits[materialrules.EMISSION] is not None:
+        emissive_intensity = tex_hits[materialrules.EMISSION][1]
+
+    alpha_hit = name_hits[materialrules.ALPHA]
+    return {"alpha": None if alpha_hit is None else alpha_hit[1], "emission": emissive_intensity,
+            "metallic": metallic_value, "roughness": roughness_value}
+
+
+# -------- build GLB --------
+# T has 2 columns, or 4 with the lightmap uvs (TEXCOORD_1) in the last two;
+# lightmap is the PNG they address, used as occlusionTexture of every material.
+# instances are (name, P, T, N, groups, translation, rotation, scale) of meshes
+# placed several times with EXT_mesh_gpu_instancing (see mapentities.py);
+# images_in_memory maps texture paths to image bytes built in memory (texture atlas pages)
+def build_gltf(P, T, groups, mtl_props, obj_dir, N=None, split_vertices=False, quantize=False,
+               interleave=False, meshopt=False, meshopt_verify=False, lightmap=None, instances=None,
+               images_in_memory=None):
     bin_blob = bytearray()
     bufferViews, accessors = [], []
     images, textures, materials = [], [], []
     meshes, nodes = [], []
 
-    def add_view(data: bytes, target=None) -> int:
+    def add_view(data: bytes, target=None, stride=None) -> int:
         off = len(bin_blob)
         bin_blob.extend(data)
         while len(bin_blob) % 4:
             bin_blob.append(0)
         idx = len(bufferViews)
-        bufferViews.append(BufferView(buffer=0, byteOffset=off, byteLength=len(data), target=target))
+        bufferViews.append(BufferView(buffer=0, byteOffset=off, byteLength=len(data), byteStride=stride, target=target))
         return idx
 
-    # --- POSITION ---
-    P = P.astype(np.float32, copy=False)
-    bv_pos = add_view(P.tobytes(), 34962)
-    vmin, vmax = P.min(axis=0).tolist(), P.max(axis=0).tolist()
-    acc_pos = len(accessors)
-    accessors.append(Accessor(bufferView=bv_pos, componentType=5126, count=len(P), type="VEC3",
-                              min=vmin, max=vmax))
-
-    # --- NORMAL ---
-    acc_n = None
-    if N is not None and len(N) == len(P):
-        N = N.astype(np.float32, copy=False)
-        bv_n = add_view(N.tobytes(), 34962)
-        acc_n = len(accessors)
-        accessors.append(Accessor(bufferView=bv_n, componentType=5126, count=len(N), type="VEC3"))
-
-    # --- UV ---
-    acc_uv = None
+    # --- VERTEX ATTRIBUTES ---
     have_uv = T is not None and len(T) == len(P)
-    if have_uv:
-        T = T.astype(np.float32, copy=False)
-        bv_uv = add_view(T.tobytes(), 34962)
-        acc_uv = len(accessors)
-        accessors.append(Accessor(bufferView=bv_uv, componentType=5126, count=len(T), type="VEC2"))
+    if N is not None and len(N) != len(P):
+        N = None
+    if not have_uv:
+        T = None
+
+    qerrors = {}  # attribute -> (format, max error)
+
+    def note_error(attr, fmt, err):
+        old = qerrors.get(attr, (fmt, 0.0))[1]
+        qerrors[attr] = (fmt, max(old, err))
+
+    # columns: (attribute, rows, componentType, normalized, accessor type); rows
+    # are 4-byte aligned. Either one view per attribute or one interleaved view
+    def write_attributes(columns):
+        attrs = {}
+        if interleave:
+            offsets, stride = [], 0
+            for _, rows, _, _, _ in columns:
+                offsets.append(stride)
+                stride += rows.shape[1] * rows.itemsize
+            layout = np.dtype({"names": [c[0] for c in columns],
+                               "formats": [(c[1].dtype, (c[1].shape[1],)) for c in columns],
+                               "offsets": offsets, "itemsize": stride})
+            vertices = np.empty(len(columns[0][1]), dtype=layout)
+            for name, rows, _, _, _ in columns:
+                vertices[name] = rows
+            bv = add_view(vertices.view(np.uint8), 34962, stride=stride)
+        for i, (name, rows, comp, normalized, type_) in enumerate(columns):
+            if interleave:
+                view, offset = bv, offsets[i]
+            else:
+                padded = rows.shape[1] != NUM_COMPONENTS[type_]
+                view, offset = add_view(rows.tobytes(), 34962, stride=rows.shape[1] * rows.itemsize if padded else None), 0
+            attrs[name] = len(accessors)
+            acc = Accessor(bufferView=view, byteOffset=offset, componentType=comp, normalized=normalized,
+                           count=len(rows), type=type_)
+            if name == "POSITION":
+                acc.min = rows[:, :3].min(axis=0).tolist()
+                acc.max = rows[:, :3].max(axis=0).tolist()
+            accessors.append(acc)
+        return attrs
+
+    # returns (attributes, node transform or None)
+    def add_attributes(P, N, T):
+        columns, xform = [], None
+        if quantize:
+            q, center, extent, err = quantize_positions(P)
+            note_error("POSITION", "int16", err)
+            columns.append(("POSITION", pad_rows(q, 4), 5122, True, "VEC3"))
+            xform = (center, extent)
+        else:
+            columns.append(("POSITION", P.astype(np.float32, copy=False), 5126, False, "VEC3"))
+        if N is not None:
+            if quantize:
+                q, err = quantize_normals(N)
+                note_error("NORMAL", "int8", err)
+                columns.append(("NORMAL", pad_rows(q, 4), 5120, True, "VEC3"))
+            else:
+                columns.append(("NORMAL", N.astype(np.float32, copy=False), 5126, False, "VEC3"))
+        for k in range(0 if T is None else T.shape[1] // 2):
+            attr, uv = f"TEXCOORD_{k}", T[:, 2 * k:2 * k + 2]
+            qt = quantize_uvs(uv) if quantize else None
+            if qt is not None:
+                q, comp, fmt, err = qt
+                note_error(attr, fmt, err)
+                columns.append((attr, q, comp, True, "VEC2"))
+            else:
+                if quantize:
+                    note_error(attr, "float32", 0.0)
+                columns.append((attr, np.ascontiguousarray(uv, dtype=np.float32), 5126, False, "VEC2"))
+        return write_attributes(columns), xform
+
+    # one shared vertex set, or (split_vertices) a compacted set per primitive
+    if not split_vertices:
+        shared_attrs, shared_xform = add_attributes(P, N, T)
+
+    # --- TEXTURES ---
+    # every file is read once per build and every distinct image embedded once,
+    # materials sharing a texture (also under another path) share the Texture
+    texture_by_path = {}
+    texture_by_digest = {}
+
+    def add_texture(texpath):
+        full = os.path.join(obj_dir, texpath)
+        if full not in texture_by_path:
+            tex_idx = None
+            img_bytes = (images_in_memory or {}).get(texpath)
+            if img_bytes is None and os.path.exists(full):
+                with open(full, "rb") as f:
+                    img_bytes = f.read()
+            if img_bytes is not None:
+                digest = hashlib.sha256(img_bytes).digest()
+                tex_idx = texture_by_digest.get(digest)
+                if tex_idx is None:
+                    mime, _ = mimetypes.guess_type(full)
+                    if not mime:
+                        mime = "image/png"
+                    bv_img = add_view(img_bytes, None)
+                    images.append(Image(bufferView=bv_img, mimeType=mime, name=normalize_image_name(texpath, mime)))
+                    textures.append(Texture(source=len(images)-1))
+                    tex_idx = texture_by_digest[digest] = len(textures)-1
+            texture_by_path[full] = tex_idx
+        tex_idx = texture_by_path[full]
+        return None if tex_idx is None else TextureInfo(index=tex_idx)
+
+    # baked lighting: one atlas for all materials, sampled with TEXCOORD_1
+    lightmap_info = None
+    if lightmap is not None and have_uv and T.shape[1] >= 4:
+        bv_img = add_view(lightmap, None)
+        images.append(Image(bufferView=bv_img, mimeType="image/png", name="lightmap.png"))
+        textures.append(Texture(source=len(images)-1))
+        lightmap_info = OcclusionTextureInfo(index=len(textures)-1, texCoord=1)
 
     # --- MATERIALS ---
+    # keyword tables compiled once, each name is matched against all of them in one pass
+    rules = materialrules.MaterialRules(materials_alpha, materials_emission, materials_surface)
+    kd_users = Counter(q.get("map_Kd") for q in mtl_props.values())
+
     mtl_index = {}
     for name, p in mtl_props.items():
-        lname = (name or "").lower()
-
-        # Surface-Defaults
-        metallic_value  = float(getattr(materials_surface, "default_metallic", 0.0))
-        roughness_value = float(getattr(materials_surface, "default_roughness", 1.0))
-        for kw, pair in getattr(materials_surface, "surfacekeywords", {}).items():
-            try:
-                m_val, r_val = pair
-            except Exception:
-                continue
-            if kw in lname:
-                metallic_value  = float(m_val)
-                roughness_value = float(r_val)
-                break
-
         texpath = p.get("map_Kd")
-        if texpath:
-            texname = os.path.basename(texpath).lower()
-            for kw, pair in getattr(materials_surface, "surfacekeywords", {}).items():
-                try:
-                    m_val, r_val = pair
-                except Exception:
-                    continue
-                if kw in texname:
-                    metallic_value  = float(m_val)
-                    roughness_value = float(r_val)
-                    break
+        cls = p.get("class") or material_class(name, p, rules, kd_users)
 
-        mr = PbrMetallicRoughness(roughnessFactor=roughness_value, metallicFactor=metallic_value)
+        mr = PbrMetallicRoughness(roughnessFactor=cls["roughness"], metallicFactor=cls["metallic"])
 
         # BaseColorTexture
-        texinfo = None
-        if texpath and have_uv:
-            tex_full = os.path.join(obj_dir, texpath)
-            if os.path.exists(tex_full):
-                with open(tex_full, "rb") as f:
-                    img_bytes = f.read()
-                import mimetypes
-                mime, _ = mimetypes.guess_type(tex_full)
-                if not mime:
-                    mime = "image/png"
-                bv_img = add_view(img_bytes, None)
-                final_name = normalize_image_name(texpath, mime)
-                images.append(Image(bufferView=bv_img, mimeType=mime, name=final_name))
-                textures.append(Texture(source=len(images)-1))
-                texinfo = TextureInfo(index=len(textures)-1)
-                mr.baseColorTexture = texinfo
+        texinfo = add_texture(texpath) if texpath and have_uv else None
+        if texinfo is not None:
+            mr.baseColorTexture = texinfo
 
         # Emissive Map (map_Ke)
-        emissive_texinfo = None
         em_texpath = p.get("map_Ke")
-        if em_texpath and have_uv:
-            em_full = os.path.join(obj_dir, em_texpath)
-            if os.path.exists(em_full):
-                with open(em_full, "rb") as f:
-                    em_bytes = f.read()
-                em_mime, _ = mimetypes.guess_type(em_full)
-                if not em_mime:
-                    em_mime = "image/png"
-                bv_img_e = add_view(em_bytes, None)
-                em_name = normalize_image_name(em_texpath, em_mime)
-                images.append(Image(bufferView=bv_img_e, mimeType=em_mime, name=em_name))
-                textures.append(Texture(source=len(images)-1))
-                emissive_texinfo = TextureInfo(index=len(textures)-1)
-
-        # Emissive-Intensity by Keywords
-        def match_emission(text: str):
-            t = (text or "").lower()
-            for kw, val in getattr(materials_emission, "emissionkeywords", {}).items():
-                if kw in t or t.endswith(kw) or t.startswith(kw):
-                    try:
-                        return float(val)
-                    except Exception:
-                        pass
-            return None
-
-        emissive_intensity = None
-        if p.get("Ke"):
-            try:
-                emissive_intensity = float(max(p["Ke"]))
-            except Exception:
-                pass
-        if emissive_intensity is None and name:
-            emissive_intensity = match_emission(name)
-        if emissive_intensity is None and texpath:
-            base_texname = os.path.basename(texpath).lower()
-            shared_count = sum(1 for q in mtl_props.values() if q.get("map_Kd") == texpath)
-            if shared_count <= 1:
-                emissive_intensity = match_emission(base_texname)
+        emissive_texinfo = add_texture(em_texpath) if em_texpath and have_uv else None
+
+        emissive_intensity = cls["emission"]
 
         # Material object
         mat = Material(name=short_name(name, "material"), pbrMetallicRoughness=mr)
+        if lightmap_info is not None:
+            mat.occlusionTexture = lightmap_info
 
         # apply Emission
         if emissive_texinfo or (emissive_intensity is not None):
@@ -517,27 +857,19 @@ def write_glb(P, T, groups, mtl_props, obj_dir, outpath, N=None):
                 mat.emissiveTexture = texinfo  # Fallback: Diffuse as Emissive
 
         # Alpha-Keywords
-        alpha_hit = False
-        lname_for_match = lname
-        for akw, alpha_val in getattr(materials_alpha, "alphakeywords", {}).items():
-            if akw in lname_for_match:
-                alpha_hit = True
-                mat.alphaMode = "BLEND"
-                mat.doubleSided = True
-                try:
-                    a = float(alpha_val)
-                except Exception:
-                    a = 1.0
-                # set baseColorFactor to 4 Components
-                if not getattr(mr, "baseColorFactor", None):
-                    mr.baseColorFactor = [1.0, 1.0, 1.0, a]
-                else:
-                    bcf = list(mr.baseColorFactor)
-                    if len(bcf) < 4:
-                        bcf = (bcf + [1.0])[:4]
-                    bcf[3] = a
-                    mr.baseColorFactor = bcf
-                break
+        if cls["alpha"] is not None:
+            mat.alphaMode = "BLEND"
+            mat.doubleSided = True
+            a = cls["alpha"]
+            # set baseColorFactor to 4 Components
+            if not getattr(mr, "baseColorFactor", None):
+                mr.baseColorFactor = [1.0, 1.0, 1.0, a]
+            else:
+                bcf = list(mr.baseColorFactor)
+                if len(bcf) < 4:
+                    bcf = (bcf + [1.0])[:4]
+                bcf[3] = a
+                mr.baseColorFactor = bcf
 
         # if alpha is active but baseColorFactor < 4 = extend
         if getattr(mat, "alphaMode", None) == "BLEND":
@@ -551,29 +883,68 @@ def write_glb(P, T, groups, mtl_props, obj_dir, outpath, N=None):
         materials.append(mat)
 
     # --- PRIMITIVES / MESHES ---
-    for m, idxs in groups.items():
-        if not idxs:
-            continue
-        idxs = np.asarray(idxs, dtype=np.uint32)
+    def add_indices(idxs):
         # glTF allows 16- or 32-bit Indices
         use_u16 = (idxs.max() <= 65535)
         dtype = np.uint16 if use_u16 else np.uint32
         comp  = 5123 if use_u16 else 5125
 
         bv_i = add_view(idxs.astype(dtype, copy=False).tobytes(), 34963)
-        acc_i = len(accessors)
         accessors.append(Accessor(bufferView=bv_i, componentType=comp, count=len(idxs), type="SCALAR"))
+        return len(accessors) - 1
 
-        attrs = {"POSITION": acc_pos}
-        if acc_n is not None:
-            attrs["NORMAL"] = acc_n
-        if acc_uv is not None:
-            attrs["TEXCOORD_0"] = acc_uv
+    written = 0
+    for m, idxs in groups.items():
+        if len(idxs) == 0:
+            continue
+        idxs = np.asarray(idxs, dtype=np.uint32)
+        if split_vertices:
+            used, local = np.unique(idxs, return_inverse=True)
+            attrs, xform = add_attributes(P[used], None if N is None else N[used], None if T is None else T[used])
+            idxs = local.astype(np.uint32).reshape(-1)
+            written += len(used)
+        else:
+            attrs, xform = dict(shared_attrs), shared_xform
+            written = len(P)
 
-        prim = Primitive(attributes=attrs, indices=acc_i, material=mtl_index.get(m))
+        prim = Primitive(attributes=attrs, indices=add_indices(idxs), material=mtl_index.get(m))
         mesh = Mesh(primitives=[prim], name=short_name(m, "mesh"))
         meshes.append(mesh)
-        nodes.append(Node(mesh=len(meshes)-1, name=short_name(m, "node")))
+        node = Node(mesh=len(meshes)-1, name=short_name(m, "node"))
+        if xform is not None:
+            # dequantizes the normalized int16 positions
+            node.translation = xform[0]
+            node.scale = [xform[1]] * 3
+        nodes.append(node)
+
+    # --- INSTANCED MESHES ---
+    # one mesh per model, its placements as TRANSLATION/ROTATION/SCALE accessors
+    placements = 0
+    for name, iP, iT, iN, igroups, translation, rotation, iscale in instances or []:
+        attrs, xform = add_attributes(iP, None if N is None else iN, iT if have_uv else None)
+        translation = np.asarray(translation, dtype=np.float64)
+        iscale = np.asarray(iscale, dtype=np.float64)
+        if xform is not None:
+            # dequantization goes before the instance transform: t + R (s * center), s * extent
+            x, y, z, w = np.asarray(rotation, dtype=np.float64).T
+            c = iscale * np.asarray(xform[0])
+            uv = np.stack([y * c[:, 2] - z * c[:, 1], z * c[:, 0] - x * c[:, 2], x * c[:, 1] - y * c[:, 0]], axis=1)
+            uuv = np.stack([y * uv[:, 2] - z * uv[:, 1], z * uv[:, 0] - x * uv[:, 2], x * uv[:, 1] - y * uv[:, 0]], axis=1)
+            translation = translation + c + 2 * (w[:, None] * uv + uuv)
+            iscale = iscale * xform[1]
+        prims = [Primitive(attributes=dict(attrs), indices=add_indices(np.asarray(idxs, dtype=np.uint32)),
+                           material=mtl_index.get(m))
+                 for m, idxs in igroups.items() if len(idxs)]
+        meshes.append(Mesh(primitives=prims, name=short_name(name, "mesh")))
+        inst = {}
+        for attr, rows, type_ in (("TRANSLATION", translation, "VEC3"), ("ROTATION", rotation, "VEC4"),
+                                  ("SCALE", iscale, "VEC3")):
+            inst[attr] = len(accessors)
+            accessors.append(Accessor(bufferView=add_view(np.asarray(rows, dtype=np.float32).tobytes()),
+                                      componentType=5126, count=len(rows), type=type_))
+        nodes.append(Node(mesh=len(meshes)-1, name=short_name(name, "node"),
+                          extensions={"EXT_mesh_gpu_instancing": {"attributes": inst}}))
+        placements += len(translation)
 
     # --- GLTF ---
     gltf = GLTF2(
@@ -589,40 +960,48 @@ def write_glb(P, T, groups, mtl_props, obj_dir, outpath, N=None):
         scenes=[Scene(nodes=list(range(len(nodes))))],
         scene=0
     )
+    required = (["KHR_mesh_quantization"] if quantize else []) + (["EXT_mesh_gpu_instancing"] if instances else [])
+    if required:
+        gltf.extensionsUsed = list(required)
+        gltf.extensionsRequired = list(required)
     gltf.set_binary_blob(bytes(bin_blob))
-    gltf.save_binary(outpath)
-    print(f"- Vertices: {len(P)}")
+    for attr, (fmt, err) in qerrors.items():
+        unit = {"POSITION": f"{err * 1000.0:.4f} mm", "NORMAL": f"{err:.3f} deg"}.get(attr, f"{err:.2e}")
+        print(f"- Quantized {attr}: {fmt}" + (" (range outside [-1, 1])" if fmt == "float32" else f", max error {unit}"))
+    print(f"- Vertices: {len(P)}" + (f" ({written} written in per-primitive sets)" if split_vertices else ""))
     print(f"- Materials: {len(materials)}")
     print(f"- Meshes: {len(meshes)}")
+    if instances:
+        print(f"- Instanced meshes: {len(instances)} ({placements} placements)")
+    if meshopt:
+        meshoptcodec.compress_gltf_views(gltf, verify=meshopt_verify)
+    return gltf
 
 
-# -------- CLI --------
-def main():
-    ap = argparse.ArgumentParser(description="OBJ+MTL GLB (with UVs, Emission, PBR, VN).")
-    ap.add_argument("mappath", type=str)
-    ap.add_argument("--smooth-angle", type=float, default=30.0, help="Smoothing angle in degrees (fallback)")
-    args = ap.parse_args()
-    
-    
-    
-    if not args.mappath.endswith(".bsp"):
-        raise ValueError("ERROR: filename must end with '.bsp'")
-    
-    input_file = args.mappath.replace(".bsp", "_scaled.obj")
-    output_file = args.mappath.replace(".bsp", "_uncompressed.glb")
-    
-    V, VT, VN, faces_triples, face_mtls, mtllibs = load_obj_with_uvs(input_file)
-    P, T, N, groups = build_unified_vertices(V, VT, VN, faces_triples, face_mtls)
+# -------- write GLB --------
+def write_glb(P, T, groups, mtl_props, obj_dir, outpath, N=None, **options):
+    gltf = build_gltf(P, T, groups, mtl_props, obj_dir, N, **options)
+    meshoptcodec.save_glb(gltf, outpath)
+    return gltf
+
+
+# -------- OBJ data -> glTF (unify, normals, GLB assembly) --------
+# bump when obj_to_geometry produces different arrays for the same input
+GEOMETRY_VERSION = 1
+
+
+def obj_to_geometry(V, VT, VN, faces, face_mtls, vertex_cache=False):
+    P, T, N, groups = build_unified_vertices(V, VT, VN, faces, face_mtls)
 
     #if N is None or len(N) == 0 or not np.any(N):
     #    print("- No Normals found in OBJ. Calculating Normals...")
     #    N = compute_normals(P, groups, smooth_angle_deg=args.smooth_angle)
     #else:
     #    print(f"- Normals: {len(N)}")
-    
+
     #print("- Calculating Normals...")
     #N = compute_normals(P, groups, smooth_angle_deg=args.smooth_angle)
-    
+
     print("- Calculating Weighted Normals...")
     N = compute_weighted_normals_face_area_keep_sharp(
         P, groups,
@@ -631,19 +1010,95 @@ def main():
         strength=0.5,        # Blender "Weight 50"
         sharp_angle_deg=89.0     # ~0.57° (Keep Sharp)
     )
-            
+
     # Merge by Distance
     #P, T, N, groups = merge_by_distance_uvsafe(P, T, N, groups, tol_pos=0.001, tol_uv=0.001)
 
-    obj_dir = os.path.dirname(os.path.abspath(input_file))
+    if vertex_cache:
+        import vertexcache
+        P, T, N, groups = vertexcache.optimize_geometry(P, T, N, groups)
+
+    return P, T, N, groups
+
+
+def obj_to_gltf(V, VT, VN, faces, face_mtls, mtl_props, obj_dir, geometry_options=None, **options):
+    P, T, N, groups = obj_to_geometry(V, VT, VN, faces, face_mtls, **(geometry_options or {}))
+    return build_gltf(P, T, groups, mtl_props, obj_dir, N, **options)
+
+
+# -------- CLI --------
+# obj_to_geometry and build_gltf options shared by every exporter CLI
+def add_geometry_arguments(ap):
+    ap.add_argument("--vertex-cache", action="store_true",
+                    help="Reorder triangles/vertices for GPU vertex cache and fetch locality (reports ACMR/ATVR)")
+
+
+def geometry_options_from_args(args) -> dict:
+    return {"vertex_cache": args.vertex_cache}
+
+
+def add_gltf_arguments(ap):
+    ap.add_argument("--split-vertices", action="store_true",
+                    help="Write a compacted vertex set per material primitive (local indices, per-primitive bounds)")
+    ap.add_argument("--quantize", action="store_true",
+                    help="KHR_mesh_quantization: int16 positions, int8 normals, 16-bit UVs where the range allows")
+    ap.add_argument("--interleave", action="store_true",
+                    help="Write the vertex attributes interleaved into one bufferView with byteStride")
+    ap.add_argument("--meshopt", action="store_true",
+                    help="EXT_meshopt_compression for vertex and index data (uncompressed fallback buffer); "
+                         "the index encoder runs in Python, about 2-2.5 s per million triangles")
+    ap.add_argument("--meshopt-verify", action="store_true",
+                    help="Decode every meshopt compressed view again and fail on a mismatch "
+                         "(about 0.6 s more per million triangles)")
+
+
+def gltf_options_from_args(args) -> dict:
+    return {"split_vertices": args.split_vertices, "quantize": args.quantize, "interleave": args.interleave,
+            "meshopt": args.meshopt or args.meshopt_verify, "meshopt_verify": args.meshopt_verify}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OBJ+MTL GLB (with UVs, Emission, PBR, VN).")
+    ap.add_argument("mappath", type=str)
+    ap.add_argument("--smooth-angle", type=float, default=30.0, help="Smoothing angle in degrees (fallback)")
+    ap.add_argument("--scale", type=float, default=None,
+                    help="Scale factor; reads the unscaled .obj and transforms it in memory (no scale.py pass)")
+    ap.add_argument("--rotation", type=float, default=None,
+                    help="Rotation around Y in degrees, used together with --scale")
+    ap.add_argument("--from-bsp", action="store_true",
+                    help="Read the .bsp directly instead of the q3map2 OBJ/MTL (unscaled unless --scale is given)")
+    add_geometry_arguments(ap)
+    add_gltf_arguments(ap)
+    args = ap.parse_args()
     
-    mtl_props = {}
-    for mtl in mtllibs:
-        mtl_path = os.path.join(obj_dir, mtl)
-        mtl_props.update(parse_mtl(mtl_path))
-        #print(mtl_path)
+    
+    
+    if not args.mappath.endswith(".bsp"):
+        raise ValueError("ERROR: filename must end with '.bsp'")
+    
+    transform = args.scale is not None or args.rotation is not None
+    input_file = args.mappath if args.from_bsp else args.mappath.replace(".bsp", ".obj" if transform else "_scaled.obj")
+    output_file = args.mappath.replace(".bsp", "_uncompressed.glb")
+    
+    if args.from_bsp:
+        V, VT, VN, faces, face_mtls, mtl_props = load_bsp(input_file)
+    else:
+        V, VT, VN, faces, face_mtls, mtllibs = load_obj_with_uvs(input_file)
+    if transform:
+        import scale
+        V, VN = scale.transform_vertices(
+            V, VN,
+            1.0 if args.scale is None else args.scale,
+            0.0 if args.rotation is None else args.rotation
+        )
+
+    obj_dir = os.path.dirname(os.path.abspath(input_file))
+    if not args.from_bsp:
+        mtl_props = load_mtl_props(mtllibs, obj_dir)
 
-    write_glb(P, T, groups, mtl_props, obj_dir, output_file, N)
+    gltf = obj_to_gltf(V, VT, VN, faces, face_mtls, mtl_props, obj_dir,
+                       geometry_options_from_args(args), **gltf_options_from_args(args))
+    meshoptcodec.save_glb(gltf, output_file)
     print(f"- Exported to {output_file}")
 
 
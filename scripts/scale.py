@@ -1,20 +1,8 @@
 import argparse
 import math
 import os
+import numpy as np
 
-parser = argparse.ArgumentParser(description="Scales and Rotates a Wavefront OBJ file based on a .bsp path")
-
-parser.add_argument("mappath", type=str, help="Path to the .bsp file")
-parser.add_argument("scale", type=float, help="Scale factor")
-parser.add_argument("rotate", type=float, help="Rotation in degrees")
-
-args = parser.parse_args()
-
-if not args.mappath.endswith(".bsp"):
-    raise ValueError("ERROR: filename must end with '.bsp'")
-
-input_file = args.mappath.replace(".bsp", ".obj")
-output_file = args.mappath.replace(".bsp", "_scaled.obj")
 
 def scale_and_rotate_obj(input_file, output_file, scale_factor, rotation_degrees):
     theta = math.radians(rotation_degrees)
@@ -37,6 +25,48 @@ def scale_and_rotate_obj(input_file, output_file, scale_factor, rotation_degrees
             else:
                 f_out.write(line)
 
-scale_and_rotate_obj(input_file, output_file, args.scale, args.rotate)
-print(f"- Input:  {input_file}")
-print(f"- Output: {output_file}")
+
+# uniform scale followed by the rotation around the Y axis, as one 3x3 matrix
+def scale_rotate_matrix(scale_factor, rotation_degrees):
+    theta = math.radians(rotation_degrees)
+    cos_theta = math.cos(theta)
+    sin_theta = math.sin(theta)
+    rot = np.array([[cos_theta, 0.0, sin_theta],
+                    [0.0,       1.0, 0.0],
+                    [-sin_theta, 0.0, cos_theta]])
+    return rot * scale_factor
+
+
+# same transform as scale_and_rotate_obj, applied to loaded position/normal arrays
+def transform_vertices(V, VN, scale_factor, rotation_degrees):
+    m = scale_rotate_matrix(scale_factor, rotation_degrees)
+    V = (np.asarray(V, dtype=np.float64) @ m.T).astype(np.float32)
+    if VN is not None and len(VN):
+        # uniform scale: normals only follow the rotation
+        rot = scale_rotate_matrix(1.0, rotation_degrees)
+        VN = (np.asarray(VN, dtype=np.float64) @ rot.T).astype(np.float32)
+    return V, VN
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scales and Rotates a Wavefront OBJ file based on a .bsp path")
+
+    parser.add_argument("mappath", type=str, help="Path to the .bsp file")
+    parser.add_argument("scale", type=float, help="Scale factor")
+    parser.add_argument("rotate", type=float, help="Rotation in degrees")
+
+    args = parser.parse_args()
+
+    if not args.mappath.endswith(".bsp"):
+        raise ValueError("ERROR: filename must end with '.bsp'")
+
+    input_file = args.mappath.replace(".bsp", ".obj")
+    output_file = args.mappath.replace(".bsp", "_scaled.obj")
+
+    scale_and_rotate_obj(input_file, output_file, args.scale, args.rotate)
+    print(f"- Input:  {input_file}")
+    print(f"- Output: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
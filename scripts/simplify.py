@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# Quadric error mesh simplification for the LOD exports (bsp2glb --lods).
+# Works on the unified geometry: a vertex is collapsed into a neighbour
+# (half-edge collapse, so positions, uvs and normals stay original values) in
+# order of the Garland-Heckbert quadric error. Vertices on UV/normal seams
+# (several unified vertices at one position), on open or non-manifold edges
+# and vertices shared by two materials are locked, so seams, borders and
+# material boundaries keep their shape.
+# Every pass ranks all candidate collapses at once and applies the cheapest
+# ones whose neighbourhoods don't overlap, so a pass is a handful of NumPy
+# operations over the whole mesh instead of one Python step per collapse.
+import numpy as np
+
+DEFAULT_LODS = (0.5, 0.25)
+MIN_DOT = 0.5  # a collapse must not turn a triangle normal by more than 60 deg
+SELECT_ROUNDS = 32
+
+
+# -------- quadrics --------
+# symmetric 4x4 quadrics as their 10 upper coefficients
+_QI, _QJ = np.triu_indices(4)
+
+
+def _face_quadrics(P, tris):
+    p0, p1, p2 = P[tris[:, 0]], P[tris[:, 1]], P[tris[:, 2]]
+    n = np.cross(p1 - p0, p2 - p0)
+    area2 = np.linalg.norm(n, axis=1)
+    n = n / np.maximum(area2, 1e-30)[:, None]
+    plane = np.hstack([n, -np.einsum("ij,ij->i", n, p0)[:, None]])
+    # area weighted, so many small triangles count like one big one
+    return plane[:, _QI] * plane[:, _QJ] * (0.5 * area2)[:, None]
+
+
+def vertex_quadrics(P, tris):
+    fq = _face_quadrics(P, tris)
+    Q = np.zeros((len(P), 10))
+    for c in range(3):
+        for k in range(10):
+            Q[:, k] += np.bincount(tris[:, c], weights=fq[:, k], minlength=len(P))
+    return Q
+
+
+def _quadric_error(Q, p):
+    x, y, z = p[:, 0], p[:, 1], p[:, 2]
+    q = Q.T
+    err = (q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x
+           + q[4] * y * y + 2 * q[5] * y * z + 2 * q[6] * y
+           + q[7] * z * z + 2 * q[8] * z + q[9])
+    return np.maximum(err, 0.0)
+
+
+# -------- locking --------
+# seams, open/non-manifold edges and material boundaries
+def locked_vertices(P, tris, gid):
+    nv = len(P)
+    locked = np.zeros(nv, dtype=bool)
+    rows = np.ascontiguousarray(P + 0.0)  # -0.0 -> 0.0
+    _, pos_id, pos_count = np.unique(rows.view(np.dtype((np.void, rows.itemsize * 3))).ravel(),
+                                     return_inverse=True, return_counts=True)
+    locked |= pos_count[pos_id.reshape(-1)] > 1
+
+    edges = np.sort(np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]]), axis=1)
+    keys, counts = np.unique(edges[:, 0] * nv + edges[:, 1], return_counts=True)
+    bad = keys[counts != 2]
+    locked[bad // nv] = True
+    locked[bad % nv] = True
+
+    corners = tris.ravel()
+    first_gid = np.full(nv, -1, dtype=np.int64)
+    first_gid[corners] = np.repeat(gid, 3)  # last write wins, any group will do
+    locked[corners[np.repeat(gid, 3) != first_gid[corners]]] = True
+    return locked
+
+
+# -------- one pass --------
+# returns the vertex remap of the collapses chosen in this pass, or None
+def _collapse_pass(P, Q, tris, locked, budget):
+    nv = len(P)
+    vertex_error = _quadric_error(Q, P)  # Q_v at v itself
+
+    # candidate half-edges u -> v, u unlocked; unlocked vertices have no open
+    # edges, so the opposite direction comes with the neighbouring triangle
+    u = tris.ravel()
+    v = tris[:, [1, 2, 0]].ravel()
+    keep = ~locked[u]
+    u, v = u[keep], v[keep]
+    if not len(u):
+        return None
+    cost = _quadric_error(Q[u], P[v]) + vertex_error[v]
+
+    # cheapest target per vertex
+    best = np.full(nv, np.inf)
+    np.minimum.at(best, u, cost)
+    sel = np.flatnonzero(cost == best[u])
+    _, first = np.unique(u[sel], return_index=True)
+    sel = sel[first]
+    u, v, cost = u[sel], v[sel], cost[sel]
+    target = np.full(nv, -1, dtype=np.int64)
+    target[u] = v
+
+    # reject collapses that flip (or fold) a triangle around u; triangles
+    # on the edge u-v disappear and don't count
+    face_n = np.cross(P[tris[:, 1]] - P[tris[:, 0]], P[tris[:, 2]] - P[tris[:, 0]])
+    corner = np.flatnonzero(target[tris.ravel()] >= 0)
+    t, j = corner // 3, corner % 3
+    cu = tris[t, j]
+    b, c = tris[t, (j + 1) % 3], tris[t, (j + 2) % 3]
+    d = target[cu]
+    stays = (b != d) & (c != d)
+    pd = P[d]
+    n_new = np.cross(P[b] - pd, P[c] - pd)
+    n_old = face_n[t]
+    dot = np.einsum("ij,ij->i", n_old, n_new)
+    len_old = np.linalg.norm(n_old, axis=1)
+    bad = stays & (dot <= MIN_DOT * len_old * np.linalg.norm(n_new, axis=1)) & (len_old > 0)
+    ok = np.ones(nv, dtype=bool)
+    ok[cu[bad]] = False
+    sel = ok[u]
+    u, v, cost = u[sel], v[sel], cost[sel]
+    if not len(u):
+        return None
+
+    # cheapest first; a collapse goes ahead if it is the cheapest one touching
+    # each of the triangles around u (those are the only ones it changes).
+    # Repeated on what is left, this converges to the greedy order's choice;
+    # every round only looks at the triangles around the remaining candidates
+    order = np.argsort(cost, kind="stable")
+    u, v = u[order], v[order]
+    big = np.iinfo(np.int64).max
+    rank = np.full(nv, big, dtype=np.int64)
+    vert_min = np.full(nv, big, dtype=np.int64)
+    flag = np.zeros(nv, dtype=bool)
+    blocked = np.zeros(nv, dtype=bool)
+    au, aidx = u, np.arange(len(u))
+    l0, l1, l2 = tris[:, 0].copy(), tris[:, 1].copy(), tris[:, 2].copy()
+    accepted = []
+    for _ in range(SELECT_ROUNDS):
+        rank[au] = aidx
+        tri_min = np.minimum(np.minimum(rank[l0], rank[l1]), rank[l2])
+        vert_min[au] = big
+        for col in (l0, l1, l2):
+            np.minimum.at(vert_min, col, tri_min)
+        rank[au] = big
+        new = vert_min[au] == aidx
+        if not new.any():
+            break
+        accepted.append(aidx[new])
+        flag[au[new]] = True
+        taken = flag[l0] | flag[l1] | flag[l2]
+        flag[au[new]] = False
+        for col in (l0, l1, l2):
+            blocked[col[taken]] = True
+        keep = ~blocked[au]
+        au, aidx = au[keep], aidx[keep]
+        if not len(au):
+            break
+        flag[au] = True
+        live = ~taken & (flag[l0] | flag[l1] | flag[l2])
+        flag[au] = False
+        l0, l1, l2 = l0[live], l1[live], l2[live]
+    accepted = np.sort(np.concatenate(accepted)) if accepted else np.zeros(0, dtype=np.int64)
+    u, v = u[accepted], v[accepted]
+
+    # stop at the triangle budget: every collapse removes the triangles on its
+    # edge; accepted collapses share no triangle, so each has at most one u
+    slot = np.full(nv, -1, dtype=np.int64)
+    slot[u] = np.arange(len(u))
+    k = slot[tris].max(axis=1)
+    hit = k >= 0
+    hit[hit] = (tris[hit] == v[k[hit]][:, None]).any(axis=1)
+    edge_tris = np.bincount(k[hit], minlength=len(u))
+    n = int(np.searchsorted(np.cumsum(edge_tris), budget, side="left")) + 1
+    u, v = u[:n], v[:n]
+
+    np.add.at(Q, v, Q[u])
+    remap = np.arange(nv)
+    remap[u] = v
+    return remap
+
+
+# -------- LOD --------
+# returns P, T, N, groups with about ratio * the triangles (fewer can't be
+# reached once only locked vertices are left)
+def simplify_geometry(P, T, N, groups, ratio):
+    names = list(groups.keys())
+    parts = [np.asarray(groups[m], dtype=np.int64).reshape(-1, 3) for m in names]
+    gid = np.repeat(np.arange(len(names)), [len(t) for t in parts])
+    tris = np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int64)
+
+    P64 = P.astype(np.float64)
+    locked = locked_vertices(P64, tris, gid)
+    Q = vertex_quadrics(P64, tris)
+    target = int(np.ceil(len(tris) * ratio))
+    while len(tris) > target:
+        remap = _collapse_pass(P64, Q, tris, locked, len(tris) - target)
+        if remap is None:
+            break
+        tris = remap[tris]
+        keep = (tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 2] != tris[:, 0])
+        tris, gid = tris[keep], gid[keep]
+
+    used, local = np.unique(tris, return_inverse=True)
+    local = local.reshape(-1, 3).astype(np.uint32)
+    out_groups = {}
+    for g, m in enumerate(names):
+        sel = gid == g
+        if sel.any():
+            out_groups[m] = local[sel].ravel()
+    return P[used], None if T is None else T[used], None if N is None else N[used], out_groups
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Persistent cache for encoded textures.
+# Entries are keyed by the sha256 of the source image bytes plus every encoder
+# setting that changes the output, so different maps sharing a texture and
+# repeated builds reuse the same entry. Eviction is LRU by file mtime.
+import argparse
+import hashlib
+import json
+import os
+
+import PIL
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# bump when resize_and_compress changes its output for the same settings
+ENCODER_VERSION = 2
+RESAMPLER = "lanczos"
+FORMAT_POLICY = "jpeg-if-opaque-palette-if-cutout-else-png"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(script_dir), "cache", "textures")
+DEFAULT_CACHE_SIZE_MB = 512
+
+
+class TextureCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_SIZE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.enabled = True
+
+    @staticmethod
+    def make_key(data: bytes, maxsize: int, quality: int) -> str:
+        source = hashlib.sha256(data).hexdigest()
+        settings = f"{source}|{maxsize}|{quality}|{FORMAT_POLICY}|{RESAMPLER}|{ENCODER_VERSION}|{PIL.__version__}"
+        return hashlib.sha256(settings.encode("ascii")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".bin")
+
+    # returns (bytes, mime, orig_size, new_size, alpha_mode) or None
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            header, data = raw.split(b"\n", 1)
+            meta = json.loads(header)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data, meta["mime"], tuple(meta["orig_size"]), tuple(meta["new_size"]), meta["alpha_mode"]
+
+    def put(self, key: str, data: bytes, mime: str, orig_size, new_size, alpha_mode):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        header = json.dumps({"mime": mime, "orig_size": list(orig_size), "new_size": list(new_size),
+                             "alpha_mode": alpha_mode})
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(header.encode("ascii") + b"\n")
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"- Texture cache disabled ({e})")
+            self.enabled = False
+
+    # removes least recently used entries until the cache fits max_bytes
+    def trim(self):
+        entries = []
+        total = 0
+        if not os.path.isdir(self.cache_dir):
+            return total
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
+        return total
+
+    def report(self):
+        total = self.trim()
+        print(f"- Texture cache: {self.hits} hits, {self.misses} misses, "
+              f"{self.evicted} evicted ({total / (1024 * 1024):.1f} MB in {self.cache_dir})")
+
+
+# in-process entries in front of an optional TextureCache, for builds that
+# compress the same source images into several GLBs (chunked exports)
+class MemoryCache:
+    make_key = staticmethod(TextureCache.make_key)
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        hit = self.entries.get(key)
+        if hit is None and self.backing is not None:
+            hit = self.backing.get(key)
+            if hit is not None:
+                self.entries[key] = hit
+        if hit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return hit
+
+    def put(self, key: str, data: bytes, mime: str, orig_size, new_size, alpha_mode):
+        self.entries[key] = (data, mime, tuple(orig_size), tuple(new_size), alpha_mode)
+        if self.backing is not None:
+            self.backing.put(key, data, mime, orig_size, new_size, alpha_mode)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="Directory of the texture cache (default: <install>/cache/textures)")
+    parser.add_argument("--cache-size-mb", type=float, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f"Size limit of the texture cache in MB (default: {DEFAULT_CACHE_SIZE_MB})")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-encode textures")
+
+
+def cache_from_args(args):
+    if args.no_cache:
+        return None
+    return TextureCache(args.cache_dir, args.cache_size_mb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shows or trims the texture compression cache.")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-size-mb", type=float, default=DEFAULT_CACHE_SIZE_MB)
+    parser.add_argument("--clear", action="store_true", help="Remove all entries")
+    args = parser.parse_args()
+
+    cache = TextureCache(args.cache_dir, 0 if args.clear else args.cache_size_mb)
+    cache.report()
+
+
+if __name__ == "__main__":
+    main()
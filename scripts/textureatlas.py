@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Texture atlas stage (bsp2glb --atlas).
+# Every material is a primitive of its own, so every small trim or sign texture
+# costs a draw call. Materials whose uvs stay inside [0, 1] (no tiling) and
+# that get the same alpha/emission/PBR values from dcl.game/materials_*.py are
+# packed into shared atlas pages and merged into one material per page. The
+# tiles are edge padded, so filtering and mipmaps don't bleed between them.
+# Tiling textures and materials with an own emission map are left alone.
+import io
+import os
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+import materialrules
+import obj2glb
+
+PAGE_SIZE = 2048
+PADDING = 4
+UV_EPSILON = 1e-3
+
+
+def _pow2(n):
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+
+# shelf packing of (w, h) sizes, tallest first, into pages of at most
+# page_size; returns (page, x, y) of every size inside its padding and the
+# (W, H) of every page, rounded up to powers of two
+def pack_pages(sizes, page_size=PAGE_SIZE, padding=PADDING):
+    places = [None] * len(sizes)
+    pages = []  # [x, y, shelf height, used width]
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i)):
+        w, h = sizes[i][0] + 2 * padding, sizes[i][1] + 2 * padding
+        for k, pg in enumerate(pages):
+            if pg[0] + w > page_size:
+                if pg[1] + pg[2] + h > page_size:
+                    continue
+                pg[0], pg[1], pg[2] = 0, pg[1] + pg[2], 0
+            if pg[1] + h <= page_size:
+                break
+        else:
+            pages.append([0, 0, 0, 0])
+            k, pg = len(pages) - 1, pages[-1]
+        places[i] = (k, pg[0] + padding, pg[1] + padding)
+        pg[0] += w
+        pg[2] = max(pg[2], h)
+        pg[3] = max(pg[3], pg[0])
+    return places, [(min(_pow2(pg[3]), page_size), min(_pow2(pg[1] + pg[2]), page_size)) for pg in pages]
+
+
+def _has_alpha(im):
+    return im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+
+
+# returns P, T, N, groups, mtl_props and {atlas path: PNG bytes}; the merged
+# materials are named atlas_<n>, every material keeps the class it had before
+def atlas_materials(P, T, N, groups, mtl_props, obj_dir, page_size=PAGE_SIZE, padding=PADDING):
+    rules = materialrules.MaterialRules(obj2glb.materials_alpha, obj2glb.materials_emission,
+                                        obj2glb.materials_surface)
+    kd_users = Counter(q.get("map_Kd") for q in mtl_props.values())
+    classes = {m: obj2glb.material_class(m, p, rules, kd_users) for m, p in mtl_props.items()}
+    draw_calls = sum(1 for idxs in groups.values() if len(idxs))
+    if T is None:
+        return P, T, N, groups, mtl_props, {}
+
+    # --- candidates: non-tiling, image small enough for a page ---
+    by_class = {}
+    sizes = {}
+    for m, idxs in groups.items():
+        p = mtl_props.get(m)
+        if not len(idxs) or p is None or not p.get("map_Kd") or p.get("map_Ke"):
+            continue
+        uv = T[np.asarray(idxs, dtype=np.int64), :2]
+        if uv.min() < -UV_EPSILON or uv.max() > 1.0 + UV_EPSILON:
+            continue
+        path = os.path.join(obj_dir, p["map_Kd"])
+        if path not in sizes:
+            try:
+                with Image.open(path) as im:
+                    sizes[path] = im.size
+            except OSError:
+                sizes[path] = None
+        if sizes[path] is None or max(sizes[path]) > page_size // 2:
+            continue
+        cls = classes[m]
+        by_class.setdefault(tuple(sorted(cls.items())), []).append((m, path))
+
+    # --- pages per class ---
+    images = {}
+    page_of = {}  # material -> (atlas name, offset, scale)
+    for members in by_class.values():
+        if len(members) < 2:
+            continue
+        paths = list(dict.fromkeys(path for _, path in members))
+        places, page_sizes = pack_pages([sizes[path] for path in paths], page_size, padding)
+        tiles = {}
+        for path in paths:
+            with Image.open(path) as im:
+                tiles[path] = np.asarray(im.convert("RGBA" if _has_alpha(im) else "RGB"))
+        names = []
+        for W, H in page_sizes:
+            name = f"atlas_{len(images)}"
+            while name in mtl_props:
+                name += "_"
+            names.append(name)
+            channels = 4 if any(t.shape[2] == 4 for t in tiles.values()) else 3
+            images[name] = np.zeros((H, W, channels), dtype=np.uint8)
+            if channels == 4:
+                images[name][..., 3] = 255
+        rect = {}
+        for path, (k, x, y) in zip(paths, places):
+            page, tile = images[names[k]], tiles[path]
+            if tile.shape[2] < page.shape[2]:
+                tile = np.concatenate([tile, np.full(tile.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+            h, w = tile.shape[:2]
+            page[y - padding:y + h + padding, x - padding:x + w + padding] = \
+                np.pad(tile, ((padding, padding), (padding, padding), (0, 0)), mode="edge")
+            H, W = page.shape[:2]
+            rect[path] = (names[k], (x / W, y / H), (w / W, h / H))
+        for m, path in members:
+            page_of[m] = rect[path]
+    if not page_of:
+        print("- Texture atlas: no materials to merge")
+        return P, T, N, groups, mtl_props, {}
+
+    # --- vertices: atlased materials get own copies with rewritten uvs ---
+    atlased = [m for m in groups if m in page_of]
+    used = [np.unique(np.asarray(groups[m], dtype=np.int64)) for m in atlased]
+    src = np.concatenate(used)
+    owner = np.repeat(np.arange(len(atlased)), [len(u) for u in used])
+    offset = np.array([page_of[m][1] for m in atlased])[owner]
+    scale = np.array([page_of[m][2] for m in atlased])[owner]
+    new_T = T[src].copy()
+    new_T[:, :2] = (offset + T[src, :2] * scale).astype(T.dtype)
+    base = len(P) + np.cumsum([0] + [len(u) for u in used[:-1]])
+
+    merged = {}
+    for m, idxs in groups.items():
+        if m not in page_of:
+            merged[m] = [idxs]
+            continue
+        k = atlased.index(m)
+        local = np.searchsorted(used[k], np.asarray(idxs, dtype=np.int64)) + base[k]
+        merged.setdefault(page_of[m][0], []).append(local)
+    P = np.concatenate([P, P[src]])
+    T = np.concatenate([T, new_T])
+    N = None if N is None else np.concatenate([N, N[src]])
+
+    # drop the vertices nothing points at any more
+    merged = {m: np.concatenate([np.asarray(i, dtype=np.int64) for i in parts]) for m, parts in merged.items()}
+    keep, local = np.unique(np.concatenate(list(merged.values())), return_inverse=True)
+    bounds = np.cumsum([0] + [len(i) for i in merged.values()])
+    groups = {m: local[b0:b1].astype(np.uint32) for m, b0, b1 in zip(merged, bounds[:-1], bounds[1:])}
+    P, T = P[keep], T[keep]
+    N = None if N is None else N[keep]
+
+    # --- materials: one per page, every material keeps its class ---
+    props = {}
+    for m, p in mtl_props.items():
+        if m not in page_of:
+            props[m] = dict(p, **{"class": classes[m]})
+    png = {}
+    for name, page in images.items():
+        first = next(m for m in atlased if page_of[m][0] == name)
+        props[name] = {"map_Kd": name + ".png", "Kd": None, "map_Ke": "", "Ke": None, "class": classes[first]}
+        out = io.BytesIO()
+        Image.fromarray(page).save(out, format="PNG", compress_level=1)
+        png[name + ".png"] = out.getvalue()
+
+    pages = ", ".join(f"{page.shape[1]}x{page.shape[0]}" for page in images.values())
+    print(f"- Texture atlas: {len(page_of)} materials into {len(images)} pages ({pages})")
+    print(f"- Draw calls: {draw_calls} -> {sum(1 for i in groups.values() if len(i))}, "
+          f"materials: {len(mtl_props)} -> {len(props)}")
+    return P, T, N, groups, props, png
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Post-transform vertex cache optimization for the exported index buffers.
+# Triangles are reordered with Tipsify (Sander, Nehab, Barczak 2007), a linear
+# time fan walk over the vertex->triangle adjacency, the resulting clusters are
+# sorted front-to-back for less overdraw, and finally vertices are renumbered in
+# order of first use so vertex fetch follows the index stream.
+import numpy as np
+
+DEFAULT_CACHE_SIZE = 16
+
+
+# -------- statistics --------
+# FIFO cache simulation, returns (misses, unique vertices)
+def cache_misses(indices, cache_size=DEFAULT_CACHE_SIZE):
+    idx = np.asarray(indices, dtype=np.int64).ravel()
+    if not len(idx):
+        return 0, 0
+    stamp = [-(cache_size + 1)] * (int(idx.max()) + 1)
+    counter = 0
+    for v in idx.tolist():
+        if counter - stamp[v] > cache_size:
+            stamp[v] = counter
+            counter += 1
+    return counter, int(len(np.unique(idx)))
+
+
+def cache_stats(groups, cache_size=DEFAULT_CACHE_SIZE):
+    # ACMR = misses per triangle, ATVR = misses per referenced vertex
+    misses = tris = verts = 0
+    for idxs in groups.values():
+        m, u = cache_misses(idxs, cache_size)
+        misses += m
+        verts += u
+        tris += len(idxs) // 3
+    return misses / max(tris, 1), misses / max(verts, 1)
+
+
+# -------- triangle order (Tipsify) --------
+# returns (triangle order, cluster start positions in that order)
+def tipsify(indices, nverts, cache_size=DEFAULT_CACHE_SIZE):
+    tris = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    nt = len(tris)
+    if nt == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # vertex -> triangles adjacency (CSR)
+    corner_v = tris.ravel()
+    counts = np.bincount(corner_v, minlength=nverts)
+    offsets = np.zeros(nverts + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    adj = (np.argsort(corner_v, kind="stable") // 3).tolist()
+    offsets = offsets.tolist()
+    live = counts.tolist()
+    tri_list = tris.tolist()
+
+    cache_time = [-(cache_size + 1)] * nverts
+    emitted = bytearray(nt)
+    dead_end = []
+    out = []
+    clusters = [0]
+    time = cache_size + 1
+    cursor = 0
+    f = tri_list[0][0]
+
+    while f >= 0:
+        candidates = []
+        for t in adj[offsets[f]:offsets[f + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = 1
+            out.append(t)
+            for v in tri_list[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - cache_time[v] > cache_size:
+                    cache_time[v] = time
+                    time += 1
+
+        # next fanning vertex: the one that stays in cache longest while its fan is emitted
+        best, best_p = -1, -1
+        for v in candidates:
+            if live[v] > 0:
+                p = 0
+                if time - cache_time[v] + 2 * live[v] <= cache_size:
+                    p = time - cache_time[v]
+                if p > best_p:
+                    best, best_p = v, p
+        if best < 0:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    best = v
+                    break
+        if best < 0:
+            # dead end, continue with the next unfinished vertex in input order
+            while cursor < nverts and live[cursor] == 0:
+                cursor += 1
+            best = cursor if cursor < nverts else -1
+            if best >= 0 and len(out) < nt:
+                clusters.append(len(out))
+        f = best
+
+    return np.asarray(out, dtype=np.int64), np.asarray(clusters, dtype=np.int64)
+
+
+# -------- overdraw --------
+# sorts clusters so that those facing outwards from the mesh center come first
+def sort_clusters(tris, P, clusters):
+    if len(clusters) <= 1:
+        return tris
+    a, b, c = P[tris[:, 0]], P[tris[:, 1]], P[tris[:, 2]]
+    cross = np.cross(b - a, c - a)
+    centroid = (a + b + c) / 3.0
+    area = np.linalg.norm(cross, axis=1)
+    center = (centroid * area[:, None]).sum(axis=0) / max(area.sum(), 1e-20)
+
+    c_pos = np.add.reduceat(centroid * area[:, None], clusters, axis=0)
+    c_nrm = np.add.reduceat(cross, clusters, axis=0)
+    c_area = np.add.reduceat(area, clusters)
+    c_pos /= np.maximum(c_area, 1e-20)[:, None]
+    score = np.einsum("ij,ij->i", c_pos - center, c_nrm)
+
+    rank = np.empty(len(clusters), dtype=np.int64)
+    rank[np.argsort(-score, kind="stable")] = np.arange(len(clusters))
+    cluster_of = np.repeat(np.arange(len(clusters)), np.diff(np.r_[clusters, len(tris)]))
+    return tris[np.argsort(rank[cluster_of], kind="stable")]
+
+
+# -------- full pass --------
+# groups: {material: flat uint32 indices}; attributes: per-vertex arrays
+# (None entries are passed through). Returns (reordered attributes, groups).
+def optimize(groups, attributes, cache_size=DEFAULT_CACHE_SIZE, overdraw=True, positions=None):
+    nverts = next(len(a) for a in attributes if a is not None)
+    new_groups = {}
+    for m, idxs in groups.items():
+        tris = np.asarray(idxs, dtype=np.int64).reshape(-1, 3)
+        # group-local vertex numbers (same order), so tipsify's per-vertex
+        # tables and dead-end scan stay the size of the group, not the mesh
+        used, local = np.unique(tris, return_inverse=True)
+        order, clusters = tipsify(local.reshape(-1, 3), len(used), cache_size)
+        tris = tris[order]
+        if overdraw and positions is not None:
+            tris = sort_clusters(tris, positions, clusters)
+        new_groups[m] = tris.ravel()
+
+    # vertex fetch order: first use over all groups, unused vertices at the end
+    stream = np.concatenate(list(new_groups.values())) if new_groups else np.zeros(0, dtype=np.int64)
+    _, first = np.unique(stream, return_index=True)
+    used = stream[np.sort(first)]
+    unused = np.setdiff1d(np.arange(nverts), used, assume_unique=True)
+    perm = np.concatenate([used, unused])
+    remap = np.empty(nverts, dtype=np.int64)
+    remap[perm] = np.arange(nverts)
+
+    new_groups = {m: remap[t].astype(np.uint32) for m, t in new_groups.items()}
+    new_attributes = [None if a is None else a[perm] for a in attributes]
+    return new_attributes, new_groups
+
+
+def optimize_geometry(P, T, N, groups, cache_size=DEFAULT_CACHE_SIZE, overdraw=True):
+    acmr0, atvr0 = cache_stats(groups, cache_size)
+    (P, T, N), groups = optimize(groups, [P, T, N], cache_size, overdraw, positions=P)
+    acmr1, atvr1 = cache_stats(groups, cache_size)
+    print(f"- Vertex cache ({cache_size}): ACMR {acmr0:.3f} -> {acmr1:.3f}, ATVR {atvr0:.3f} -> {atvr1:.3f}")
+    return P, T, N, groups
@@ -0,0 +1,213 @@
+# Round trip tests for the EXT_meshopt_compression codecs in scripts/meshoptcodec.py.
+# Attribute views must decode to the same bytes; the index codec keeps the
+# winding but may rotate a triangle, so triangles are compared up to rotation.
+import os
+import sys
+
+import numpy as np
+import pytest
+from pygltflib import GLTF2, Accessor, Attributes, Buffer, BufferView, Mesh, Node, Primitive, Scene
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import meshoptcodec  # noqa: E402
+
+STRIDES = (4, 8, 12, 16, 20, 24, 32, 36, 48, 64)
+COUNTS = (1, 15, 16, 17, 255, 256, 257, 4000)
+
+
+def rotations_match(decoded, original):
+    a = np.asarray(decoded, dtype=np.int64).reshape(-1, 3)
+    b = np.asarray(original, dtype=np.int64).reshape(-1, 3)
+    assert a.shape == b.shape
+    same = (a == b).all(axis=1) | (a == b[:, [1, 2, 0]]).all(axis=1) | (a == b[:, [2, 0, 1]]).all(axis=1)
+    return bool(same.all())
+
+
+def index_round_trip(indices, dtype):
+    indices = np.asarray(indices, dtype=dtype)
+    enc = meshoptcodec.encode_index_buffer(indices)
+    dec = meshoptcodec.decode_index_buffer(enc, len(indices))
+    assert rotations_match(dec, indices)
+    # the rule above is the one the exporter's --meshopt-verify uses
+    stride = np.dtype(dtype).itemsize
+    decoded = np.asarray(dec, dtype=dtype).tobytes()
+    assert meshoptcodec.same_view(decoded, indices.tobytes(), "TRIANGLES", stride)
+    return enc
+
+
+def triangle_codes(enc, index_count):
+    return list(enc[1:1 + index_count // 3])
+
+
+def grid(n):
+    v = np.arange(n * n).reshape(n, n)
+    a, b, c, d = v[:-1, :-1].ravel(), v[:-1, 1:].ravel(), v[1:, :-1].ravel(), v[1:, 1:].ravel()
+    return np.stack([np.stack([a, c, b], 1), np.stack([b, c, d], 1)], 1).ravel()
+
+
+# -------- vertex codec --------
+@pytest.mark.parametrize("stride", STRIDES)
+@pytest.mark.parametrize("count", COUNTS)
+def test_vertex_round_trip(stride, count):
+    rng = np.random.default_rng(stride * 10007 + count)
+    # smooth columns (small deltas, short bit modes) next to noisy ones (8 bit mode)
+    smooth = np.cumsum(rng.integers(-3, 4, (count, stride)), axis=0).astype(np.uint8)
+    noise = rng.integers(0, 256, (count, stride), dtype=np.uint8)
+    data = np.where(np.arange(stride) % 3 == 0, noise, smooth).astype(np.uint8).tobytes()
+    enc = meshoptcodec.encode_vertex_buffer(data, count, stride)
+    assert meshoptcodec.decode_vertex_buffer(enc, count, stride) == data
+
+
+@pytest.mark.parametrize("stride", (4, 12, 64))
+def test_vertex_constant(stride):
+    data = bytes(range(stride)) * 300
+    enc = meshoptcodec.encode_vertex_buffer(data, 300, stride)
+    assert meshoptcodec.decode_vertex_buffer(enc, 300, stride) == data
+
+
+def test_vertex_float_positions():
+    P = np.random.default_rng(1).normal(size=(3000, 3)).astype(np.float32) * 100
+    data = P.tobytes()
+    enc = meshoptcodec.encode_vertex_buffer(data, len(P), 12)
+    assert meshoptcodec.decode_vertex_buffer(enc, len(P), 12) == data
+
+
+# -------- index codec --------
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_grid(dtype):
+    indices = grid(40)
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    # neighbouring triangles share edges: most triangles are edge fifo hits
+    assert sum(c < 0xF0 for c in codes) > len(codes) // 2
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_vertex_fifo(dtype):
+    # a fan whose triangles share only the centre vertex: no edge is reused,
+    # the centre comes from the vertex fifo
+    indices = []
+    for k in range(10):
+        indices += [0, 2 * k + 1, 2 * k + 2]
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    assert all(c >= 0xF0 for c in codes)
+    assert any(c != 0xF0 | 14 | 0 and c != 0xF0 | 14 | 15 for c in codes[1:])
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_edge_fifo_vertex_hit(dtype):
+    # triangles on a known edge whose third vertex is still in the vertex fifo
+    indices = [0, 1, 2, 2, 3, 4, 1, 0, 3]
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    assert codes[2] < 0xF0 and 1 <= (codes[2] & 15) < 13
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_last_minus_one(dtype):
+    indices = [0, 1, 2, 1, 0, 100, 100, 0, 99]
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    assert codes[1] & 15 == 15 and codes[2] < 0xF0 and codes[2] & 15 == 13
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_last_plus_one(dtype):
+    indices = [0, 1, 2, 1, 0, 100, 100, 0, 101]
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    assert codes[2] < 0xF0 and codes[2] & 15 == 14
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_reset_triangle(dtype):
+    # 0 1 2 after other vertices restarts the "next" counter
+    indices = [0, 1, 2, 3, 4, 5, 0, 1, 2, 3, 4, 5]
+    enc = index_round_trip(indices, dtype)
+    codes = triangle_codes(enc, len(indices))
+    assert codes[2] == 0xFE
+
+
+def test_index_large_u16():
+    rng = np.random.default_rng(2)
+    indices = rng.integers(0, 65536, 3 * 500)
+    indices[:6] = [65535, 0, 65534, 1, 65535, 40000]
+    index_round_trip(indices, np.uint16)
+
+
+def test_index_large_u32():
+    # deltas of every varint length up to 5 bytes, both signs
+    rng = np.random.default_rng(3)
+    indices = rng.integers(0, 2 ** 32, 3 * 500, dtype=np.uint64)
+    indices[:9] = [0, 2 ** 32 - 1, 1, 2 ** 31, 5, 2 ** 21 + 7, 2 ** 14, 2 ** 28 + 3, 127]
+    index_round_trip(indices, np.uint32)
+
+
+@pytest.mark.parametrize("dtype", (np.uint16, np.uint32))
+def test_index_shuffled_grid(dtype):
+    # reordered triangles and vertices mix all code paths
+    rng = np.random.default_rng(4)
+    tris = grid(30).reshape(-1, 3)
+    tris = tris[rng.permutation(len(tris))]
+    remap = rng.permutation(tris.max() + 1)
+    index_round_trip(remap[tris].ravel(), dtype)
+
+
+def test_index_empty():
+    enc = meshoptcodec.encode_index_buffer(np.zeros(0, dtype=np.uint32))
+    assert meshoptcodec.decode_index_buffer(enc, 0) == []
+
+
+# -------- glTF views --------
+def small_gltf():
+    n = 20
+    P = np.random.default_rng(5).normal(size=(n * n, 3)).astype(np.float32)
+    UV = np.random.default_rng(6).random((n * n, 2)).astype(np.float32)
+    tris = grid(n)
+    half = len(tris) // 2 // 3 * 3
+    parts = [(P.tobytes(), 34962, 3 * 4), (UV.tobytes(), 34962, 2 * 4),
+             (tris[:half].astype(np.uint16).tobytes(), 34963, None),
+             (tris[half:].astype(np.uint32).tobytes(), 34963, None)]
+    blob = b""
+    views = []
+    for data, target, stride in parts:
+        views.append(BufferView(buffer=0, byteOffset=len(blob), byteLength=len(data), target=target,
+                                byteStride=stride))
+        blob += data + b"\x00" * (-len(data) % 4)
+    accessors = [
+        Accessor(bufferView=0, componentType=5126, count=len(P), type="VEC3",
+                 min=P.min(axis=0).tolist(), max=P.max(axis=0).tolist()),
+        Accessor(bufferView=1, componentType=5126, count=len(UV), type="VEC2"),
+        Accessor(bufferView=2, componentType=5123, count=half, type="SCALAR"),
+        Accessor(bufferView=3, componentType=5125, count=len(tris) - half, type="SCALAR"),
+    ]
+    prims = [Primitive(attributes=Attributes(POSITION=0, TEXCOORD_0=1), indices=2),
+             Primitive(attributes=Attributes(POSITION=0, TEXCOORD_0=1), indices=3)]
+    gltf = GLTF2(scene=0, scenes=[Scene(nodes=[0])], nodes=[Node(mesh=0)], meshes=[Mesh(primitives=prims)],
+                 accessors=accessors, bufferViews=views, buffers=[Buffer(byteLength=len(blob))])
+    gltf.set_binary_blob(blob)
+    return gltf, [data for data, _, _ in parts]
+
+
+def check_views(gltf, originals):
+    decoded = meshoptcodec.decode_gltf_views(gltf)
+    assert decoded[0] == originals[0]
+    assert decoded[1] == originals[1]
+    assert rotations_match(np.frombuffer(decoded[2], dtype=np.uint16), np.frombuffer(originals[2], dtype=np.uint16))
+    assert rotations_match(np.frombuffer(decoded[3], dtype=np.uint32), np.frombuffer(originals[3], dtype=np.uint32))
+
+
+def test_gltf_views_round_trip(tmp_path):
+    gltf, originals = small_gltf()
+    meshoptcodec.compress_gltf_views(gltf, verify=True)
+    assert meshoptcodec.EXTENSION in gltf.extensionsRequired
+    assert all(meshoptcodec.EXTENSION in (bv.extensions or {}) for bv in gltf.bufferViews)
+    check_views(gltf, originals)
+
+    # written as GLB with the fallback buffer and loaded again
+    path = str(tmp_path / "meshopt.glb")
+    meshoptcodec.save_glb(gltf, path)
+    loaded = GLTF2().load(path)
+    assert len(loaded.buffers) == 2
+    check_views(loaded, originals)